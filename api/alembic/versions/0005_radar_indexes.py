@@ -0,0 +1,31 @@
+"""stage3: indexes for set-based priority radar
+
+Revision ID: 0005_radar_indexes
+Revises: 0004_payments_invoices
+Create Date: 2026-10-18 10:00:00.000000
+"""
+
+from alembic import op
+
+# ревизия
+revision = "0005_radar_indexes"
+down_revision = "0004_payments_invoices"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # радар группирует просрочки по ученику и считает сабмиты за окно по completed_at
+    op.create_index(
+        "idx_assignment_student_status", "assignment", ["student_id", "status"]
+    )
+    op.create_index(
+        "idx_submission_assignment_completed",
+        "submission",
+        ["assignment_id", "completed_at"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("idx_submission_assignment_completed", table_name="submission")
+    op.drop_index("idx_assignment_student_status", table_name="assignment")
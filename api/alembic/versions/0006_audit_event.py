@@ -0,0 +1,41 @@
+"""stage3: audit_event table for the batched audit sink
+
+Revision ID: 0006_audit_event
+Revises: 0005_radar_indexes
+Create Date: 2026-10-18 11:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# ревизия
+revision = "0006_audit_event"
+down_revision = "0005_radar_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "audit_event",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column(
+            "created_at", sa.DateTime, server_default=sa.func.now(), nullable=False
+        ),
+        sa.Column("action", sa.String, nullable=False),
+        sa.Column("request_id", sa.String, nullable=True),
+        sa.Column("student_id", sa.Integer, nullable=True),
+        sa.Column("payload", sa.JSON, nullable=False),
+    )
+    op.create_index("idx_audit_created", "audit_event", ["created_at"])
+    op.create_index("idx_audit_action_created", "audit_event", ["action", "created_at"])
+    op.create_index(
+        "idx_audit_student_created", "audit_event", ["student_id", "created_at"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("idx_audit_student_created", table_name="audit_event")
+    op.drop_index("idx_audit_action_created", table_name="audit_event")
+    op.drop_index("idx_audit_created", table_name="audit_event")
+    op.drop_table("audit_event")
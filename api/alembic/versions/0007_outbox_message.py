@@ -0,0 +1,44 @@
+"""stage3: transactional outbox for background jobs
+
+Revision ID: 0007_outbox_message
+Revises: 0006_audit_event
+Create Date: 2026-10-18 12:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# ревизия
+revision = "0007_outbox_message"
+down_revision = "0006_audit_event"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "outbox_message",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column(
+            "created_at", sa.DateTime, server_default=sa.func.now(), nullable=False
+        ),
+        sa.Column("kind", sa.String, nullable=False),
+        sa.Column("dedupe_key", sa.String, nullable=False, unique=True),
+        sa.Column("payload", sa.JSON, nullable=False),
+        sa.Column("run_at", sa.DateTime, nullable=True),
+        sa.Column("status", sa.String, nullable=False, server_default="pending"),
+        sa.Column("attempts", sa.Integer, nullable=False, server_default="0"),
+        sa.Column(
+            "next_attempt_at", sa.DateTime, server_default=sa.func.now(), nullable=False
+        ),
+        sa.Column("sent_at", sa.DateTime, nullable=True),
+        sa.Column("last_error", sa.Text, nullable=True),
+    )
+    op.create_index(
+        "idx_outbox_status_next", "outbox_message", ["status", "next_attempt_at"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("idx_outbox_status_next", table_name="outbox_message")
+    op.drop_table("outbox_message")
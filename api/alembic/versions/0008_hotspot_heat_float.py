@@ -0,0 +1,34 @@
+"""stage3: fractional error heat (time decay)
+
+Revision ID: 0008_hotspot_heat_float
+Revises: 0007_outbox_message
+Create Date: 2026-10-18 15:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# ревизия
+revision = "0008_hotspot_heat_float"
+down_revision = "0007_outbox_message"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # затухший heat дробный — в Integer он округлялся бы к нулю на каждой записи
+    with op.batch_alter_table("error_hotspot") as batch:
+        batch.alter_column(
+            "heat", existing_type=sa.Integer, type_=sa.Float, existing_nullable=False
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("error_hotspot") as batch:
+        batch.alter_column(
+            "heat",
+            existing_type=sa.Float,
+            type_=sa.Integer,
+            existing_nullable=False,
+            postgresql_using="round(heat)::integer",
+        )
@@ -0,0 +1,38 @@
+"""stage3: per-student daily analytics rollups
+
+Revision ID: 0009_student_daily_stats
+Revises: 0008_hotspot_heat_float
+Create Date: 2026-10-18 16:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# ревизия
+revision = "0009_student_daily_stats"
+down_revision = "0008_hotspot_heat_float"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # PK (student_id, day) — и цель ON CONFLICT, и индекс для выборок «ученик за окно»
+    op.create_table(
+        "student_daily_stats",
+        sa.Column(
+            "student_id",
+            sa.Integer,
+            sa.ForeignKey("student_profile.id"),
+            primary_key=True,
+        ),
+        sa.Column("day", sa.Date, primary_key=True),
+        sa.Column("submissions", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("graded", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("grade_sum", sa.Float, nullable=False, server_default="0"),
+        sa.Column("late", sa.Integer, nullable=False, server_default="0"),
+    )
+    # заполнить из истории: python scripts/backfill_rollups.py
+
+
+def downgrade() -> None:
+    op.drop_table("student_daily_stats")
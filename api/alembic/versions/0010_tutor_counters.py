@@ -0,0 +1,38 @@
+"""stage3: denormalized per-tutor dashboard counters
+
+Revision ID: 0010_tutor_counters
+Revises: 0009_student_daily_stats
+Create Date: 2026-10-18 17:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# ревизия
+revision = "0010_tutor_counters"
+down_revision = "0009_student_daily_stats"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "tutor_counters",
+        sa.Column("tutor_id", sa.Integer, sa.ForeignKey("user.id"), primary_key=True),
+        sa.Column("students_count", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("lessons_count", sa.Integer, nullable=False, server_default="0"),
+    )
+    # начальные значения из существующих данных; дальше счётчики ведут триггеры БД
+    # (миграция 0012, в SQLite — rollups.install_sqlite)
+    op.execute("""
+        INSERT INTO tutor_counters (tutor_id, students_count, lessons_count)
+        SELECT s.tutor_id, COUNT(DISTINCT s.id), COUNT(l.id)
+        FROM student_profile s
+        LEFT JOIN lesson l ON l.student_id = s.id
+        WHERE s.tutor_id IS NOT NULL
+        GROUP BY s.tutor_id
+        """)
+
+
+def downgrade() -> None:
+    op.drop_table("tutor_counters")
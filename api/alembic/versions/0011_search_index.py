@@ -0,0 +1,114 @@
+"""stage3: full-text / trigram search index
+
+Revision ID: 0011_search_index
+Revises: 0010_tutor_counters
+Create Date: 2026-10-18 18:00:00.000000
+"""
+
+from alembic import op
+
+# ревизия
+revision = "0011_search_index"
+down_revision = "0010_tutor_counters"
+branch_labels = None
+depends_on = None
+
+# (kind, таблица, ref_id, student_id, текст, колонки для UPDATE OF);
+# коды kind — как в search.KINDS
+SOURCES = (
+    (0, "student_profile", "{r}.id", "{r}.id", "{r}.name", "name"),
+    (1, "assignment", "{r}.id", "{r}.student_id", "{r}.title", "title, student_id"),
+    (
+        2,
+        "submission",
+        "{r}.id",
+        "(SELECT a.student_id FROM assignment a WHERE a.id = {r}.assignment_id)",
+        "{r}.feedback",
+        "feedback",
+    ),
+    (
+        3,
+        "student_bio",
+        "{r}.student_id",
+        "{r}.student_id",
+        "concat_ws(' ', {r}.goals, {r}.strengths, {r}.weaknesses, {r}.notes)",
+        "goals, strengths, weaknesses, notes",
+    ),
+)
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        # SQLite: FTS5-индекс создаёт search.install_sqlite() при старте приложения
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("""
+        CREATE TABLE search_document (
+            kind smallint NOT NULL,
+            ref_id integer NOT NULL,
+            student_id integer,
+            body text NOT NULL,
+            tsv tsvector GENERATED ALWAYS AS (to_tsvector('simple', body)) STORED,
+            PRIMARY KEY (kind, ref_id)
+        )
+        """)
+    op.execute(
+        "CREATE INDEX idx_search_document_tsv ON search_document USING gin (tsv)"
+    )
+    op.execute(
+        "CREATE INDEX idx_search_document_trgm ON search_document "
+        "USING gin (body gin_trgm_ops)"
+    )
+    # ILIKE '%q%' в GET /students тоже идёт по триграммному индексу
+    op.execute(
+        "CREATE INDEX idx_student_name_trgm ON student_profile "
+        "USING gin (name gin_trgm_ops)"
+    )
+
+    for kind, table, ref, student, body, cols in SOURCES:
+        new = {
+            k: v.format(r="NEW")
+            for k, v in (("ref", ref), ("student", student), ("body", body))
+        }
+        op.execute(f"""
+            CREATE FUNCTION search_sync_{table}() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    DELETE FROM search_document
+                    WHERE kind = {kind} AND ref_id = {ref.format(r="OLD")};
+                END IF;
+                IF TG_OP = 'DELETE' THEN
+                    RETURN OLD;
+                END IF;
+                IF coalesce({new["body"]}, '') <> '' THEN
+                    INSERT INTO search_document (kind, ref_id, student_id, body)
+                    VALUES ({kind}, {new["ref"]}, {new["student"]}, {new["body"]});
+                END IF;
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+            """)
+        op.execute(
+            f"CREATE TRIGGER trg_search_{table} "
+            f"AFTER INSERT OR UPDATE OF {cols} OR DELETE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION search_sync_{table}()"
+        )
+        # начальное наполнение
+        op.execute(f"""
+            INSERT INTO search_document (kind, ref_id, student_id, body)
+            SELECT {kind}, {ref.format(r=table)},
+                {student.format(r=table)}, {body.format(r=table)}
+            FROM {table}
+            WHERE coalesce({body.format(r=table)}, '') <> ''
+            """)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    for _, table, *_ in SOURCES:
+        op.execute(f"DROP TRIGGER IF EXISTS trg_search_{table} ON {table}")
+        op.execute(f"DROP FUNCTION IF EXISTS search_sync_{table}()")
+    op.execute("DROP INDEX IF EXISTS idx_student_name_trgm")
+    op.execute("DROP TABLE IF EXISTS search_document")
@@ -0,0 +1,108 @@
+"""stage3: keep tutor_counters in sync with triggers
+
+Revision ID: 0012_tutor_counters_triggers
+Revises: 0011_search_index
+Create Date: 2026-10-19 10:00:00.000000
+"""
+
+from alembic import op
+
+# ревизия
+revision = "0012_tutor_counters_triggers"
+down_revision = "0011_search_index"
+branch_labels = None
+depends_on = None
+
+BUMP = """
+CREATE FUNCTION tutor_counters_bump(t integer, students integer, lessons integer)
+RETURNS void AS $$
+BEGIN
+    IF t IS NULL THEN
+        RETURN;
+    END IF;
+    INSERT INTO tutor_counters (tutor_id, students_count, lessons_count)
+    VALUES (t, students, lessons)
+    ON CONFLICT (tutor_id) DO UPDATE SET
+        students_count = tutor_counters.students_count + excluded.students_count,
+        lessons_count = tutor_counters.lessons_count + excluded.lessons_count;
+END
+$$ LANGUAGE plpgsql
+"""
+
+STUDENT_SYNC = """
+CREATE FUNCTION tutor_counters_sync_student() RETURNS trigger AS $$
+DECLARE
+    lessons integer;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM tutor_counters_bump(NEW.tutor_id, 1, 0);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM tutor_counters_bump(OLD.tutor_id, -1, 0);
+    ELSIF NEW.tutor_id IS DISTINCT FROM OLD.tutor_id THEN
+        -- ученик переходит к другому тьютору вместе со своими уроками
+        SELECT count(*) INTO lessons FROM lesson WHERE student_id = NEW.id;
+        PERFORM tutor_counters_bump(OLD.tutor_id, -1, -lessons);
+        PERFORM tutor_counters_bump(NEW.tutor_id, 1, lessons);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+LESSON_SYNC = """
+CREATE FUNCTION tutor_counters_sync_lesson() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM tutor_counters_bump(
+            (SELECT tutor_id FROM student_profile WHERE id = OLD.student_id), 0, -1
+        );
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM tutor_counters_bump(
+            (SELECT tutor_id FROM student_profile WHERE id = NEW.student_id), 0, 1
+        );
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        # SQLite: триггеры создаёт rollups.install_sqlite() при старте приложения
+        return
+
+    op.execute(BUMP)
+    op.execute(STUDENT_SYNC)
+    op.execute(LESSON_SYNC)
+    op.execute(
+        "CREATE TRIGGER trg_tutor_counters_student "
+        "AFTER INSERT OR UPDATE OF tutor_id OR DELETE "
+        "ON student_profile FOR EACH ROW EXECUTE FUNCTION tutor_counters_sync_student()"
+    )
+    op.execute(
+        "CREATE TRIGGER trg_tutor_counters_lesson "
+        "AFTER INSERT OR UPDATE OF student_id OR DELETE "
+        "ON lesson FOR EACH ROW EXECUTE FUNCTION tutor_counters_sync_lesson()"
+    )
+    # 0010 заполнил таблицу один раз; всё, что записали мимо эндпоинтов, — пересчитываем
+    op.execute("DELETE FROM tutor_counters")
+    op.execute("""
+        INSERT INTO tutor_counters (tutor_id, students_count, lessons_count)
+        SELECT s.tutor_id, COUNT(DISTINCT s.id), COUNT(l.id)
+        FROM student_profile s
+        LEFT JOIN lesson l ON l.student_id = s.id
+        WHERE s.tutor_id IS NOT NULL
+        GROUP BY s.tutor_id
+        """)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("DROP TRIGGER IF EXISTS trg_tutor_counters_lesson ON lesson")
+    op.execute("DROP TRIGGER IF EXISTS trg_tutor_counters_student ON student_profile")
+    op.execute("DROP FUNCTION IF EXISTS tutor_counters_sync_lesson()")
+    op.execute("DROP FUNCTION IF EXISTS tutor_counters_sync_student()")
+    op.execute("DROP FUNCTION IF EXISTS tutor_counters_bump(integer, integer, integer)")
@@ -1,19 +1,221 @@
+import atexit
+import json
 import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
 from functools import wraps
+from pathlib import Path
 from typing import Any, Callable, Optional
 
+from sqlalchemy import insert
+
+from deps import engine
 from logging_config import get_request_id
+from metrics import (
+    AUDIT_BUFFERED,
+    AUDIT_EVENTS,
+    AUDIT_FLUSH_ERRORS,
+    AUDIT_FLUSH_LATENCY,
+)
+from models import AuditEvent
 
 log = logging.getLogger("api.audit")
 
+# ===== Настройки буфера =====
+# Размер буфера (сверх — события отбрасываются), событий в одном INSERT,
+# секунд между сбросами
+AUDIT_BUFFER_SIZE = int(os.getenv("AUDIT_BUFFER_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))
+# Куда пишем: db (таблица audit_event), file (NDJSON с ротацией),
+# log (JSON-лог как раньше)
+AUDIT_SINKS = frozenset(
+    s.strip() for s in os.getenv("AUDIT_SINKS", "db,log").split(",") if s.strip()
+)
+AUDIT_NDJSON_DIR = os.getenv("AUDIT_NDJSON_DIR", "./storage/audit")
+AUDIT_NDJSON_MAX_BYTES = int(os.getenv("AUDIT_NDJSON_MAX_BYTES", str(50 * 1024 * 1024)))
+AUDIT_NDJSON_BACKUPS = int(os.getenv("AUDIT_NDJSON_BACKUPS", "5"))
+
+
+def _plain(value: Any) -> Any:
+    """Приводит значение поля к JSON-совместимому виду (payload — плоский dict)."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class _NdjsonFile:
+    """Append-only NDJSON с ротацией по размеру. Файл свой у каждого процесса."""
+
+    def __init__(self, directory: str, max_bytes: int, backups: int) -> None:
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        self.path = Path(directory) / f"audit-{os.getpid()}.ndjson"
+        self.max_bytes = max_bytes
+        self.backups = backups
+
+    def _rotate(self) -> None:
+        for i in range(self.backups - 1, 0, -1):
+            src = self.path.with_name(f"{self.path.name}.{i}")
+            if src.exists():
+                src.replace(self.path.with_name(f"{self.path.name}.{i + 1}"))
+        self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+
+    def write(self, rows: list[dict]) -> None:
+        if self.path.exists() and self.path.stat().st_size >= self.max_bytes:
+            self._rotate()
+        data = "".join(
+            json.dumps(
+                {**row, "created_at": row["created_at"].isoformat()}, ensure_ascii=False
+            )
+            + "\n"
+            for row in rows
+        )
+        with self.path.open("a", encoding="utf-8") as fh:
+            fh.write(data)
+
+
+class AuditSink:
+    """
+    Буферизованный аудит: audit_event() только кладёт событие в очередь в памяти,
+    а фоновый поток раз в flush_interval (или при накоплении batch_size) пишет пачку
+    во все включённые sink'и. Переполнение буфера не блокирует запрос — событие
+    отбрасывается и учитывается в audit_events_total{status="dropped"}.
+    """
+
+    def __init__(
+        self,
+        capacity: int = AUDIT_BUFFER_SIZE,
+        batch_size: int = AUDIT_BATCH_SIZE,
+        flush_interval: float = AUDIT_FLUSH_INTERVAL,
+        sinks: frozenset[str] = AUDIT_SINKS,
+    ) -> None:
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sinks = sinks
+        self._buf: deque[dict] = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._file: Optional[_NdjsonFile] = None
+
+    def _ensure_started(self) -> None:
+        # после fork (gunicorn/rq) поток родителя не существует — поднимаем свой
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="audit-flusher", daemon=True
+            )
+            self._thread.start()
+
+    def emit(self, row: dict) -> bool:
+        self._ensure_started()
+        with self._lock:
+            if len(self._buf) >= self.capacity:
+                AUDIT_EVENTS.labels(status="dropped").inc()
+                return False
+            self._buf.append(row)
+            size = len(self._buf)
+        AUDIT_EVENTS.labels(status="accepted").inc()
+        AUDIT_BUFFERED.inc()
+        if size >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:  # поток сброса не должен умирать
+                log.exception("audit_flush_failed")
+
+    def _take_batch(self) -> list[dict]:
+        with self._lock:
+            n = min(len(self._buf), self.batch_size)
+            batch = [self._buf.popleft() for _ in range(n)]
+        if batch:
+            AUDIT_BUFFERED.dec(len(batch))
+        return batch
+
+    def flush(self) -> None:
+        """Сбрасывает всё накопленное (пачками по batch_size)."""
+        with self._flush_lock:
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    return
+                for sink in self.sinks:
+                    self._write(sink, batch)
+
+    def _write(self, sink: str, batch: list[dict]) -> None:
+        start = time.perf_counter()
+        try:
+            if sink == "db":
+                with engine.begin() as conn:
+                    conn.execute(insert(AuditEvent), batch)
+            elif sink == "file":
+                if self._file is None:
+                    self._file = _NdjsonFile(
+                        AUDIT_NDJSON_DIR, AUDIT_NDJSON_MAX_BYTES, AUDIT_NDJSON_BACKUPS
+                    )
+                self._file.write(batch)
+            elif sink == "log":
+                for row in batch:
+                    # payload вложен отдельным полем:
+                    # ключи вроде "name" конфликтуют с LogRecord
+                    log.info(
+                        "audit",
+                        extra={
+                            "action": row["action"],
+                            "request_id": row["request_id"],
+                            "payload": row["payload"],
+                        },
+                    )
+            else:
+                return
+        except Exception:
+            AUDIT_FLUSH_ERRORS.labels(sink=sink).inc()
+            log.exception(
+                "audit_sink_write_failed", extra={"sink": sink, "events": len(batch)}
+            )
+            return
+        AUDIT_FLUSH_LATENCY.labels(sink=sink).observe(time.perf_counter() - start)
+
+
+sink = AuditSink()
+# дописать хвост буфера при штатном завершении процесса
+atexit.register(sink.flush)
+
+
 def audit_event(action: str, **fields: Any) -> None:
     """
-    Пишет структурированное событие аудита в JSON-лог.
+    Ставит структурированное событие аудита в буфер (запись — в фоне, пачками).
     Пример: audit_event("created_lesson", user_id=1, lesson_id=42)
     """
-    payload = {"action": action, "request_id": get_request_id()}
-    payload.update(fields or {})
-    log.info("audit", extra=payload)
+    payload = {k: _plain(v) for k, v in fields.items()}
+    student_id = payload.get("student_id")
+    sink.emit(
+        {
+            "created_at": datetime.utcnow(),
+            "action": action,
+            "request_id": get_request_id(),
+            "student_id": student_id if isinstance(student_id, int) else None,
+            "payload": payload,
+        }
+    )
 
 def audited(action: Optional[str] = None):
     """
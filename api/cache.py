@@ -0,0 +1,441 @@
+import asyncio
+import hashlib
+import inspect
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from functools import wraps
+from typing import Any, Callable, Iterable, Optional
+from urllib.parse import urlencode
+
+import redis
+import redis.asyncio as aioredis
+from fastapi import Request, Response
+from redis.exceptions import RedisError
+from starlette.concurrency import run_in_threadpool
+
+from metrics import RESPONSE_CACHE_EVICTIONS, RESPONSE_CACHE_REQUESTS
+from responses import dumps as _dumps
+
+log = logging.getLogger("api.cache")
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") not in (
+    "0",
+    "false",
+    "no",
+)
+RESPONSE_CACHE_L1_SIZE = int(os.getenv("RESPONSE_CACHE_L1_SIZE", "1024"))
+RESPONSE_CACHE_REDIS_TIMEOUT = float(os.getenv("RESPONSE_CACHE_REDIS_TIMEOUT", "0.05"))
+ETAG_ENABLED = os.getenv("ETAG_ENABLED", "1") not in ("0", "false", "no")
+# версия живёт не дольше этого (сек): если bump после записи не дошёл до Redis,
+# устаревший ETag перестанет давать 304 не позже чем через ETAG_VERSION_TTL
+ETAG_VERSION_TTL = int(os.getenv("ETAG_VERSION_TTL", "300"))
+
+KEY_PREFIX = "rc:"
+TAG_KEY = "rc:tag:{}"  # SET ключей ответов, помеченных тегом
+# pub/sub: тег, который надо сбросить в L1 всех воркеров
+INVALIDATE_CHANNEL = "rc:invalidate"
+# версия данных тега для ETag; меняется при каждой инвалидации
+VERSION_KEY = "rc:ver:{}"
+
+_redis_kwargs = dict(
+    socket_timeout=RESPONSE_CACHE_REDIS_TIMEOUT,
+    socket_connect_timeout=RESPONSE_CACHE_REDIS_TIMEOUT,
+)
+_ar = aioredis.from_url(REDIS_URL, **_redis_kwargs)
+# для sync-эндпоинтов (инвалидация из тредпула)
+_r = redis.from_url(REDIS_URL, **_redis_kwargs)
+_REDIS_ERRORS = (RedisError, OSError, asyncio.TimeoutError)
+
+
+class _L1:
+    """
+    In-process LRU «ключ -> (expires_at, body, tags)» с обратным индексом по тегам.
+    Sync-эндпоинты инвалидируют из тредпула, поэтому всё под блокировкой.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._items: "OrderedDict[str, tuple[float, bytes, tuple[str, ...]]]" = (
+            OrderedDict()
+        )
+        self._tags: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str, now: float) -> Optional[bytes]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if now >= item[0]:
+                self._remove(key)
+                return None
+            self._items.move_to_end(key)
+            return item[1]
+
+    def put(
+        self, key: str, body: bytes, tags: tuple[str, ...], expires_at: float
+    ) -> None:
+        with self._lock:
+            self._remove(key)
+            self._items[key] = (expires_at, body, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._items) > self.size:
+                self._remove(next(iter(self._items)))
+                RESPONSE_CACHE_EVICTIONS.labels(layer="l1", reason="lru").inc()
+
+    def _remove(self, key: str) -> None:
+        item = self._items.pop(key, None)
+        if item is None:
+            return
+        for tag in item[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate(self, tags: Iterable[str]) -> int:
+        removed = 0
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+                    removed += 1
+        if removed:
+            RESPONSE_CACHE_EVICTIONS.labels(layer="l1", reason="invalidate").inc(
+                removed
+            )
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._tags.clear()
+
+
+l1 = _L1(RESPONSE_CACHE_L1_SIZE)
+_listener: Optional[asyncio.Task] = None
+
+
+async def _listen_invalidations() -> None:
+    """Подписка на INVALIDATE_CHANNEL: сбрасывает L1 по тегам от других воркеров."""
+    while True:
+        try:
+            pubsub = _ar.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(INVALIDATE_CHANNEL)
+            try:
+                while True:
+                    msg = await pubsub.get_message(timeout=1.0)
+                    if msg and msg.get("type") == "message":
+                        data = msg["data"]
+                        l1.invalidate(
+                            [data.decode() if isinstance(data, bytes) else str(data)]
+                        )
+            finally:
+                await pubsub.aclose()
+        except asyncio.CancelledError:
+            raise
+        except _REDIS_ERRORS as exc:
+            # без подписки L1 может пропустить инвалидацию —
+            # не доверяем ему, пока не переподключимся
+            l1.clear()
+            log.warning("response_cache_listener_failed", extra={"error": str(exc)})
+            await asyncio.sleep(1.0)
+
+
+def _ensure_listener() -> None:
+    global _listener
+    if _listener is None or _listener.done():
+        _listener = asyncio.get_running_loop().create_task(_listen_invalidations())
+
+
+def _key_part(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def make_key(route: str, params: dict[str, Any]) -> str:
+    """route + отсортированные скалярные параметры (None — значение по умолчанию)."""
+    items = sorted((k, _key_part(v)) for k, v in params.items() if v is not None)
+    return f"{KEY_PREFIX}{route}?{urlencode(items)}"
+
+
+def _scalar_params(kwargs: dict[str, Any]) -> dict[str, Any]:
+    # зависимости (сессии БД, пользователь) в ключ не входят —
+    # только query/path-параметры
+    return {
+        k: v
+        for k, v in kwargs.items()
+        if v is None or isinstance(v, (str, int, float, bool, date))
+    }
+
+
+def _json_response(body: bytes, status: str) -> Response:
+    return Response(
+        content=body, media_type="application/json", headers={"X-Cache": status}
+    )
+
+
+def cached(
+    route: str,
+    ttl: float,
+    tags: Optional[Callable[[dict[str, Any]], Iterable[str]]] = None,
+):
+    """
+    Read-through кэш ответа GET-эндпоинта:
+    L1 в памяти процесса -> Redis -> сам эндпоинт.
+    Пример:
+        @router.get("/heatmap")
+        @cached("topics.heatmap", ttl=60, tags=lambda p: [f"heatmap:{p['student_id']}"])
+        def student_heatmap(student_id: int, db: Session = Depends(get_db)): ...
+    Ответ отдаётся готовым JSON (Response), без повторной сериализации.
+    Инвалидация — invalidate()/ainvalidate() с теми же тегами из пишущих эндпоинтов.
+    Redis недоступен — работаем только с L1 и БД.
+    """
+
+    def deco(fn: Callable):
+        is_async = asyncio.iscoroutinefunction(fn)
+
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if not RESPONSE_CACHE_ENABLED:
+                return (
+                    await fn(*args, **kwargs)
+                    if is_async
+                    else await run_in_threadpool(fn, *args, **kwargs)
+                )
+
+            _ensure_listener()
+            params = _scalar_params(kwargs)
+            key = make_key(route, params)
+            now = time.time()
+
+            body = l1.get(key, now)
+            if body is not None:
+                RESPONSE_CACHE_REQUESTS.labels(route=route, result="hit_l1").inc()
+                return _json_response(body, "HIT")
+
+            entry_tags = tuple(tags(params)) if tags else ()
+            try:
+                async with _ar.pipeline(transaction=False) as pipe:
+                    pipe.get(key)
+                    pipe.ttl(key)
+                    body, remaining = await pipe.execute()
+            except _REDIS_ERRORS as exc:
+                log.warning(
+                    "response_cache_read_failed",
+                    extra={"error": str(exc), "route": route},
+                )
+                body, remaining = None, None
+            if body is not None:
+                RESPONSE_CACHE_REQUESTS.labels(route=route, result="hit_l2").inc()
+                # в L1 — не дольше, чем осталось жить записи в Redis
+                l1.put(
+                    key,
+                    body,
+                    entry_tags,
+                    now + (remaining if remaining and remaining > 0 else ttl),
+                )
+                return _json_response(body, "HIT")
+
+            RESPONSE_CACHE_REQUESTS.labels(route=route, result="miss").inc()
+            result = (
+                await fn(*args, **kwargs)
+                if is_async
+                else await run_in_threadpool(fn, *args, **kwargs)
+            )
+            if isinstance(result, Response):
+                return result
+            body = _dumps(result)
+            l1.put(key, body, entry_tags, now + ttl)
+            try:
+                async with _ar.pipeline(transaction=False) as pipe:
+                    pipe.set(key, body, ex=max(1, int(ttl)))
+                    for tag in entry_tags:
+                        pipe.sadd(TAG_KEY.format(tag), key)
+                        # тег живёт дольше записей, которые на него ссылаются
+                        pipe.expire(TAG_KEY.format(tag), max(1, int(ttl)) * 2)
+                    await pipe.execute()
+            except _REDIS_ERRORS as exc:
+                log.warning(
+                    "response_cache_write_failed",
+                    extra={"error": str(exc), "route": route},
+                )
+            return _json_response(body, "MISS")
+
+        return wrapper
+
+    return deco
+
+
+# ===== ETag / условные GET =====
+
+
+async def tag_versions(tags: Iterable[str]) -> Optional[list[str]]:
+    """
+    Версии тегов; тегу без версии она заводится здесь же (SET NX).
+    None — Redis недоступен.
+    """
+    keys = [VERSION_KEY.format(tag) for tag in tags]
+    try:
+        values = await _ar.mget(keys)
+        if None in values:
+            async with _ar.pipeline(transaction=False) as pipe:
+                for key, value in zip(keys, values):
+                    if value is None:
+                        pipe.set(key, _new_version(), nx=True, ex=ETAG_VERSION_TTL)
+                pipe.mget(keys)
+                values = (await pipe.execute())[-1]
+    except _REDIS_ERRORS as exc:
+        log.warning("etag_versions_failed", extra={"error": str(exc), "tags": keys})
+        return None
+    return [v.decode() if isinstance(v, bytes) else str(v) for v in values]
+
+
+def make_etag(request: Request, versions: Iterable[str]) -> str:
+    """Сильный ETag: путь + отсортированная query-строка + версии тегов."""
+    query = urlencode(sorted(request.query_params.multi_items()))
+    raw = f"{request.url.path}?{query}|{'|'.join(versions)}"
+    return '"%s"' % hashlib.blake2b(raw.encode(), digest_size=12).hexdigest()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match сравнивается слабо (RFC 9110, 13.1.2): W/"x" совпадает с "x"
+    return any(
+        tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(",")
+    )
+
+
+def conditional(route: str, *tags: str):
+    """
+    ETag и 304 Not Modified для GET-эндпоинта по версиям тегов коллекции.
+    Пример:
+        @router.get("")
+        @conditional("lessons.list", "lessons")
+        async def list_lessons(...): ...
+    Версии меняет invalidate()/ainvalidate(), поэтому каждый пишущий эндпоинт коллекции
+    должен инвалидировать её тег. Версии читаются до основного запроса: ETag бывает
+    старше данных (лишний 200), но не новее. Совпал If-None-Match — 304 без запроса
+    к БД и сериализации. С @cached ставится над ним. Redis недоступен — без ETag.
+    Версия истекает через ETAG_VERSION_TTL и заводится заново: пропущенная из-за сбоя
+    Redis инвалидация лечится сама, ценой одного лишнего 200 на клиента за период.
+    """
+
+    def deco(fn: Callable):
+        is_async = asyncio.iscoroutinefunction(fn)
+        # FastAPI строит параметры по сигнатуре: добавляем Request,
+        # в сам эндпоинт он не уходит
+        sig = inspect.signature(fn, eval_str=True)
+        request_param = inspect.Parameter(
+            "etag_request", inspect.Parameter.KEYWORD_ONLY, annotation=Request
+        )
+
+        @wraps(fn)
+        async def wrapper(*args, etag_request: Request, **kwargs):
+            versions = await tag_versions(tags) if ETAG_ENABLED else None
+            etag = make_etag(etag_request, versions) if versions is not None else None
+            if etag is not None and etag_matches(
+                etag_request.headers.get("if-none-match"), etag
+            ):
+                RESPONSE_CACHE_REQUESTS.labels(route=route, result="not_modified").inc()
+                return Response(
+                    status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"}
+                )
+
+            result = (
+                await fn(*args, **kwargs)
+                if is_async
+                else await run_in_threadpool(fn, *args, **kwargs)
+            )
+            if etag is None:
+                return result
+            if not isinstance(result, Response):
+                result = Response(content=_dumps(result), media_type="application/json")
+            if result.status_code == 200:
+                result.headers["ETag"] = etag
+                # браузер хранит ответ, но перед использованием
+                # переспрашивает с If-None-Match
+                result.headers["Cache-Control"] = "no-cache"
+            return result
+
+        wrapper.__signature__ = sig.replace(
+            parameters=[*sig.parameters.values(), request_param]
+        )
+        return wrapper
+
+    return deco
+
+
+def _new_version() -> str:
+    # время, а не INCR: версия, заведённая заново после истечения ключа,
+    # не совпадёт со старой
+    return str(time.time_ns())
+
+
+def invalidate(*tags: str) -> None:
+    """
+    Сбрасывает записи с тегами в L1 этого процесса, в Redis и (через pub/sub)
+    в L1 остальных воркеров, и меняет версии тегов — ETag ответов @conditional
+    с этими тегами устаревают.
+    """
+    l1.invalidate(tags)
+    try:
+        tag_keys = [TAG_KEY.format(tag) for tag in tags]
+        with _r.pipeline(transaction=False) as pipe:
+            for tk in tag_keys:
+                pipe.smembers(tk)
+            members = pipe.execute()
+            keys = [k for group in members for k in group]
+            if keys:
+                pipe.delete(*keys)
+            pipe.delete(*tag_keys)
+            for tag in tags:
+                pipe.publish(INVALIDATE_CHANNEL, tag)
+                pipe.set(VERSION_KEY.format(tag), _new_version(), ex=ETAG_VERSION_TTL)
+            pipe.execute()
+    except _REDIS_ERRORS as exc:
+        log.warning(
+            "response_cache_invalidate_failed",
+            extra={"error": str(exc), "tags": list(tags)},
+        )
+        return
+    if keys:
+        RESPONSE_CACHE_EVICTIONS.labels(layer="l2", reason="invalidate").inc(len(keys))
+
+
+async def ainvalidate(*tags: str) -> None:
+    """Async-вариант invalidate() для ``async def`` эндпоинтов."""
+    l1.invalidate(tags)
+    try:
+        tag_keys = [TAG_KEY.format(tag) for tag in tags]
+        async with _ar.pipeline(transaction=False) as pipe:
+            for tk in tag_keys:
+                pipe.smembers(tk)
+            members = await pipe.execute()
+            keys = [k for group in members for k in group]
+            if keys:
+                pipe.delete(*keys)
+            pipe.delete(*tag_keys)
+            for tag in tags:
+                pipe.publish(INVALIDATE_CHANNEL, tag)
+                pipe.set(VERSION_KEY.format(tag), _new_version(), ex=ETAG_VERSION_TTL)
+            await pipe.execute()
+    except _REDIS_ERRORS as exc:
+        log.warning(
+            "response_cache_invalidate_failed",
+            extra={"error": str(exc), "tags": list(tags)},
+        )
+        return
+    if keys:
+        RESPONSE_CACHE_EVICTIONS.labels(layer="l2", reason="invalidate").inc(len(keys))
@@ -2,16 +2,26 @@
 
 from __future__ import annotations
 
+import base64
+import binascii
+import json
 import os
+from datetime import date, datetime
 from pathlib import Path
-from typing import Iterable
+from typing import Any, AsyncIterator, Iterable, Optional, Sequence
 
-from fastapi import Query
-from sqlalchemy import create_engine
-from sqlalchemy.engine import Engine
+import jwt
+from fastapi import Header, HTTPException, Query
+from sqlalchemy import Select, and_, create_engine, event, func, or_, select
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import Session, sessionmaker
-
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.orm import InstrumentedAttribute, Session, sessionmaker
 
 DEFAULT_SQLITE_URL = "sqlite:///./storage/hermes.db"
 
@@ -52,15 +62,81 @@ def _create_engine() -> Engine:
         raise RuntimeError(msg) from exc
 
 
+# Sync-драйвер из DATABASE_URL -> его async-аналог для AsyncEngine.
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def _async_database_url(database_url: str) -> str:
+    """Map ``postgresql+psycopg2``/``sqlite`` URLs onto asyncpg/aiosqlite drivers."""
+
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        msg = f"No async driver configured for database backend {backend!r}"
+        raise RuntimeError(msg)
+    return url.set(drivername=_ASYNC_DRIVERS[backend]).render_as_string(
+        hide_password=False
+    )
+
+
+def _create_async_engine() -> AsyncEngine:
+    database_url = os.getenv("DATABASE_URL", DEFAULT_SQLITE_URL)
+    _ensure_sqlite_path(database_url)
+
+    pool_kwargs: dict[str, Any] = {}
+    if not database_url.startswith("sqlite"):
+        # один воркер держит сотни in-flight запросов — пул побольше, чем у sync-движка
+        pool_kwargs = {
+            "pool_size": int(os.getenv("DB_ASYNC_POOL_SIZE", "20")),
+            "max_overflow": int(os.getenv("DB_ASYNC_MAX_OVERFLOW", "30")),
+        }
+
+    try:
+        return create_async_engine(
+            _async_database_url(database_url),
+            pool_pre_ping=True,
+            **pool_kwargs,
+        )
+    except SQLAlchemyError as exc:  # pragma: no cover - защитное поведение
+        msg = (
+            "Unable to initialise async database engine "
+            f"for URL {database_url!r}: {exc}"
+        )
+        raise RuntimeError(msg) from exc
+
+
 if not (__package__ or "").startswith("api."):
     import models as models_module  # type: ignore
+    import rollups  # type: ignore
+    import security  # type: ignore
+    import search  # type: ignore
+    import sqlutils  # type: ignore
 else:  # pragma: no cover - ветка для запуска как пакет
     from . import models as models_module
+    from . import rollups
+    from . import security
+    from . import search
+    from . import sqlutils
 
 
 engine = _create_engine()
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", sqlutils.register_sqlite_functions)
 SessionLocal = sessionmaker(engine, expire_on_commit=False, future=True)
 models_module.Base.metadata.create_all(bind=engine)
+if engine.dialect.name == "sqlite":
+    # FTS-индекс поиска и триггеры счётчиков тьютора create_all не создаёт
+    # (в Postgres — миграции 0011 и 0012)
+    with engine.begin() as conn:
+        search.install_sqlite(conn)
+        rollups.install_sqlite(conn)
+
+async_engine = _create_async_engine()
+if async_engine.dialect.name == "sqlite":
+    event.listen(
+        async_engine.sync_engine, "connect", sqlutils.register_sqlite_functions
+    )
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
 
 
 def get_db() -> Iterable[Session]:
@@ -69,17 +145,237 @@ def get_db() -> Iterable[Session]:
     with SessionLocal() as session:
         yield session
 
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """Async counterpart of :func:`get_db` for ``async def`` endpoints."""
+
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
+def _unauthorized(detail: str = "Not authenticated") -> HTTPException:
+    return HTTPException(401, detail, headers={"WWW-Authenticate": "Bearer"})
+
+
+def bearer_token(authorization: Optional[str] = Header(None)) -> str:
+    """Достаёт JWT из ``Authorization: Bearer ...``."""
+
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise _unauthorized()
+    return token.strip()
+
+
+async def current_user(
+    authorization: Optional[str] = Header(None),
+) -> security.AuthUser:
+    """Resolve the caller from the bearer token.
+
+    Горячий путь — попадание в LRU ``security.token_cache`` (без декодирования
+    JWT, Redis и БД). На промахе: проверка подписи/exp, deny-list в Redis и одна
+    выборка ``user``; результат кэшируется до exp токена. Отзыв (logout, смена
+    роли) приходит во все воркеры через pub/sub.
+    """
+
+    token = bearer_token(authorization)
+    security.ensure_revocation_listener()
+    key = security.token_hash(token)
+    cached = security.token_cache.get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        claims = security.decode_token(token)
+    except jwt.InvalidTokenError:
+        raise _unauthorized("Invalid or expired token")
+    if await security.is_revoked(key):
+        raise _unauthorized("Token revoked")
+
+    async with AsyncSessionLocal() as session:
+        row = (
+            await session.execute(
+                select(
+                    models_module.User.id,
+                    models_module.User.email,
+                    models_module.User.role,
+                ).where(models_module.User.id == claims["sub"])
+            )
+        ).first()
+    if row is None:
+        raise _unauthorized("User not found")
+
+    user = security.AuthUser(id=row.id, email=row.email, role=row.role)
+    security.token_cache.put(key, user, exp=float(claims["exp"]))
+    return user
+
+
 class Page:
-    """Simple pagination descriptor with sane defaults and bounds."""
+    """Simple pagination descriptor with sane defaults and bounds.
+
+    ``cursor`` включает keyset-режим (страница строится от последней строки
+    предыдущей, а не через OFFSET), ``with_total`` позволяет пропустить COUNT.
+    """
 
-    def __init__(self, page: int = 1, size: int = 20, max_size: int = 100):
+    def __init__(
+        self,
+        page: int = 1,
+        size: int = 20,
+        max_size: int = 100,
+        cursor: Optional[str] = None,
+        with_total: bool = True,
+    ):
         self.page = max(page, 1)
         self.size = min(max(size, 1), max_size)
+        self.cursor = cursor or None
+        self.with_total = with_total
+
+    @property
+    def offset(self) -> int:
+        return (self.page - 1) * self.size
+
 
 def pagination(
     page: int = Query(1, ge=1, description="Номер страницы (>= 1)"),
     size: int = Query(20, ge=1, le=100, description="Размер страницы (1..100)"),
+    cursor: Optional[str] = Query(
+        None,
+        description=(
+            "Непрозрачный курсор из next_cursor (keyset-пагинация, page игнорируется)"
+        ),
+    ),
+    with_total: bool = Query(True, description="Считать ли total (отдельный COUNT)"),
 ) -> Page:
     """Factory dependency that clamps incoming pagination parameters."""
 
-    return Page(page, size)
+    return Page(page, size, cursor=cursor, with_total=with_total)
+
+
+# ===== Keyset pagination =====
+
+
+def encode_cursor(sort_value: Any, row_id: int) -> str:
+    """Pack the last row's sort key into an opaque url-safe token."""
+
+    if isinstance(sort_value, datetime):
+        value: Any = {"dt": sort_value.isoformat()}
+    elif isinstance(sort_value, date):
+        value = {"d": sort_value.isoformat()}
+    else:
+        value = sort_value
+    raw = json.dumps([value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[Any, int]:
+    """Inverse of :func:`encode_cursor`; raises HTTP 400 on garbage input."""
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, row_id = json.loads(raw)
+        if isinstance(value, dict) and "dt" in value:
+            value = datetime.fromisoformat(value["dt"])
+        elif isinstance(value, dict) and "d" in value:
+            value = date.fromisoformat(value["d"])
+        elif isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            # в keyset-сравнение уходят только скаляры, которые мог выдать encode_cursor
+            raise TypeError(f"unsupported cursor value: {type(value).__name__}")
+        if isinstance(row_id, bool) or not isinstance(row_id, int):
+            raise TypeError(f"unsupported cursor id: {type(row_id).__name__}")
+        return value, row_id
+    except (ValueError, TypeError, binascii.Error) as exc:
+        raise HTTPException(400, "Invalid cursor") from exc
+
+
+def count_stmt(stmt: Select) -> Select:
+    """``SELECT count(*)`` over the filtered statement (without ORDER BY)."""
+
+    return select(func.count()).select_from(stmt.order_by(None).subquery())
+
+
+def page_stmt(
+    stmt: Select,
+    page: Page,
+    sort_col: InstrumentedAttribute,
+    id_col: InstrumentedAttribute,
+    descending: bool = True,
+) -> Select:
+    """Apply ORDER BY (sort_col, id), keyset/OFFSET and ``LIMIT size + 1``.
+
+    Лишняя строка нужна только чтобы понять, есть ли следующая страница.
+    """
+
+    if page.cursor:
+        value, last_id = decode_cursor(page.cursor)
+        if descending:
+            stmt = stmt.where(
+                or_(sort_col < value, and_(sort_col == value, id_col < last_id))
+            )
+        else:
+            stmt = stmt.where(
+                or_(sort_col > value, and_(sort_col == value, id_col > last_id))
+            )
+    else:
+        stmt = stmt.offset(page.offset)
+
+    order = (
+        (sort_col.desc(), id_col.desc())
+        if descending
+        else (sort_col.asc(), id_col.asc())
+    )
+    return stmt.order_by(*order).limit(page.size + 1)
+
+
+def page_result(
+    rows: Sequence[Any], page: Page, sort_key: str, id_key: str = "id"
+) -> tuple[list[Any], Optional[str]]:
+    """Trim the look-ahead row and build ``next_cursor`` from the last item."""
+
+    items = list(rows[: page.size])
+    if len(rows) <= page.size or not items:
+        return items, None
+    last = items[-1]
+    return items, encode_cursor(getattr(last, sort_key), getattr(last, id_key))
+
+
+def paginate(
+    db: Session,
+    stmt: Select,
+    page: Page,
+    sort_col: InstrumentedAttribute,
+    id_col: InstrumentedAttribute,
+    descending: bool = True,
+    scalars: bool = True,
+) -> tuple[list[Any], Optional[int], Optional[str]]:
+    """Run a paginated ORM query: returns ``(items, total, next_cursor)``.
+
+    ``total`` — отдельный COUNT по тем же фильтрам
+    либо ``None`` при ``with_total=false``.
+    ``scalars=False`` — для select по колонкам: items будут Core-строками (Row),
+    колонки сортировки и id должны быть среди выбранных.
+    """
+
+    total = db.execute(count_stmt(stmt)).scalar_one() if page.with_total else None
+    result = db.execute(page_stmt(stmt, page, sort_col, id_col, descending))
+    rows = result.scalars().all() if scalars else result.all()
+    items, next_cursor = page_result(rows, page, sort_col.key)
+    return items, total, next_cursor
+
+
+async def apaginate(
+    db: AsyncSession,
+    stmt: Select,
+    page: Page,
+    sort_col: InstrumentedAttribute,
+    id_col: InstrumentedAttribute,
+    descending: bool = True,
+    scalars: bool = True,
+) -> tuple[list[Any], Optional[int], Optional[str]]:
+    """Async variant of :func:`paginate` for :class:`AsyncSession`."""
+
+    total = (
+        (await db.execute(count_stmt(stmt))).scalar_one() if page.with_total else None
+    )
+    result = await db.execute(page_stmt(stmt, page, sort_col, id_col, descending))
+    rows = result.scalars().all() if scalars else result.all()
+    items, next_cursor = page_result(rows, page, sort_col.key)
+    return items, total, next_cursor
@@ -0,0 +1,162 @@
+"""
+Недельный дайджест родителям: статистика по всем ученикам за неделю.
+
+Ученики обходятся пачками по DIGEST_CHUNK (keyset по id). На пачку приходится
+три запроса: ученики, уроки с GROUP BY и ДЗ с GROUP BY. Письма пачки одним
+RPUSH уходят в очередь рассылки (jobs.queue_emails), а отправляет их
+job_drain_mail через пул SMTP-соединений.
+"""
+
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Iterator, Optional
+
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from models import Assignment, Lesson, Student
+
+DIGEST_CHUNK = int(os.getenv("DIGEST_CHUNK", "1000"))
+
+
+def week_bounds(now: Optional[datetime] = None) -> tuple[datetime, datetime]:
+    """[понедельник 00:00, следующий понедельник) недели, где лежит now (UTC)."""
+    now = now or datetime.utcnow()
+    monday = (now - timedelta(days=now.weekday())).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    return monday, monday + timedelta(days=7)
+
+
+def parent_email(student_id: int) -> str:
+    # TODO: реальный email родителя (как в finance)
+    return f"parent+{student_id}@example.com"
+
+
+def iter_digest_chunks(
+    db: Session, week_start: datetime, week_end: datetime, chunk: int = DIGEST_CHUNK
+) -> Iterator[list[dict[str, Any]]]:
+    """
+    Отдаёт статистику пачками: [{student_id, name, lessons, assignments_done,
+    assignments_total, level}].
+    """
+    last_id = 0
+    while True:
+        students = db.execute(
+            select(Student.id, Student.name, Student.level)
+            .where(Student.id > last_id)
+            .order_by(Student.id)
+            .limit(chunk)
+        ).all()
+        if not students:
+            return
+        last_id = students[-1].id
+        ids = [s.id for s in students]
+
+        lessons = dict(
+            db.execute(
+                select(Lesson.student_id, func.count(Lesson.id))
+                .where(
+                    Lesson.student_id.in_(ids),
+                    Lesson.date >= week_start,
+                    Lesson.date < week_end,
+                )
+                .group_by(Lesson.student_id)
+            ).all()
+        )
+        assignments = {
+            row.student_id: row
+            for row in db.execute(
+                select(
+                    Assignment.student_id,
+                    func.count(Assignment.id).label("total"),
+                    func.sum(case((Assignment.status == "done", 1), else_=0)).label(
+                        "done"
+                    ),
+                )
+                .where(
+                    Assignment.student_id.in_(ids),
+                    Assignment.created_at >= week_start,
+                    Assignment.created_at < week_end,
+                )
+                .group_by(Assignment.student_id)
+            )
+        }
+
+        rows = []
+        for s in students:
+            a = assignments.get(s.id)
+            rows.append(
+                {
+                    "student_id": s.id,
+                    "name": s.name,
+                    "lessons": lessons.get(s.id, 0),
+                    "assignments_done": int(a.done or 0) if a else 0,
+                    "assignments_total": a.total if a else 0,
+                    "level": s.level,
+                }
+            )
+        yield rows
+
+
+def run_weekly_digest(
+    db: Session, dry_run: bool = False, now: Optional[datetime] = None
+) -> dict[str, Any]:
+    """
+    Считает дайджест по всем ученикам и (если не dry_run) ставит письма в рассылку.
+    Возвращает отчёт с объёмами и таймингами — dry_run используется для оценки нагрузки.
+    """
+    from jobs import queue_emails  # jobs импортирует этот модуль из задачи
+
+    week_start, week_end = week_bounds(now)
+    period = f"{week_start.date()}..{(week_end - timedelta(days=1)).date()}"
+    report = {
+        "period": period,
+        "dry_run": dry_run,
+        "students": 0,
+        "emails": 0,
+        "chunks": 0,
+        "query_seconds": 0.0,
+        "fanout_seconds": 0.0,
+    }
+
+    started = time.perf_counter()
+    chunks = iter_digest_chunks(db, week_start, week_end)
+    while True:
+        t0 = time.perf_counter()
+        rows = next(chunks, None)
+        report["query_seconds"] += time.perf_counter() - t0
+        if rows is None:
+            break
+
+        report["chunks"] += 1
+        report["students"] += len(rows)
+        items = [
+            (
+                "weekly_digest",
+                parent_email(r["student_id"]),
+                {
+                    "student": r["name"],
+                    "period": period,
+                    "stats": {
+                        k: r[k]
+                        for k in (
+                            "lessons",
+                            "assignments_done",
+                            "assignments_total",
+                            "level",
+                        )
+                    },
+                },
+            )
+            for r in rows
+        ]
+        t0 = time.perf_counter()
+        report["emails"] += len(items) if dry_run else queue_emails(items)
+        report["fanout_seconds"] += time.perf_counter() - t0
+
+    report["total_seconds"] = time.perf_counter() - started
+    for key in ("query_seconds", "fanout_seconds", "total_seconds"):
+        report[key] = round(report[key], 4)
+    return report
@@ -0,0 +1,248 @@
+"""
+Прогноз балла на экзамене (0..100) по когорте учеников.
+
+Признаки всей когорты достаются одним запросом (дневные роллапы + затухший heat)
+и превращаются в матрицу NumPy; прогноз — одно матричное умножение линейной модели.
+Модель — ridge-регрессия на стандартизованных признаках. Её раз в сутки
+переобучает задача job_refit_forecast (jobs.py) и кладёт коэффициенты в Redis;
+API перечитывает их не чаще раза в FORECAST_MODEL_TTL секунд. Пока модель ни
+разу не обучена (или данных мало), работают априорные веса DEFAULT_MODEL.
+
+Цель обучения — средняя оценка ученика за следующее окно, переведённая в 0..100:
+отдельных результатов экзаменов в системе нет.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass
+from datetime import date, datetime, timedelta
+from typing import Optional, Sequence
+
+import numpy as np
+import redis
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+from sqlalchemy import Select, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from hotspots import effective_heat
+from models import ErrorHotspot, Student, StudentDailyStats
+
+log = logging.getLogger("api.forecast")
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+FORECAST_WINDOW_DAYS = int(os.getenv("FORECAST_WINDOW_DAYS", "28"))
+FORECAST_RIDGE_ALPHA = float(os.getenv("FORECAST_RIDGE_ALPHA", "1.0"))
+FORECAST_MIN_SAMPLES = int(os.getenv("FORECAST_MIN_SAMPLES", "30"))
+FORECAST_MODEL_TTL = float(os.getenv("FORECAST_MODEL_TTL", "300"))
+FORECAST_REDIS_TIMEOUT = float(os.getenv("FORECAST_REDIS_TIMEOUT", "0.2"))
+
+GRADE_MAX = 5.0  # оценки — по пятибалльной шкале
+MODEL_KEY = "forecast:model"
+
+FEATURES = ("avg_grade", "subs_per_week", "late_ratio", "heat", "level")
+
+_redis_kwargs = dict(
+    socket_timeout=FORECAST_REDIS_TIMEOUT, socket_connect_timeout=FORECAST_REDIS_TIMEOUT
+)
+_r = redis.from_url(REDIS_URL, **_redis_kwargs)
+_ar = aioredis.from_url(REDIS_URL, **_redis_kwargs)
+_REDIS_ERRORS = (RedisError, OSError, asyncio.TimeoutError)
+
+
+@dataclass
+class ForecastModel:
+    intercept: float
+    weights: list[float]  # по стандартизованным признакам, в порядке FEATURES
+    mean: list[float]
+    scale: list[float]
+    samples: int = 0
+    fitted_at: Optional[str] = None
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """X — (n, len(FEATURES)); пропуски (NaN) заменяются средним: вклада не дают."""
+        mean = np.asarray(self.mean)
+        X = np.where(np.isnan(X), mean, X)
+        Z = (X - mean) / np.asarray(self.scale)
+        return np.clip(self.intercept + Z @ np.asarray(self.weights), 0.0, 100.0)
+
+    def meta(self) -> dict:
+        return {"samples": self.samples, "fitted_at": self.fitted_at}
+
+
+# Априорные веса до первого обучения: средняя оценка и регулярность — в плюс,
+# просрочки и «горячие» ошибки — в минус
+DEFAULT_MODEL = ForecastModel(
+    intercept=60.0,
+    weights=[10.0, 4.0, -5.0, -3.0, 2.0],
+    mean=[4.0, 2.0, 0.1, 5.0, 3.0],
+    scale=[0.8, 2.0, 0.15, 5.0, 2.0],
+)
+
+
+# ===== Признаки =====
+
+
+def features_stmt(start: date, end: date, now: datetime) -> Select:
+    """
+    Сырые столбцы признаков по всем ученикам за дни [start, end);
+    фильтр по id добавляет вызывающий.
+    """
+    r = (
+        select(
+            StudentDailyStats.student_id,
+            func.sum(StudentDailyStats.submissions).label("subs"),
+            func.sum(StudentDailyStats.graded).label("graded"),
+            func.sum(StudentDailyStats.grade_sum).label("grade_sum"),
+            func.sum(StudentDailyStats.late).label("late"),
+        )
+        .where(StudentDailyStats.day >= start, StudentDailyStats.day < end)
+        .group_by(StudentDailyStats.student_id)
+        .subquery()
+    )
+    heat = (
+        select(ErrorHotspot.student_id, func.sum(effective_heat(now)).label("heat"))
+        .group_by(ErrorHotspot.student_id)
+        .subquery()
+    )
+    return (
+        select(
+            Student.id,
+            func.coalesce(Student.level, 1),
+            func.coalesce(r.c.subs, 0),
+            func.coalesce(r.c.graded, 0),
+            func.coalesce(r.c.grade_sum, 0),
+            func.coalesce(r.c.late, 0),
+            func.coalesce(heat.c.heat, 0),
+        )
+        .outerjoin(r, r.c.student_id == Student.id)
+        .outerjoin(heat, heat.c.student_id == Student.id)
+        .order_by(Student.id)
+    )
+
+
+def to_matrix(rows: Sequence[tuple], days: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Строки features_stmt -> (ids, X) с колонками FEATURES;
+    avg_grade = NaN, если оценок не было.
+    """
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty((0, len(FEATURES)))
+    raw = np.array(rows, dtype=np.float64)
+    ids = raw[:, 0].astype(np.int64)
+    level, subs, graded, grade_sum, late, heat = raw[:, 1:].T
+    avg_grade = np.divide(
+        grade_sum, graded, out=np.full(len(raw), np.nan), where=graded > 0
+    )
+    subs_per_week = subs * 7.0 / days
+    late_ratio = late / np.maximum(subs + late, 1.0)
+    return ids, np.column_stack([avg_grade, subs_per_week, late_ratio, heat, level])
+
+
+def _window(end: date, days: int = FORECAST_WINDOW_DAYS) -> tuple[date, date]:
+    return end - timedelta(days=days), end
+
+
+# ===== Обучение (задача воркера) =====
+
+
+def fit(
+    X: np.ndarray, y: np.ndarray, alpha: float = FORECAST_RIDGE_ALPHA
+) -> ForecastModel:
+    """
+    Ridge в замкнутой форме на стандартизованных признаках:
+    w = (ZᵀZ + αI)⁻¹ Zᵀ(y - ȳ).
+    """
+    mean = np.nanmean(X, axis=0)
+    mean = np.where(np.isnan(mean), 0.0, mean)
+    X = np.where(np.isnan(X), mean, X)
+    scale = X.std(axis=0)
+    scale[scale == 0] = 1.0
+    Z = (X - mean) / scale
+    intercept = float(y.mean())
+    weights = np.linalg.solve(
+        Z.T @ Z + alpha * np.eye(Z.shape[1]), Z.T @ (y - intercept)
+    )
+    return ForecastModel(
+        intercept=intercept,
+        weights=weights.tolist(),
+        mean=mean.tolist(),
+        scale=scale.tolist(),
+        samples=len(y),
+        fitted_at=datetime.utcnow().isoformat(timespec="seconds"),
+    )
+
+
+def refit(db: Session, now: Optional[datetime] = None) -> Optional[ForecastModel]:
+    """
+    Признаки за позапрошлое окно -> средняя оценка за последнее окно. Возвращает
+    сохранённую модель или None, если учеников с оценками меньше FORECAST_MIN_SAMPLES.
+    Heat в истории не хранится — берётся текущий (затухший).
+    """
+    now = now or datetime.utcnow()
+    target_start, target_end = _window(now.date() + timedelta(days=1))
+    feat_start, feat_end = _window(target_start)
+
+    ids, X = to_matrix(
+        db.execute(features_stmt(feat_start, feat_end, now)).all(), FORECAST_WINDOW_DAYS
+    )
+    tids, T = to_matrix(
+        db.execute(features_stmt(target_start, target_end, now)).all(),
+        FORECAST_WINDOW_DAYS,
+    )
+    # выравниваем по id: ученик мог появиться между двумя запросами
+    _, xi, ti = np.intersect1d(ids, tids, return_indices=True)
+    X, y = X[xi], T[ti, FEATURES.index("avg_grade")] * (100.0 / GRADE_MAX)
+    has_target = ~np.isnan(y)
+    if has_target.sum() < FORECAST_MIN_SAMPLES:
+        log.info("forecast_refit_skipped", extra={"samples": int(has_target.sum())})
+        return None
+
+    model = fit(X[has_target], y[has_target])
+    _r.set(MODEL_KEY, json.dumps(asdict(model)))
+    log.info("forecast_refit_done", extra=model.meta())
+    return model
+
+
+# ===== Прогноз (API) =====
+
+_cached: tuple[float, ForecastModel] = (0.0, DEFAULT_MODEL)
+
+
+async def aload_model() -> ForecastModel:
+    """
+    Модель из Redis с кэшем в процессе;
+    Redis недоступен — последняя известная (или DEFAULT_MODEL).
+    """
+    global _cached
+    expires, model = _cached
+    if time.monotonic() < expires:
+        return model
+    try:
+        raw = await _ar.get(MODEL_KEY)
+        if raw:
+            model = ForecastModel(**json.loads(raw))
+    except _REDIS_ERRORS as exc:
+        log.warning("forecast_model_load_failed", extra={"error": str(exc)})
+    _cached = (time.monotonic() + FORECAST_MODEL_TTL, model)
+    return model
+
+
+async def predict(
+    db: AsyncSession,
+    student_ids: Optional[Sequence[int]] = None,
+    now: Optional[datetime] = None,
+) -> tuple[np.ndarray, np.ndarray, ForecastModel]:
+    """(ids, баллы, модель) для указанных учеников или когорты (student_ids=None)."""
+    now = now or datetime.utcnow()
+    start, end = _window(now.date() + timedelta(days=1))
+    stmt = features_stmt(start, end, now)
+    if student_ids is not None:
+        stmt = stmt.where(Student.id.in_(student_ids))
+    ids, X = to_matrix((await db.execute(stmt)).all(), FORECAST_WINDOW_DAYS)
+    model = await aload_model()
+    return ids, model.predict(X), model
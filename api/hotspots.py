@@ -0,0 +1,32 @@
+"""
+Затухание heat в тепловой карте ошибок.
+
+Хранится heat на момент updated_at; эффективное значение на момент now —
+heat * 0.5 ** (возраст в сутках / HEAT_HALF_LIFE_DAYS). Считается прямо в SQL при
+чтении (heatmap, радар), а при записи (upsert в routers/topics.py) к затухшему
+значению прибавляется дельта и updated_at сдвигается на now. Ночного пересчёта
+всей таблицы нет.
+"""
+
+import os
+from datetime import datetime
+
+from sqlalchemy import func
+
+from models import ErrorHotspot
+from sqlutils import age_days
+
+# период полураспада heat в днях; <= 0 — без затухания
+HEAT_HALF_LIFE_DAYS = float(os.getenv("HEAT_HALF_LIFE_DAYS", "14"))
+
+
+def effective_heat(
+    now: datetime, heat=ErrorHotspot.heat, updated_at=ErrorHotspot.updated_at
+):
+    """
+    SQL-выражение heat, затухшего к моменту now
+    (колонки можно подменить, например на алиас).
+    """
+    if HEAT_HALF_LIFE_DAYS <= 0:
+        return heat
+    return heat * func.power(0.5, age_days(updated_at, now) / HEAT_HALF_LIFE_DAYS)
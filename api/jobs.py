@@ -1,31 +1,62 @@
 import os
 from datetime import datetime, timedelta, timezone
-from typing import Any
+from typing import Any, Callable, Iterable, Optional
 
 import redis
 from rq import Queue
+from rq.utils import get_version
 from rq_scheduler import Scheduler
+from rq_scheduler.utils import to_unix
 
 from prometheus_client import Counter
-from metrics import JOBS_SENT, MAIL_SENT
+import mailer
+from metrics import JOBS_SENT
 
 # ===== RQ/Redis =====
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Недельный дайджест: воскресенье, в этот час (UTC)
+DIGEST_CRON_HOUR_UTC = int(os.getenv("DIGEST_CRON_HOUR_UTC", "18"))
 redis_conn = redis.from_url(REDIS_URL)
 
 queue_default = Queue("default", connection=redis_conn)
 scheduler = Scheduler(queue=queue_default, connection=redis_conn)
 
 
-# ===== Псевдо-отправка писем (заготовка под SMTP) =====
+# ===== Отправка писем (SMTP через пул соединений воркера, см. mailer.py) =====
 def send_email(template: str, to: str, payload: dict[str, Any]) -> None:
     """
-    Здесь подключите реальный SMTP позже.
-    Пока просто считаем метрики и пишем в stdout (видно в логах воркера).
+    Одно письмо через пул SMTP-соединений процесса. Ошибки доставки учитываются
+    в mail_sent_total{status="failed"} и не роняют задачу.
     """
-    # Имитация отправки
-    print(f"[MAIL] template={template} to={to} payload={payload}")
-    MAIL_SENT.labels(template=template, status="queued").inc()
+    mailer.deliver(template, to, payload)
+
+
+def job_drain_mail() -> int:
+    """
+    Отправляет накопленные в Redis письма (mailer.queue_mail) пачками
+    по одному соединению.
+    """
+    # письма, пришедшие с этого момента, поставят новый drain
+    redis_conn.delete(mailer.MAIL_DRAIN_FLAG)
+    sent = mailer.drain(redis_conn)
+    # SMTP недоступен и письма вернулись в очередь — повторим позже
+    if redis_conn.llen(mailer.MAIL_QUEUE_KEY) and redis_conn.set(
+        mailer.MAIL_DRAIN_FLAG, 1, nx=True, ex=600
+    ):
+        scheduler.enqueue_in(timedelta(seconds=60), job_drain_mail)
+    return sent
+
+
+def queue_emails(items: Iterable[tuple[str, str, dict[str, Any]]]) -> int:
+    """
+    Массовая рассылка: письма (template, to, payload) одним RPUSH в Redis и
+    не больше одной ожидающей задачи job_drain_mail на всю очередь.
+    """
+    count = mailer.queue_mail(redis_conn, items)
+    if count and redis_conn.set(mailer.MAIL_DRAIN_FLAG, 1, nx=True, ex=600):
+        queue_default.enqueue(job_drain_mail)
+        JOBS_SENT.labels(kind="drain_mail").inc()
+    return count
 
 
 # ===== Бизнес-джобы =====
@@ -63,13 +94,88 @@ def job_invoice_due_reminder(payer_email: str, invoice_id: int, amount: float, d
     )
 
 
+def job_weekly_digest_batch(dry_run: bool = False) -> dict:
+    """
+    Дайджест по всем ученикам за текущую неделю (см. digest.py).
+    """
+    from deps import SessionLocal
+    import digest
+
+    with SessionLocal() as db:
+        return digest.run_weekly_digest(db, dry_run=dry_run)
+
+
+def job_reconcile_leaderboards() -> int:
+    """
+    Сверка Redis-лидербордов с tournament_participant (источник истины).
+    """
+    from deps import SessionLocal
+    import leaderboard
+
+    with SessionLocal() as db:
+        return leaderboard.reconcile(db)
+
+
+def job_refit_forecast() -> dict:
+    """
+    Переобучение модели прогноза экзамена по всей когорте (см. forecast.py).
+    """
+    from deps import SessionLocal
+    import forecast
+
+    with SessionLocal() as db:
+        model = forecast.refit(db)
+    return model.meta() if model else {"skipped": True}
+
+
 # ===== Хелперы постановки задач =====
-def enqueue_lesson_reminder(student_email: str, lesson_id: int, start_at: datetime) -> None:
+def schedule_many(
+    kind: str,
+    jobs: Iterable[tuple[Optional[datetime], Callable, dict[str, Any], Optional[str]]],
+) -> int:
+    """
+    Пакетный аналог scheduler.enqueue_at / queue.enqueue: все задачи (hash задачи +
+    запись в sorted set планировщика или в очередь) уходят в Redis одним pipeline,
+    а не 2 запроса на задачу.
+    jobs: (run_at | None — сразу в очередь, func, kwargs, job_id | None — сгенерировать)
+    """
+    count = 0
+    server_version = get_version(redis_conn)  # иначе Job.save спрашивает INFO сам
+    with redis_conn.pipeline(transaction=False) as pipe:
+        for run_at, func, kwargs, job_id in jobs:
+            job = scheduler._create_job(func, kwargs=kwargs, id=job_id, commit=False)
+            job.redis_server_version = server_version
+            if run_at is None:
+                queue_default.enqueue_job(job, pipeline=pipe)
+            else:
+                job.save(pipeline=pipe)
+                pipe.zadd(scheduler.scheduled_jobs_key, {job.id: to_unix(run_at)})
+            count += 1
+        pipe.execute()
+    JOBS_SENT.labels(kind=kind).inc(count)
+    return count
+
+
+def lesson_reminder_at(start_at: datetime) -> datetime:
     run_at = start_at - timedelta(days=1)
     if run_at.tzinfo is None:
         run_at = run_at.replace(tzinfo=timezone.utc)
+    return run_at
+
+
+def invoice_due_at(due_date: datetime) -> datetime:
+    return (due_date - timedelta(days=3)).replace(tzinfo=timezone.utc)
+
+
+def enqueue_lesson_reminder(
+    student_email: str, lesson_id: int, start_at: datetime
+) -> None:
     scheduler.enqueue_at(
-        run_at, job_lesson_reminder, student_email=student_email, lesson_id=lesson_id, start_at=start_at.isoformat()
+        lesson_reminder_at(start_at),
+        job_lesson_reminder,
+        student_email=student_email,
+        lesson_id=lesson_id,
+        start_at=start_at.isoformat(),
     )
     JOBS_SENT.labels(kind="lesson_reminder").inc()
 
@@ -85,9 +191,8 @@ def enqueue_weekly_digest(parent_email: str, student_name: str, week_monday: dat
 
 
 def enqueue_invoice_due(payer_email: str, invoice_id: int, amount: float, due_date: datetime) -> None:
-    run_at = (due_date - timedelta(days=3)).replace(tzinfo=timezone.utc)
     scheduler.enqueue_at(
-        run_at,
+        invoice_due_at(due_date),
         job_invoice_due_reminder,
         payer_email=payer_email,
         invoice_id=invoice_id,
@@ -118,6 +223,44 @@ def schedule_recurring_jobs() -> None:
     )
     JOBS_SENT.labels(kind="heartbeat").inc()
 
+    job_id = "weekly-digest"
+    for j in scheduler.get_jobs():
+        if j.id == job_id:
+            scheduler.cancel(j)
+    scheduler.cron(
+        f"0 {DIGEST_CRON_HOUR_UTC} * * 0",  # воскресенье
+        func=job_weekly_digest_batch,
+        id=job_id,
+        repeat=None,
+        queue_name="default",
+        timeout=3600,
+    )
+
+    job_id = "leaderboards-reconcile"
+    for j in scheduler.get_jobs():
+        if j.id == job_id:
+            scheduler.cancel(j)
+    scheduler.cron(
+        "*/5 * * * *",  # каждые 5 минут
+        func=job_reconcile_leaderboards,
+        id=job_id,
+        repeat=None,
+        queue_name="default",
+    )
+
+    job_id = "forecast-refit"
+    for j in scheduler.get_jobs():
+        if j.id == job_id:
+            scheduler.cancel(j)
+    scheduler.cron(
+        "30 3 * * *",  # раз в сутки, ночью
+        func=job_refit_forecast,
+        id=job_id,
+        repeat=None,
+        queue_name="default",
+        timeout=1800,
+    )
+
 
 if __name__ == "__main__":
     # Позволяет вручную прогреть периодические задачи:
@@ -0,0 +1,257 @@
+import logging
+import os
+import uuid
+from typing import Optional
+
+import redis
+from redis.exceptions import RedisError
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+
+from models import TournamentParticipant
+
+log = logging.getLogger("api.leaderboard")
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+LEADERBOARD_REDIS_TIMEOUT = float(os.getenv("LEADERBOARD_REDIS_TIMEOUT", "0.2"))
+
+# ZSET: member = student_id, дополненный нулями до MEMBER_WIDTH, score = points.
+# При равных очках ZREVRANGE упорядочивает по member в обратном лексикографическом
+# порядке; с одинаковой длиной он совпадает с points desc, student_id desc в SQL.
+# v2 — формат member с нулями; ключи lb:<id> старого формата больше не читаются.
+KEY = "lb:v2:{}"
+MEMBER_WIDTH = 10
+
+_r = redis.from_url(
+    REDIS_URL,
+    socket_timeout=LEADERBOARD_REDIS_TIMEOUT,
+    socket_connect_timeout=LEADERBOARD_REDIS_TIMEOUT,
+)
+_REDIS_ERRORS = (RedisError, OSError)
+
+def _member(student_id: int) -> str:
+    return f"{student_id:0{MEMBER_WIDTH}d}"
+
+
+def _row(student_id, points, rank: int) -> dict:
+    return {"student_id": int(student_id), "points": int(points), "rank": rank}
+
+
+# ===== Зеркало в Redis =====
+# Таблица tournament_participant — источник истины; ZSET — производная, которую
+# можно в любой момент собрать заново (rebuild) или сверить (reconcile).
+# Пишем абсолютные очки из БД (после commit), а не дельты: запись идемпотентна,
+# и её можно безопасно наложить поверх снимка, собранного rebuild.
+REBUILD_TTL = 60  # сек: защита от «вечного» флага, если процесс умер посреди rebuild
+
+# Пока идёт rebuild (счётчик KEYS[3] > 0), запись дублируется в HASH KEYS[2]:
+# снимок из БД мог её не застать. В сам ZSET — только если он существует,
+# иначе он появится с одним участником и _ensure не станет собирать его из БД.
+_SET_POINTS = _r.register_script(
+    """
+    if redis.call("EXISTS", KEYS[3]) == 1 then
+        redis.call("HSET", KEYS[2], ARGV[1], ARGV[2])
+        redis.call("EXPIRE", KEYS[2], ARGV[3])
+    end
+    if redis.call("EXISTS", KEYS[1]) == 1 then
+        redis.call("ZADD", KEYS[1], ARGV[2], ARGV[1])
+    end
+    return 0
+    """
+)
+
+# Подмена ZSET снимком KEYS[4]: сначала поверх снимка — записи, пришедшие
+# за время rebuild (KEYS[2]); их хранит, пока не закончится последний rebuild.
+_SWAP = _r.register_script(
+    """
+    local pending = redis.call("HGETALL", KEYS[2])
+    for i = 1, #pending, 2 do
+        redis.call("ZADD", KEYS[4], pending[i + 1], pending[i])
+    end
+    if redis.call("EXISTS", KEYS[4]) == 1 then
+        redis.call("RENAME", KEYS[4], KEYS[1])
+        redis.call("PERSIST", KEYS[1])
+    else
+        redis.call("DEL", KEYS[1])
+    end
+    if redis.call("DECR", KEYS[3]) <= 0 then
+        redis.call("DEL", KEYS[2], KEYS[3])
+    end
+    return 0
+    """
+)
+
+
+def _keys(tournament_id: int) -> list[str]:
+    """[ZSET, записи во время rebuild, счётчик идущих rebuild]."""
+    key = KEY.format(tournament_id)
+    return [key, f"{key}:pending", f"{key}:rebuilding"]
+
+
+def rebuild(db: Session, tournament_id: int) -> None:
+    """
+    Собирает ZSET из БД во временный ключ и атомарно подменяет им основной.
+    Флаг ставится до чтения БД: всё, что закоммитят после SELECT, попадёт в pending
+    и будет наложено на снимок при подмене.
+    """
+    key, pending, rebuilding = _keys(tournament_id)
+    with _r.pipeline(transaction=True) as pipe:
+        pipe.incr(rebuilding)
+        pipe.expire(rebuilding, REBUILD_TTL)
+        pipe.execute()
+    rows = db.execute(
+        select(TournamentParticipant.student_id, TournamentParticipant.points).where(
+            TournamentParticipant.tournament_id == tournament_id
+        )
+    ).all()
+    # свой временный ключ на каждый rebuild: параллельные не портят снимки друг друга
+    tmp = f"{key}:rebuild-{uuid.uuid4().hex}"
+    if rows:
+        with _r.pipeline(transaction=True) as pipe:
+            pipe.zadd(tmp, {_member(sid): pts for sid, pts in rows})
+            pipe.expire(tmp, REBUILD_TTL)
+            pipe.execute()
+    _SWAP(keys=[key, pending, rebuilding, tmp])
+
+
+def _ensure(db: Session, tournament_id: int) -> str:
+    key = KEY.format(tournament_id)
+    if not _r.exists(key):
+        rebuild(db, tournament_id)
+    return key
+
+
+def set_points(tournament_id: int, student_id: int, points: int) -> None:
+    """
+    Публикует очки участника из БД (после commit). Нет ключа — его соберёт
+    следующее чтение, а в БД значение уже есть.
+    """
+    try:
+        _SET_POINTS(
+            keys=_keys(tournament_id),
+            args=[_member(student_id), points, REBUILD_TTL],
+        )
+    except _REDIS_ERRORS as exc:
+        log.warning(
+            "leaderboard_write_failed",
+            extra={"error": str(exc), "tournament_id": tournament_id},
+        )
+
+
+# ===== Чтение: Redis, при недоступности — SQL =====
+
+
+def top(db: Session, tournament_id: int, limit: int) -> list[dict]:
+    try:
+        key = _ensure(db, tournament_id)
+        items = _r.zrevrange(key, 0, limit - 1, withscores=True)
+        return [_row(sid, pts, i + 1) for i, (sid, pts) in enumerate(items)]
+    except _REDIS_ERRORS as exc:
+        log.warning(
+            "leaderboard_read_failed",
+            extra={"error": str(exc), "tournament_id": tournament_id},
+        )
+
+    rows = db.execute(
+        select(TournamentParticipant.student_id, TournamentParticipant.points)
+        .where(TournamentParticipant.tournament_id == tournament_id)
+        .order_by(
+            TournamentParticipant.points.desc(), TournamentParticipant.student_id.desc()
+        )
+        .limit(limit)
+    ).all()
+    return [_row(sid, pts, i + 1) for i, (sid, pts) in enumerate(rows)]
+
+
+def _sql_rank(
+    db: Session, tournament_id: int, student_id: int
+) -> Optional[tuple[int, int]]:
+    points = db.scalar(
+        select(TournamentParticipant.points).where(
+            TournamentParticipant.tournament_id == tournament_id,
+            TournamentParticipant.student_id == student_id,
+        )
+    )
+    if points is None:
+        return None
+    # тот же порядок, что в top(): при равных очках выше больший student_id
+    ahead = db.scalar(
+        select(func.count()).where(
+            TournamentParticipant.tournament_id == tournament_id,
+            or_(
+                TournamentParticipant.points > points,
+                and_(
+                    TournamentParticipant.points == points,
+                    TournamentParticipant.student_id > student_id,
+                ),
+            ),
+        )
+    )
+    return ahead + 1, points
+
+
+def rank(db: Session, tournament_id: int, student_id: int) -> Optional[dict]:
+    """Место (1 — лидер) и очки; None — не участник."""
+    try:
+        key = _ensure(db, tournament_id)
+        with _r.pipeline(transaction=False) as pipe:
+            pipe.zrevrank(key, _member(student_id))
+            pipe.zscore(key, _member(student_id))
+            pos, points = pipe.execute()
+        if pos is None:
+            return None
+        return _row(student_id, points, pos + 1)
+    except _REDIS_ERRORS as exc:
+        log.warning(
+            "leaderboard_read_failed",
+            extra={"error": str(exc), "tournament_id": tournament_id},
+        )
+
+    found = _sql_rank(db, tournament_id, student_id)
+    return _row(student_id, found[1], found[0]) if found else None
+
+
+def around(
+    db: Session, tournament_id: int, student_id: int, radius: int
+) -> Optional[list[dict]]:
+    """Участники на местах [rank - radius, rank + radius]; None — не участник."""
+    try:
+        key = _ensure(db, tournament_id)
+        pos = _r.zrevrank(key, _member(student_id))
+        if pos is None:
+            return None
+        start = max(0, pos - radius)
+        items = _r.zrevrange(key, start, pos + radius, withscores=True)
+        return [_row(sid, pts, start + i + 1) for i, (sid, pts) in enumerate(items)]
+    except _REDIS_ERRORS as exc:
+        log.warning(
+            "leaderboard_read_failed",
+            extra={"error": str(exc), "tournament_id": tournament_id},
+        )
+
+    found = _sql_rank(db, tournament_id, student_id)
+    if found is None:
+        return None
+    start = max(0, found[0] - 1 - radius)
+    rows = db.execute(
+        select(TournamentParticipant.student_id, TournamentParticipant.points)
+        .where(TournamentParticipant.tournament_id == tournament_id)
+        .order_by(
+            TournamentParticipant.points.desc(), TournamentParticipant.student_id.desc()
+        )
+        .offset(start)
+        .limit(2 * radius + 1)
+    ).all()
+    return [_row(sid, pts, start + i + 1) for i, (sid, pts) in enumerate(rows)]
+
+
+def reconcile(db: Session) -> int:
+    """Пересобирает все существующие ZSET из БД (лечит расхождения после сбоя Redis)."""
+    count = 0
+    for key in _r.scan_iter(match=KEY.format("*"), count=500):
+        name = key.decode() if isinstance(key, bytes) else key
+        tid = name.rsplit(":", 1)[1]
+        if tid.isdigit():
+            rebuild(db, int(tid))
+            count += 1
+    return count
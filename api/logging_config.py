@@ -1,18 +1,34 @@
+import atexit
+import copy
+import json
 import logging
+import os
+import queue
+import random
 import sys
 import time
 import uuid
 from contextvars import ContextVar
-from typing import Callable
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any
 
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
 from pythonjsonlogger import jsonlogger
 
+try:  # orjson заметно быстрее stdlib json; без него просто откатываемся
+    import orjson
+except ImportError:  # pragma: no cover - опциональная зависимость
+    orjson = None
+
 # ===== Correlation ID (request-id) =====
 _request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
 
 REQUEST_ID_HEADER = "X-Request-ID"
+_REQUEST_ID_HEADER_RAW = REQUEST_ID_HEADER.lower().encode("latin-1")
+
+# Access-лог: доля "быстрых успешных" запросов, попадающих в лог,
+# и порог медленного запроса (мс)
+ACCESS_LOG_SAMPLE_RATE = float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "1.0"))
+ACCESS_LOG_SLOW_MS = float(os.getenv("ACCESS_LOG_SLOW_MS", "500"))
 
 def get_request_id() -> str | None:
     return _request_id.get()
@@ -20,63 +36,163 @@ def get_request_id() -> str | None:
 def _generate_request_id() -> str:
     return str(uuid.uuid4())
 
-class CorrelationIdMiddleware(BaseHTTPMiddleware):
+
+class CorrelationIdMiddleware:
     """
-    Устанавливает/прокидывает correlation id.
+    Устанавливает/прокидывает correlation id (чистый ASGI, как MetricsMiddleware).
     - Читает X-Request-ID из входящего запроса (если есть).
     - Генерирует новый, если отсутствует.
     - Прокидывает в контекст и в ответные заголовки.
-    - Пишет access-лог в JSON со статусом/временем.
+    - Пишет access-лог в JSON со статусом/временем с сэмплированием:
+      ошибки (>= 400) и медленные запросы — всегда, остальное — с долей sample_rate.
     """
-    def __init__(self, app, logger: logging.Logger | None = None) -> None:
-        super().__init__(app)
+
+    def __init__(
+        self,
+        app,
+        logger: logging.Logger | None = None,
+        sample_rate: float = ACCESS_LOG_SAMPLE_RATE,
+        slow_ms: float = ACCESS_LOG_SLOW_MS,
+    ) -> None:
+        self.app = app
         self.logger = logger or logging.getLogger("api.access")
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        rid = request.headers.get(REQUEST_ID_HEADER) or _generate_request_id()
+    def _should_log(self, status_code: int, duration_ms: float) -> bool:
+        if status_code >= 400 or duration_ms >= self.slow_ms:
+            return True
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or ())
+        raw_rid = headers.get(_REQUEST_ID_HEADER_RAW)
+        rid = raw_rid.decode("latin-1") if raw_rid else _generate_request_id()
         token = _request_id.set(rid)
+        rid_header = (_REQUEST_ID_HEADER_RAW, rid.encode("latin-1"))
+        status_holder = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["code"] = message["status"]
+                message.setdefault("headers", []).append(rid_header)
+            await send(message)
+
         start = time.perf_counter()
         try:
-            response: Response = await call_next(request)
+            await self.app(scope, receive, send_wrapper)
         finally:
             duration_ms = round((time.perf_counter() - start) * 1000, 2)
-            self.logger.info(
-                "request_complete",
-                extra={
-                    "request_id": rid,
-                    "method": request.method,
-                    "path": request.url.path,
-                    "query": str(request.url.query),
-                    "status_code": getattr(response, "status_code", 0),
-                    "duration_ms": duration_ms,
-                    "client_ip": request.client.host if request.client else None,
-                    "user_agent": request.headers.get("user-agent"),
-                },
-            )
+            status_code = status_holder["code"]
+            if self._should_log(status_code, duration_ms):
+                client = scope.get("client")
+                user_agent = headers.get(b"user-agent")
+                self.logger.info(
+                    "request_complete",
+                    extra={
+                        "request_id": rid,
+                        "method": scope.get("method"),
+                        "path": scope.get("path"),
+                        "query": scope.get("query_string", b"").decode("latin-1"),
+                        "status_code": status_code,
+                        "duration_ms": duration_ms,
+                        "client_ip": client[0] if client else None,
+                        "user_agent": (
+                            user_agent.decode("latin-1") if user_agent else None
+                        ),
+                    },
+                )
             _request_id.reset(token)
-        response.headers[REQUEST_ID_HEADER] = rid
-        return response
+
 
 # ===== JSON logging setup =====
 
 class RequestIdFilter(logging.Filter):
-    """Добавляет request_id в каждый лог-запись из контекста."""
+    """
+    Добавляет request_id в каждый лог-запись из контекста. Явно переданный
+    (extra={"request_id": ...}, например из потока аудита) не перетирается.
+    """
     def filter(self, record: logging.LogRecord) -> bool:
-        setattr(record, "request_id", get_request_id())
+        if getattr(record, "request_id", None) is None:
+            record.request_id = get_request_id()
         return True
 
+
+def _json_dumps(obj: Any, **kwargs: Any) -> str:
+    """
+    Сериализатор для JsonFormatter: orjson, если установлен, иначе stdlib json.
+    Форматтер передаёт default=None и cls=JsonEncoder: неизвестные типы (Decimal,
+    set, исключения, Path) кодирует JsonEncoder.default, последний рубеж — str.
+    """
+    cls = kwargs.get("cls")
+    default = kwargs.get("default") or (cls().default if cls else str)
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=default).decode()
+        except TypeError:  # например, не-строковые ключи в extra
+            pass
+    return json.dumps(obj, default=default, ensure_ascii=False)
+
+
+class _QueueHandler(QueueHandler):
+    """
+    QueueHandler, который не форматирует запись в потоке запроса.
+    Стандартный prepare() вызывает format() и теряет exc_info; мы только
+    подставляем аргументы в сообщение, а JSON собирается в потоке listener'а.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener: QueueListener | None = None
+
+
+def _stop_listener() -> None:
+    """Дописывает хвост очереди при завершении процесса."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
 def setup_json_logging(level: int = logging.INFO) -> None:
     """
     Инициализирует JSON-логирование для корневого логгера и uvicorn-логгеров.
+    Запись в stdout вынесена в отдельный поток (QueueHandler -> QueueListener),
+    поэтому обработчик запроса только кладёт запись в очередь.
     """
+    global _listener
+
     root = logging.getLogger()
     root.setLevel(level)
 
-    handler = logging.StreamHandler(sys.stdout)
+    stream_handler = logging.StreamHandler(sys.stdout)
     fmt = jsonlogger.JsonFormatter(
-        "%(asctime)s %(levelname)s %(name)s %(message)s %(request_id)s"
+        "%(asctime)s %(levelname)s %(name)s %(message)s %(request_id)s",
+        json_serializer=_json_dumps,
     )
-    handler.setFormatter(fmt)
+    stream_handler.setFormatter(fmt)
+
+    if _listener is None:
+        atexit.register(_stop_listener)
+    else:  # повторная инициализация (reload/тесты)
+        _listener.stop()
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+    # request_id берётся из contextvar, поэтому фильтр должен работать в потоке запроса
+    handler = _QueueHandler(log_queue)
     handler.addFilter(RequestIdFilter())
 
     # очистим существующие хэндлеры и установим наш
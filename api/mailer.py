@@ -0,0 +1,271 @@
+"""
+Доставка почты по SMTP с пулом соединений на процесс воркера.
+
+Одиночное письмо (send_email в jobs.py) берёт соединение из пула и возвращает его,
+поэтому соседние задачи того же воркера не открывают новую SMTP-сессию.
+Массовые рассылки кладут письма в Redis-список (queue_mail), а одна задача
+job_drain_mail вычитывает их пачками и отправляет через одно соединение.
+"""
+
+import json
+import logging
+import os
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from email.message import EmailMessage
+from typing import Any, Iterable, Iterator, Optional
+
+from metrics import MAIL_SENT, SMTP_CONNECTIONS, SMTP_SEND_LATENCY
+
+log = logging.getLogger("api.mailer")
+
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "1025"))
+SMTP_USER = os.getenv("SMTP_USER", "")
+SMTP_PASS = os.getenv("SMTP_PASS", "")
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "false").lower() in ("1", "true", "yes")
+SMTP_FROM = os.getenv("SMTP_FROM", "Tutor MVP <no-reply@tutor.local>")
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "10"))
+# Пул SMTP-сессий: простаивающих соединений на процесс, писем на соединение
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+SMTP_MAX_MESSAGES_PER_CONN = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONN", "500"))
+# и сколько секунд держать простаивающее (сервер обычно рвёт раньше 60)
+SMTP_MAX_IDLE = float(os.getenv("SMTP_MAX_IDLE", "30"))
+SMTP_RETRIES = int(os.getenv("SMTP_RETRIES", "3"))
+SMTP_BACKOFF_BASE = float(os.getenv("SMTP_BACKOFF_BASE", "0.5"))  # 0.5, 1, 2 ... сек
+
+MAIL_QUEUE_KEY = "mail:outgoing"  # LIST писем для job_drain_mail
+MAIL_DEAD_KEY = "mail:dead"  # письма, которые не удалось отправить за MAIL_MAX_ATTEMPTS
+MAIL_DRAIN_FLAG = "mail:drain:scheduled"
+MAIL_DRAIN_BATCH = int(os.getenv("MAIL_DRAIN_BATCH", "200"))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "5"))
+
+# Обрывы/таймауты (smtplib.SMTPException — тоже OSError) и ответы 4xx — временные:
+# письмо повторяется на новом соединении
+_TRANSIENT = (OSError,)
+
+SUBJECTS = {
+    "lesson_reminder": "Напоминание: урок завтра",
+    "weekly_digest": "Итоги недели",
+    "invoice_due": "Напоминание об оплате",
+}
+
+
+def render(template: str, to: str, payload: dict[str, Any]) -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"] = SMTP_FROM
+    msg["To"] = to
+    msg["Subject"] = SUBJECTS.get(template, template)
+    msg["X-Template"] = template
+    body = "\n".join(f"{k}: {v}" for k, v in payload.items())
+    msg.set_content(body or template)
+    return msg
+
+
+class _Conn:
+    __slots__ = ("smtp", "sent", "last_used")
+
+    def __init__(self, smtp: smtplib.SMTP) -> None:
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPPool:
+    """
+    Пул SMTP-соединений процесса. После fork (rq) соединения родителя не используются.
+    """
+
+    def __init__(self, size: int = SMTP_POOL_SIZE) -> None:
+        self.size = size
+        self._idle: list[_Conn] = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _connect(self) -> _Conn:
+        smtp = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        if SMTP_USE_TLS:
+            smtp.starttls()
+        if SMTP_USER:
+            smtp.login(SMTP_USER, SMTP_PASS)
+        SMTP_CONNECTIONS.inc()
+        return _Conn(smtp)
+
+    @staticmethod
+    def _close(conn: _Conn) -> None:
+        try:
+            conn.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            conn.smtp.close()
+
+    def _take_idle(self) -> Optional[_Conn]:
+        with self._lock:
+            if self._pid != os.getpid():
+                self._idle, self._pid = [], os.getpid()
+            while self._idle:
+                conn = self._idle.pop()
+                if time.monotonic() - conn.last_used < SMTP_MAX_IDLE:
+                    return conn
+                self._close(conn)
+        return None
+
+    @contextmanager
+    def connection(self) -> Iterator[_Conn]:
+        conn = self._take_idle() or self._connect()
+        try:
+            yield conn
+        except BaseException:
+            # состояние сессии неизвестно — в пул не возвращаем
+            conn.smtp.close()
+            raise
+        conn.last_used = time.monotonic()
+        with self._lock:
+            if conn.sent < SMTP_MAX_MESSAGES_PER_CONN and len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        self._close(conn)
+
+    def close_all(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._close(conn)
+
+
+pool = SMTPPool()
+
+
+def _backoff(attempt: int) -> None:
+    time.sleep(SMTP_BACKOFF_BASE * 2**attempt)
+
+
+def send_messages(
+    messages: list[EmailMessage],
+) -> tuple[list[EmailMessage], list[EmailMessage]]:
+    """
+    Отправляет письма подряд по одному соединению (переоткрывая его при обрыве).
+    Временные ошибки повторяются с backoff до SMTP_RETRIES раз.
+    Возвращает (rejected, undelivered): отвергнутые сервером навсегда (5xx) и
+    не отправленные из-за временных ошибок (их имеет смысл повторить позже).
+    """
+    rejected: list[EmailMessage] = []
+    undelivered: list[EmailMessage] = []
+    pending = list(messages)
+    attempt = 0
+    while pending:
+        try:
+            with pool.connection() as conn:
+                while pending:
+                    msg = pending[0]
+                    template = msg["X-Template"] or "unknown"
+                    start = time.perf_counter()
+                    try:
+                        conn.smtp.send_message(msg)
+                    except smtplib.SMTPResponseException as exc:
+                        if 400 <= exc.smtp_code < 500:
+                            raise
+                        # постоянная ошибка адресата/письма — дальше по списку
+                        pending.pop(0)
+                        rejected.append(msg)
+                        MAIL_SENT.labels(template=template, status="failed").inc()
+                        log.warning(
+                            "mail_rejected",
+                            extra={"to": msg["To"], "code": exc.smtp_code},
+                        )
+                        continue
+                    except smtplib.SMTPRecipientsRefused:
+                        pending.pop(0)
+                        rejected.append(msg)
+                        MAIL_SENT.labels(template=template, status="failed").inc()
+                        continue
+                    pending.pop(0)
+                    conn.sent += 1
+                    attempt = 0
+                    SMTP_SEND_LATENCY.observe(time.perf_counter() - start)
+                    MAIL_SENT.labels(template=template, status="sent").inc()
+        except _TRANSIENT as exc:
+            if attempt >= SMTP_RETRIES:
+                for msg in pending:
+                    MAIL_SENT.labels(
+                        template=msg["X-Template"] or "unknown", status="failed"
+                    ).inc()
+                log.error(
+                    "mail_send_failed",
+                    extra={"error": str(exc), "messages": len(pending)},
+                )
+                undelivered.extend(pending)
+                break
+            MAIL_SENT.labels(
+                template=pending[0]["X-Template"] or "unknown", status="retried"
+            ).inc()
+            _backoff(attempt)
+            attempt += 1
+    return rejected, undelivered
+
+
+def deliver(template: str, to: str, payload: dict[str, Any]) -> bool:
+    rejected, undelivered = send_messages([render(template, to, payload)])
+    return not (rejected or undelivered)
+
+
+# ===== Очередь писем в Redis для пакетной отправки =====
+
+
+def queue_mail(
+    redis_conn, items: Iterable[tuple[str, str, dict[str, Any]]], pipeline=None
+) -> int:
+    """
+    Кладёт письма (template, to, payload) в MAIL_QUEUE_KEY. Если передан pipeline —
+    команды добавляются в него (исполняет вызывающий). Задачу job_drain_mail ставит
+    jobs.queue_emails.
+    """
+    rows = [
+        json.dumps(
+            {"template": t, "to": to, "payload": p, "attempts": 0}, ensure_ascii=False
+        )
+        for t, to, p in items
+    ]
+    if rows:
+        (pipeline or redis_conn).rpush(MAIL_QUEUE_KEY, *rows)
+    return len(rows)
+
+
+def drain(
+    redis_conn, batch_size: int = MAIL_DRAIN_BATCH, max_batches: Optional[int] = None
+) -> int:
+    """Вычитывает письма пачками и отправляет через пул; возвращает число писем."""
+    sent = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        raw = redis_conn.lpop(MAIL_QUEUE_KEY, batch_size)
+        if not raw:
+            break
+        batches += 1
+        items = [json.loads(r) for r in raw]
+        messages = [render(it["template"], it["to"], it["payload"]) for it in items]
+        rejected, undelivered = send_messages(messages)
+        rejected_ids = {id(m) for m in rejected}
+        undelivered_ids = {id(m) for m in undelivered}
+        sent += len(messages) - len(rejected) - len(undelivered)
+
+        retry, dead = [], []
+        for it, msg in zip(items, messages):
+            if id(msg) in rejected_ids:
+                dead.append(json.dumps(it, ensure_ascii=False))
+            elif id(msg) in undelivered_ids:
+                it["attempts"] += 1
+                (dead if it["attempts"] >= MAIL_MAX_ATTEMPTS else retry).append(
+                    json.dumps(it, ensure_ascii=False)
+                )
+        if retry or dead:
+            with redis_conn.pipeline(transaction=False) as pipe:
+                if retry:
+                    pipe.rpush(MAIL_QUEUE_KEY, *retry)
+                if dead:
+                    pipe.rpush(MAIL_DEAD_KEY, *dead)
+                pipe.execute()
+            if retry and len(retry) == len(messages):
+                break  # вся пачка не ушла — SMTP лежит, не крутимся вхолостую
+    return sent
@@ -24,6 +24,8 @@ from routers import (
     lessons,
     student_bio,
     payments,
+    audit_log,
+    search,
 )
 
 # ==== Инициализация приложения ====
@@ -70,6 +72,8 @@ app.include_router(tournaments.router, prefix="/tournaments", tags=["tournaments
 
 app.include_router(payments.router, prefix="/finance", tags=["finance"])
 app.include_router(notifications.router, prefix="/notifications", tags=["notifications"])
+app.include_router(audit_log.router, prefix="/audit", tags=["audit"])
+app.include_router(search.router, prefix="/search", tags=["search"])
 
 # /metrics для Prometheus
 app.include_router(metrics_router, tags=["metrics"])
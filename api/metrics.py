@@ -1,14 +1,82 @@
+import atexit
+import os
+import shutil
+import socket
+from pathlib import Path
 from time import perf_counter
 from typing import Callable
 
 from fastapi import APIRouter, Request, Response
 from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
     Counter,
+    Gauge,
     Histogram,
     generate_latest,
+    multiprocess,
+    values,
     CONTENT_TYPE_LATEST,
 )
 
+# ===== Multiprocess-режим =====
+# Если задан PROMETHEUS_MULTIPROC_DIR, prometheus_client пишет значения каждого
+# процесса в mmap-файлы этой директории, а при скрейпе мы агрегируем их все. Каталог
+# общий для воркеров одного уровня (uvicorn-воркеры API или rq-воркеры) и должен
+# очищаться при старте.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+
+def process_id() -> str:
+    """
+    Имя файлов метрик процесса: "<hostname>-<pid>". Голого pid мало — каталог воркеров
+    общий для нескольких контейнеров, и в каждом из них процесс может быть PID 1.
+    Без "_": prometheus_client режет имя файла по "_".
+    """
+    return f"{socket.gethostname().replace('_', '-')}-{os.getpid()}"
+
+
+if MULTIPROC_DIR:
+    # до создания метрик ниже: ValueClass читается в конструкторе каждой метрики
+    values.ValueClass = values.MultiProcessValue(process_identifier=process_id)
+
+
+def prepare_multiproc_dir(path: str | None = MULTIPROC_DIR) -> None:
+    """Очищает/создаёт каталог метрик. Вызывать один раз ДО старта воркеров."""
+    if not path:
+        return
+    shutil.rmtree(path, ignore_errors=True)
+    Path(path).mkdir(parents=True, exist_ok=True)
+
+
+def mark_self_dead(path: str | None = MULTIPROC_DIR) -> None:
+    """
+    Убирает live-gauge файлы этого процесса при выходе (atexit). Живость чужих
+    процессов по pid не проверяем: у контейнеров разные PID namespace.
+    Файлы счётчиков/гистограмм остаются — иначе суммы counter'ов "откатывались"
+    бы назад после рестарта воркера.
+    """
+    if path and os.path.isdir(path):
+        multiprocess.mark_process_dead(process_id(), path)
+
+
+if MULTIPROC_DIR:
+    atexit.register(mark_self_dead)
+
+
+def build_registry(path: str | None = MULTIPROC_DIR) -> CollectorRegistry:
+    """Реестр для скрейпа: агрегат по каталогу в multiprocess-режиме или дефолтный."""
+    if not path:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=path)
+    return registry
+
+
+def render_latest(path: str | None = MULTIPROC_DIR) -> bytes:
+    return generate_latest(build_registry(path))
+
+
 # ===== Метрики =====
 HTTP_REQUESTS = Counter(
     "http_requests_total",
@@ -32,13 +100,143 @@ REQUEST_LATENCY = Histogram(
 
 # Бизнес-счётчики (используйте их в коде задач/почты)
 JOBS_SENT = Counter("jobs_sent_total", "Queued background jobs", labelnames=("kind",))
+# status: sent|failed|retried
 MAIL_SENT = Counter("mail_sent_total", "Emails sent", labelnames=("template", "status"))
+SMTP_CONNECTIONS = Counter(
+    "smtp_connections_opened_total", "SMTP sessions opened by mailer pools"
+)
+SMTP_SEND_LATENCY = Histogram(
+    "smtp_send_latency_seconds",
+    "Time to hand one message to the SMTP server",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+# Outbox фоновых задач (outbox.py, процесс-relay)
+OUTBOX_RELAYED = Counter(
+    "outbox_messages_total",
+    "Outbox messages processed by the relay",
+    labelnames=("kind", "status"),  # sent|duplicate|retry|failed
+)
+OUTBOX_PENDING = Gauge(
+    "outbox_pending",
+    "Outbox messages waiting to be relayed",
+    multiprocess_mode="livemax",
+)
+OUTBOX_LAG = Gauge(
+    "outbox_lag_seconds",
+    "Age of the oldest pending outbox message",
+    multiprocess_mode="livemax",
+)
+OUTBOX_BATCH_LATENCY = Histogram(
+    "outbox_batch_latency_seconds",
+    "Time to relay one outbox batch to Redis",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+# Хэширование паролей в пуле процессов (см. security.py)
+PASSWORD_HASH_LATENCY = Histogram(
+    "password_hash_latency_seconds",
+    "Argon2 hash/verify latency including pool queueing",
+    labelnames=("op",),  # hash|verify
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.35, 0.5, 1.0, 2.0, 5.0),
+)
+PASSWORD_HASH_INFLIGHT = Gauge(
+    "password_hash_inflight",
+    "Argon2 operations running or queued",
+    multiprocess_mode="livesum",
+)
+PASSWORD_HASH_REJECTED = Counter(
+    "password_hash_rejected_total",
+    "Argon2 operations rejected with 503 (pool saturated)",
+    labelnames=("op",),
+)
+
+# Аудит: буфер в памяти + пакетный сброс фоновым потоком (см. audit.py)
+AUDIT_EVENTS = Counter(
+    "audit_events_total",
+    "Audit events offered to the buffer",
+    labelnames=("status",),  # accepted|dropped
+)
+AUDIT_BUFFERED = Gauge(
+    "audit_buffer_events", "Audit events waiting for flush", multiprocess_mode="livesum"
+)
+AUDIT_FLUSH_LATENCY = Histogram(
+    "audit_flush_latency_seconds",
+    "Time to write one audit batch",
+    labelnames=("sink",),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+AUDIT_FLUSH_ERRORS = Counter(
+    "audit_flush_errors_total",
+    "Failed audit batch writes (events dropped)",
+    labelnames=("sink",),
+)
+
+# Кэш ответов (cache.py): route — имя из @cached / @conditional, не путь
+RESPONSE_CACHE_REQUESTS = Counter(
+    "response_cache_requests_total",
+    "Response cache lookups",
+    labelnames=(
+        "route",
+        "result",
+    ),  # hit_l1|hit_l2|miss|not_modified (ETag, @conditional)
+)
+RESPONSE_CACHE_EVICTIONS = Counter(
+    "response_cache_evictions_total",
+    "Response cache entries removed before expiry",
+    labelnames=("layer", "reason"),  # l1|l2, lru|invalidate
+)
+
+# ===== Ограничение кардинальности =====
+# Путь для запросов без совпавшего роута (404, отказ в лимитере и т.п.)
+OTHER_PATH = "other"
+# Сколько комбинаций лейблов допускаем на одну метрику,
+# прежде чем схлопывать path в "other"
+METRICS_MAX_SERIES = int(os.getenv("METRICS_MAX_SERIES", "1000"))
+
+
+class _SeriesGuard:
+    """Помнит выданные комбинации лейблов и отказывает новым сверх лимита."""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self._seen: set[tuple[str, ...]] = set()
+
+    def admit(self, labels: tuple[str, ...]) -> bool:
+        if labels in self._seen:
+            return True
+        if len(self._seen) >= self.limit:
+            return False
+        self._seen.add(labels)
+        return True
+
+
+_GUARDS = {
+    "requests": _SeriesGuard(METRICS_MAX_SERIES),
+    "latency": _SeriesGuard(METRICS_MAX_SERIES),
+    "exceptions": _SeriesGuard(METRICS_MAX_SERIES),
+}
+
+
+def _bounded(guard: str, path: str, *rest: str) -> str:
+    """Возвращает path, либо "other", если новая серия превысила бы лимит."""
+    if path != OTHER_PATH and not _GUARDS[guard].admit((path, *rest)):
+        return OTHER_PATH
+    return path
+
+
+def _route_path(scope) -> str:
+    """Шаблон совпавшего роута (/assignments/{assignment_id}/start) или "other"."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or OTHER_PATH
+
 
 # ===== Middleware измерения =====
 class MetricsMiddleware:
     """
     Измеряет латентность, считает запросы/ошибки.
-    Приводит path к "статическому" виду (без query); роут-параметры остаются как есть.
+    В лейбл path пишется шаблон роута, а не сырой путь, поэтому число серий
+    ограничено числом эндпоинтов; незнакомые пути попадают в "other".
     """
     def __init__(self, app):
         self.app = app
@@ -48,7 +246,6 @@ class MetricsMiddleware:
             return await self.app(scope, receive, send)
 
         method = scope.get("method", "GET")
-        path = scope.get("path", "/")
 
         start = perf_counter()
         status_holder = {"code": 500}
@@ -61,14 +258,21 @@ class MetricsMiddleware:
         try:
             await self.app(scope, receive, send_wrapper)
         except Exception:
-            HTTP_EXCEPTIONS.labels(path=path).inc()
-            HTTP_REQUESTS.labels(method=method, path=path, status="500").inc()
+            path = _route_path(scope)
+            HTTP_EXCEPTIONS.labels(path=_bounded("exceptions", path)).inc()
+            status_holder["code"] = 500
             raise
         finally:
             duration = perf_counter() - start
-            REQUEST_LATENCY.labels(method=method, path=path).observe(duration)
+            path = _route_path(scope)
+            status = str(status_holder["code"])
+            REQUEST_LATENCY.labels(
+                method=method, path=_bounded("latency", path, method)
+            ).observe(duration)
             HTTP_REQUESTS.labels(
-                method=method, path=path, status=str(status_holder["code"])
+                method=method,
+                path=_bounded("requests", path, method, status),
+                status=status,
             ).inc()
 
 # ===== /metrics =====
@@ -76,5 +280,5 @@ router = APIRouter()
 
 @router.get("/metrics")
 def metrics() -> Response:
-    content = generate_latest()
+    content = render_latest()
     return Response(content=content, media_type=CONTENT_TYPE_LATEST)
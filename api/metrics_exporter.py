@@ -0,0 +1,39 @@
+"""
+Отдельный exporter метрик для уровня воркеров (rq worker).
+
+RQ-воркеры не обслуживают HTTP, поэтому их счётчики (MAIL_SENT и т.п.) пишутся
+в общий PROMETHEUS_MULTIPROC_DIR, а этот процесс агрегирует их и отдаёт /metrics.
+
+    python metrics_exporter.py prepare   # очистить каталог (до старта воркеров)
+    python metrics_exporter.py serve     # HTTP-экспортер на METRICS_EXPORTER_PORT
+"""
+
+import os
+import sys
+from wsgiref.simple_server import make_server
+
+from prometheus_client import make_wsgi_app
+
+from metrics import MULTIPROC_DIR, build_registry, prepare_multiproc_dir
+
+EXPORTER_PORT = int(os.getenv("METRICS_EXPORTER_PORT", "9101"))
+
+
+def serve(port: int = EXPORTER_PORT) -> None:
+    if not MULTIPROC_DIR:
+        raise SystemExit("PROMETHEUS_MULTIPROC_DIR is not set")
+
+    httpd = make_server("", port, make_wsgi_app(build_registry()))
+    print(f"Worker metrics exporter on :{port} (dir={MULTIPROC_DIR})")
+    httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "serve"
+    if cmd == "prepare":
+        prepare_multiproc_dir()
+        print(f"Prepared {MULTIPROC_DIR}")
+    elif cmd == "serve":
+        serve()
+    else:
+        raise SystemExit(f"Unknown command {cmd!r} (use prepare|serve)")
@@ -1,10 +1,20 @@
 from __future__ import annotations
-from datetime import datetime
+from datetime import date, datetime
 from typing import List, Optional
 
 from sqlalchemy.orm import declarative_base, Mapped, mapped_column, relationship
 from sqlalchemy import (
-    Integer, String, Text, ForeignKey, DateTime, Numeric, Date
+    Integer,
+    String,
+    Text,
+    ForeignKey,
+    DateTime,
+    Numeric,
+    Date,
+    JSON,
+    Index,
+    UniqueConstraint,
+    Float,
 )
 
 Base = declarative_base()
@@ -89,14 +99,32 @@ class Submission(Base):
 
     assignment: Mapped[Assignment] = relationship(back_populates="submissions")
 
+
+class StudentBio(Base):
+    __tablename__ = "student_bio"  # миграция 0003
+    student_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("student_profile.id", ondelete="CASCADE"), primary_key=True
+    )
+    started_at: Mapped[Optional[date]] = mapped_column(Date, default=None)
+    goals: Mapped[Optional[str]] = mapped_column(Text, default=None)
+    strengths: Mapped[Optional[str]] = mapped_column(Text, default=None)
+    weaknesses: Mapped[Optional[str]] = mapped_column(Text, default=None)
+    notes: Mapped[Optional[str]] = mapped_column(Text, default=None)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
 class ErrorHotspot(Base):
     __tablename__ = "error_hotspot"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     student_id: Mapped[int] = mapped_column(ForeignKey("student_profile.id"))
     topic_id: Mapped[int] = mapped_column(ForeignKey("topic.id"))
-    heat: Mapped[int] = mapped_column(Integer, default=0)
+    heat: Mapped[float] = mapped_column(Float, default=0)  # на момент updated_at
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        UniqueConstraint("student_id", "topic_id", name="uq_hotspot_student_topic"),
+    )
+
 class AvatarTheme(Base):
     __tablename__ = "avatar_theme"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -169,3 +197,70 @@ class Payment(Base):
     method: Mapped[Optional[str]] = mapped_column(String, default=None)  # cash|transfer|card
     paid_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=None)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+# ===== ЭТАП 3: АУДИТ =====
+
+
+class AuditEvent(Base):
+    __tablename__ = "audit_event"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    action: Mapped[str] = mapped_column(String)
+    request_id: Mapped[Optional[str]] = mapped_column(String, default=None)
+    # без FK: аудит переживает удаление ученика
+    student_id: Mapped[Optional[int]] = mapped_column(Integer, default=None)
+    payload: Mapped[dict] = mapped_column(JSON, default=dict)
+
+    __table_args__ = (
+        Index("idx_audit_created", "created_at"),
+        Index("idx_audit_action_created", "action", "created_at"),
+        Index("idx_audit_student_created", "student_id", "created_at"),
+    )
+
+
+# ===== ЭТАП 3: ДНЕВНЫЕ РОЛЛАПЫ АНАЛИТИКИ =====
+
+
+class StudentDailyStats(Base):
+    """Счётчики ученика за сутки (UTC); ведутся инкрементально, см. rollups.py."""
+
+    __tablename__ = "student_daily_stats"
+    student_id: Mapped[int] = mapped_column(
+        ForeignKey("student_profile.id"), primary_key=True
+    )
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    submissions: Mapped[int] = mapped_column(Integer, default=0)
+    graded: Mapped[int] = mapped_column(Integer, default=0)  # сабмиты с оценкой
+    grade_sum: Mapped[float] = mapped_column(Float, default=0)  # / graded = средняя
+    late: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class TutorCounters(Base):
+    """Денормализованные счётчики для шапки дашборда; ведутся триггерами БД."""
+
+    __tablename__ = "tutor_counters"
+    tutor_id: Mapped[int] = mapped_column(ForeignKey("user.id"), primary_key=True)
+    students_count: Mapped[int] = mapped_column(Integer, default=0)
+    lessons_count: Mapped[int] = mapped_column(Integer, default=0)
+
+
+# ===== ЭТАП 3: OUTBOX ФОНОВЫХ ЗАДАЧ =====
+
+
+class OutboxMessage(Base):
+    __tablename__ = "outbox_message"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    kind: Mapped[str] = mapped_column(String)  # lesson_reminder|invoice_due
+    dedupe_key: Mapped[str] = mapped_column(String, unique=True)  # RQ id "outbox:<key>"
+    payload: Mapped[dict] = mapped_column(JSON, default=dict)  # kwargs задачи
+    # None — в очередь сразу
+    run_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=None)
+    status: Mapped[str] = mapped_column(String, default="pending")  # sent|failed
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=None)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, default=None)
+
+    __table_args__ = (Index("idx_outbox_status_next", "status", "next_attempt_at"),)
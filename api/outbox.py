@@ -0,0 +1,208 @@
+"""
+Transactional outbox для фоновых задач.
+
+API не ходит в Redis на запись: эндпоинт добавляет OutboxMessage в ту же транзакцию,
+что и доменную строку (урок, счёт), а отдельный процесс-relay пачками переносит
+сообщения в RQ / rq-scheduler.
+
+    python outbox.py    # relay (см. сервис outbox-relay в docker-compose.yml)
+
+Гарантии: сообщение появляется в Redis тогда и только тогда, когда закоммичена
+доменная транзакция. Id задачи RQ = "outbox:<dedupe_key>", поэтому повтор после
+сбоя relay между Redis и коммитом отметки "sent" задачу не дублирует.
+"""
+
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from redis.exceptions import RedisError
+from rq.job import Job
+from sqlalchemy import delete, func, select
+
+from deps import SessionLocal
+from jobs import (
+    job_invoice_due_reminder,
+    job_lesson_reminder,
+    redis_conn,
+    schedule_many,
+)
+from metrics import OUTBOX_BATCH_LATENCY, OUTBOX_LAG, OUTBOX_PENDING, OUTBOX_RELAYED
+from models import OutboxMessage
+
+log = logging.getLogger("api.outbox")
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+# пауза (сек) между опросами, когда очередь пуста
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "0.5"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "1.0"))  # 1, 2, 4, ... сек
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "300"))
+OUTBOX_STATS_INTERVAL = float(os.getenv("OUTBOX_STATS_INTERVAL", "5"))
+# сколько часов хранить отправленные сообщения
+OUTBOX_RETENTION_HOURS = int(os.getenv("OUTBOX_RETENTION_HOURS", "24"))
+
+# kind -> функция задачи; payload сообщения = kwargs
+KINDS = {
+    "lesson_reminder": job_lesson_reminder,
+    "invoice_due": job_invoice_due_reminder,
+}
+
+
+def _naive_utc(dt: Optional[datetime]) -> Optional[datetime]:
+    if dt is None or dt.tzinfo is None:
+        return dt
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def outbox_row(
+    kind: str, key: str, payload: dict[str, Any], run_at: Optional[datetime] = None
+) -> dict[str, Any]:
+    """Строка для insert(OutboxMessage) — для пакетной вставки (см. /lessons/bulk)."""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown outbox kind {kind!r}")
+    now = datetime.utcnow()
+    return {
+        "created_at": now,
+        "kind": kind,
+        "dedupe_key": key,
+        "payload": payload,
+        "run_at": _naive_utc(run_at),
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": now,
+    }
+
+
+def outbox_add(
+    db, kind: str, key: str, payload: dict[str, Any], run_at: Optional[datetime] = None
+) -> None:
+    """
+    Добавляет сообщение в текущую транзакцию сессии (sync или async);
+    commit делает вызывающий.
+    """
+    db.add(OutboxMessage(**outbox_row(kind, key, payload, run_at)))
+
+
+def _job_id(m: OutboxMessage) -> str:
+    return f"outbox:{m.dedupe_key}"
+
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(
+        seconds=min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1))
+    )
+
+
+def relay_once(batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """Переносит одну пачку готовых сообщений в Redis. Возвращает размер пачки."""
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        rows = (
+            db.execute(
+                select(OutboxMessage)
+                .where(
+                    OutboxMessage.status == "pending",
+                    OutboxMessage.next_attempt_at <= now,
+                )
+                .order_by(OutboxMessage.id)
+                .limit(batch_size)
+                # несколько relay не возьмут одни и те же строки (в SQLite игнорируется)
+                .with_for_update(skip_locked=True)
+            )
+            .scalars()
+            .all()
+        )
+        if not rows:
+            return 0
+
+        start = time.perf_counter()
+        unknown = [m for m in rows if m.kind not in KINDS]
+        known = [m for m in rows if m.kind in KINDS]
+        try:
+            with redis_conn.pipeline(transaction=False) as pipe:
+                for m in known:
+                    pipe.exists(Job.key_for(_job_id(m)))
+                exists = pipe.execute()
+            fresh: dict[str, list[OutboxMessage]] = {}
+            for m, seen in zip(known, exists):
+                if seen:
+                    OUTBOX_RELAYED.labels(kind=m.kind, status="duplicate").inc()
+                else:
+                    fresh.setdefault(m.kind, []).append(m)
+            for kind, batch in fresh.items():
+                schedule_many(
+                    kind,
+                    ((m.run_at, KINDS[kind], m.payload, _job_id(m)) for m in batch),
+                )
+                OUTBOX_RELAYED.labels(kind=kind, status="sent").inc(len(batch))
+        except (RedisError, OSError) as exc:
+            # часть пачки могла уйти — при повторе её отсеет проверка id задачи
+            for m in known:
+                m.attempts += 1
+                m.last_error = str(exc)
+                if m.attempts >= OUTBOX_MAX_ATTEMPTS:
+                    m.status = "failed"
+                    OUTBOX_RELAYED.labels(kind=m.kind, status="failed").inc()
+                else:
+                    m.next_attempt_at = now + _backoff(m.attempts)
+                    OUTBOX_RELAYED.labels(kind=m.kind, status="retry").inc()
+            log.warning(
+                "outbox_relay_failed", extra={"error": str(exc), "messages": len(known)}
+            )
+            known = []
+
+        for m in known:
+            m.status = "sent"
+            m.sent_at = now
+        for m in unknown:
+            m.status = "failed"
+            m.last_error = f"unknown kind {m.kind!r}"
+            OUTBOX_RELAYED.labels(kind=m.kind, status="failed").inc()
+        db.commit()
+        OUTBOX_BATCH_LATENCY.observe(time.perf_counter() - start)
+        return len(rows)
+
+
+def update_stats() -> None:
+    """Метрики очереди и чистка отправленных сообщений старше OUTBOX_RETENTION_HOURS."""
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        pending, oldest = db.execute(
+            select(func.count(), func.min(OutboxMessage.created_at)).where(
+                OutboxMessage.status == "pending"
+            )
+        ).one()
+        db.execute(
+            delete(OutboxMessage).where(
+                OutboxMessage.status == "sent",
+                OutboxMessage.sent_at < now - timedelta(hours=OUTBOX_RETENTION_HOURS),
+            )
+        )
+        db.commit()
+    OUTBOX_PENDING.set(pending)
+    OUTBOX_LAG.set((now - oldest).total_seconds() if oldest else 0)
+
+
+def run() -> None:
+    last_stats = 0.0
+    while True:
+        try:
+            n = relay_once()
+            if time.monotonic() - last_stats >= OUTBOX_STATS_INTERVAL:
+                update_stats()
+                last_stats = time.monotonic()
+        except Exception:  # БД недоступна и т.п. — relay не должен падать
+            log.exception("outbox_relay_loop_failed")
+            n = 0
+        if n < OUTBOX_BATCH_SIZE:
+            time.sleep(OUTBOX_POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    from logging_config import setup_json_logging
+
+    setup_json_logging()
+    run()
@@ -1,24 +1,66 @@
+import asyncio
+import logging
 import os
 import time
-import hashlib
+from collections import OrderedDict
 from typing import Callable, Optional
 
-import redis
-from fastapi import Request, Response, HTTPException
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+from starlette.types import Scope
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-_r = redis.from_url(REDIS_URL)
+
+# Параметры из окружения (см. .env.sample); аргументы конструктора их перекрывают
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", "5"))
+RATE_LIMIT_CAPACITY = int(os.getenv("RATE_LIMIT_CAPACITY", "20"))
+RATE_LIMIT_TTL_SECONDS = int(os.getenv("RATE_LIMIT_TTL_SECONDS", "60"))
+RATE_LIMIT_EXCLUDE = [
+    p
+    for p in os.getenv(
+        "RATE_LIMIT_EXCLUDE", "/health,/metrics,/docs,/openapi.json"
+    ).split(",")
+    if p
+]
+# Redis не должен добавлять к запросу больше нескольких миллисекунд даже при деградации
+RATE_LIMIT_REDIS_TIMEOUT = float(os.getenv("RATE_LIMIT_REDIS_TIMEOUT", "0.05"))
+# Как часто локальные вёдра сверяются с общим ведром в Redis
+RATE_LIMIT_SYNC_INTERVAL = float(os.getenv("RATE_LIMIT_SYNC_INTERVAL", "0.2"))
+
+log = logging.getLogger("api.rate_limit")
+
+_r = aioredis.from_url(
+    REDIS_URL,
+    socket_timeout=RATE_LIMIT_REDIS_TIMEOUT,
+    socket_connect_timeout=RATE_LIMIT_REDIS_TIMEOUT,
+)
+
+
+class _LocalBucket:
+    __slots__ = ("tokens", "ts", "pending")
+
+    def __init__(self, tokens: float, ts: float) -> None:
+        self.tokens = tokens
+        self.ts = ts
+        self.pending = 0  # списано локально, но ещё не отправлено в Redis
+
 
 class RateLimitMiddleware:
     """
-    Простой token-bucket в Redis.
+    Token-bucket с локальной предпроверкой и фоновой сверкой с Redis.
+    Каждый воркер держит собственное ведро на ключ и отвечает 429 без похода в Redis;
+    раз в sync_interval накопленные списания одним pipeline уходят в общий Lua-бакет,
+    а его остаток ограничивает локальное ведро (так лимит соблюдается между воркерами).
     Параметры:
       - rate: скорость пополнения (токенов в секунду)
       - capacity: размер ведра
-      - key_fn: функция формирования ключа (по умолчанию IP; можно по токену)
+      - key_fn: функция формирования ключа по ASGI scope (по умолчанию IP)
       - include_paths / exclude_paths: фильтры по путям
+      - sync_interval: период сверки с Redis (сек)
+      - max_keys: сколько локальных вёдер держим в памяти (LRU)
     """
 
+    # Списывает пачку токенов (не уходя ниже нуля) и возвращает остаток общего ведра.
     LUA = """
     local key = KEYS[1]
     local now = tonumber(ARGV[1])
@@ -38,52 +80,114 @@ class RateLimitMiddleware:
 
     local delta = math.max(0, now - ts)
     local filled = math.min(capacity, tokens + delta * rate)
-    local allowed = 0
-    if filled >= requested then
-        tokens = filled - requested
-        allowed = 1
-    else
-        tokens = filled
-        allowed = 0
-    end
+    tokens = math.max(0, filled - requested)
 
-    redis.call("HMSET", key, "tokens", tokens, "ts", now)
+    redis.call("HSET", key, "tokens", tokens, "ts", now)
     redis.call("EXPIRE", key, ttl)
-    return {allowed, tokens}
+    return tostring(tokens)
     """
 
     def __init__(
         self,
         app,
-        rate: float = 5.0,      # 5 rps
-        capacity: int = 20,     # burst=20
+        rate: float = RATE_LIMIT_RATE,
+        capacity: int = RATE_LIMIT_CAPACITY,
         requested: int = 1,
-        ttl_seconds: int = 60,
+        ttl_seconds: int = RATE_LIMIT_TTL_SECONDS,
         include_paths: Optional[list[str]] = None,
         exclude_paths: Optional[list[str]] = None,
-        key_fn: Optional[Callable[[Request], str]] = None,
+        key_fn: Optional[Callable[[Scope], str]] = None,
+        sync_interval: float = RATE_LIMIT_SYNC_INTERVAL,
+        max_keys: int = 100_000,
     ):
         self.app = app
         self.rate = rate
         self.capacity = capacity
         self.requested = requested
         self.ttl = ttl_seconds
-        self.include_paths = include_paths or []
-        self.exclude_paths = exclude_paths or ["/health", "/metrics", "/docs", "/openapi.json"]
+        self.include_paths = tuple(include_paths or [])
+        self.exclude_paths = tuple(exclude_paths or RATE_LIMIT_EXCLUDE)
         self.key_fn = key_fn or self._key_by_ip
+        self.sync_interval = sync_interval
+        self.max_keys = max_keys
+
+        self._buckets: "OrderedDict[str, _LocalBucket]" = OrderedDict()
+        self._last_sync = 0.0
+        self._sync_task: Optional[asyncio.Task] = None
         self._script = _r.register_script(self.LUA)
 
-    def _key_by_ip(self, req: Request) -> str:
-        ip = req.client.host if req.client else "unknown"
-        return "rl:" + hashlib.sha1(ip.encode()).hexdigest()
+    @staticmethod
+    def _key_by_ip(scope: Scope) -> str:
+        client = scope.get("client")
+        return "rl:" + (client[0] if client else "unknown")
 
     def _should_check(self, path: str) -> bool:
-        if any(path.startswith(p) for p in self.exclude_paths):
+        if path.startswith(self.exclude_paths):
             return False
         if self.include_paths:
-            return any(path.startswith(p) for p in self.include_paths)
+            return path.startswith(self.include_paths)
         return True  # если include пуст — лимитируем всё, кроме исключений
 
+    def _take(self, key: str, now: float) -> Optional[float]:
+        """Списывает токены из локального ведра; None — лимит исчерпан."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _LocalBucket(float(self.capacity), now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket.tokens = min(
+                self.capacity, bucket.tokens + (now - bucket.ts) * self.rate
+            )
+            bucket.ts = now
+
+        if bucket.tokens < self.requested:
+            return None
+        bucket.tokens -= self.requested
+        bucket.pending += self.requested
+        return bucket.tokens
+
+    def _maybe_schedule_sync(self, now: float) -> None:
+        if now - self._last_sync < self.sync_interval:
+            return
+        if self._sync_task is not None and not self._sync_task.done():
+            return
+        self._last_sync = now
+        self._sync_task = asyncio.get_running_loop().create_task(self._sync())
+
+    async def _sync(self) -> None:
+        """Одним pipeline отправляет накопленные списания в общий бакет Redis."""
+        batch = [(key, b.pending) for key, b in self._buckets.items() if b.pending]
+        if not batch:
+            return
+        for key, _ in batch:
+            self._buckets[key].pending = 0
+
+        try:
+            async with _r.pipeline(transaction=False) as pipe:
+                now = time.time()
+                for key, spent in batch:
+                    await self._script(
+                        keys=[key],
+                        args=[now, self.rate, self.capacity, spent, self.ttl],
+                        client=pipe,
+                    )
+                remaining = await pipe.execute()
+        except (RedisError, OSError, asyncio.TimeoutError) as exc:
+            # Redis недоступен — продолжаем жить на локальных вёдрах (fail-open)
+            log.warning(
+                "rate_limit_sync_failed", extra={"error": str(exc), "keys": len(batch)}
+            )
+            return
+
+        for (key, _), shared in zip(batch, remaining):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                # другие воркеры тоже тратят общее ведро —
+                # локально не можем иметь больше
+                bucket.tokens = min(bucket.tokens, float(shared))
+
     async def __call__(self, scope, receive, send):
         if scope["type"] != "http":
             return await self.app(scope, receive, send)
@@ -92,30 +196,32 @@ class RateLimitMiddleware:
         if not self._should_check(path):
             return await self.app(scope, receive, send)
 
-        # формируем ключ
-        req = Request(scope, receive=receive)
-        key = self.key_fn(req)
+        now = time.monotonic()
+        tokens = self._take(self.key_fn(scope), now)
+        self._maybe_schedule_sync(now)
 
-        now = int(time.time())
-        allowed, tokens = self._script(
-            keys=[key],
-            args=[now, self.rate, self.capacity, self.requested, self.ttl],
-        )
+        if tokens is not None:
+            remaining = str(int(tokens)).encode()
 
-        if int(allowed) == 1:
             # прокидываем оставшиеся токены в заголовки ответа
             async def send_wrapper(message):
                 if message["type"] == "http.response.start":
                     headers = message.setdefault("headers", [])
-                    headers.append((b"x-rate-remaining", str(int(tokens)).encode()))
+                    headers.append((b"x-rate-remaining", remaining))
                 await send(message)
             return await self.app(scope, receive, send_wrapper)
-        else:
-            # 429 Too Many Requests
-            resp = Response(
-                content='{"detail":"Too Many Requests"}',
-                status_code=429,
-                media_type="application/json",
-                headers={"Retry-After": "1"},
-            )
-            return await resp(scope, receive, send)
+
+        # 429 Too Many Requests — без похода в Redis и без сборки Request/Response
+        body = b'{"detail":"Too Many Requests"}'
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", b"1"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,68 @@
+"""
+Быстрый JSON для списков: Core-строки вместо ORM-объектов
+и orjson вместо jsonable_encoder.
+
+Списочные эндпоинты выбирают только нужные колонки (select(*колонки), без
+гидрации ORM) и отдают готовый Response — FastAPI не прогоняет результат через
+jsonable_encoder и response_model. orjson сам кодирует datetime/date/UUID;
+Decimal (суммы в finance) отдаём числом, как и раньше делал jsonable_encoder.
+Без orjson — stdlib json с тем же форматом.
+"""
+
+import json
+from decimal import Decimal
+from typing import Any, Iterable, Optional, Sequence
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import Row
+
+try:  # orjson заметно быстрее stdlib json; без него просто откатываемся
+    import orjson
+except ImportError:  # pragma: no cover - опциональная зависимость
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    # orjson зовёт default только для типов, которых не знает сам
+    if isinstance(obj, Decimal):
+        return float(obj)
+    return jsonable_encoder(obj)
+
+
+def _stdlib_default(obj: Any) -> Any:
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    return _default(obj)
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        obj, default=_stdlib_default, ensure_ascii=False, separators=(",", ":")
+    ).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse через dumps(): содержимое уже из простых типов."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def row_dicts(rows: Sequence[Row]) -> list[dict[str, Any]]:
+    """Core-строки -> список dict; ключи — имена (label) колонок select'а."""
+    if not rows:
+        return []
+    keys = tuple(rows[0]._fields)
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def page_response(
+    items: Iterable[dict[str, Any]], total: Optional[int], next_cursor: Optional[str]
+) -> FastJSONResponse:
+    """Ответ списочного эндпоинта в общем формате {total, items, next_cursor}."""
+    return FastJSONResponse(
+        {"total": total, "items": list(items), "next_cursor": next_cursor}
+    )
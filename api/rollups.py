@@ -0,0 +1,269 @@
+"""
+Дневные роллапы аналитики ученика (StudentDailyStats).
+
+Пишущие эндпоинты прибавляют счётчики в той же транзакции, что и доменное
+изменение (submit, mark_late), через INSERT ... ON CONFLICT DO UPDATE
+SET x = x + excluded.x. /analytics/tempo и /analytics/exam-forecast читают только
+роллапы, поэтому их стоимость не зависит от длины истории сабмитов.
+
+Там же — счётчики тьютора для шапки дашборда (TutorCounters: ученики, уроки).
+Их ведут триггеры БД на student_profile и lesson (Postgres — миграция 0012,
+SQLite — install_sqlite() при старте), поэтому счётчики не расходятся с данными
+и при записи мимо API: сиды, импорты, ручные правки.
+
+Пересборка из истории (после миграции или при расхождениях):
+    python scripts/backfill_rollups.py
+"""
+
+from datetime import date, datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, func, insert, literal, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from models import (
+    Assignment,
+    Lesson,
+    Student,
+    StudentDailyStats,
+    Submission,
+    TutorCounters,
+)
+from sqlutils import dialect_insert
+
+COUNTERS = ("submissions", "graded", "grade_sum", "late")
+TUTOR_COUNTERS = ("students_count", "lessons_count")
+
+
+def today() -> date:
+    return datetime.utcnow().date()
+
+
+def _additive_upsert(
+    db, model, keys: tuple[str, ...], counters: tuple[str, ...], rows: Iterable[dict]
+):
+    """
+    INSERT ... ON CONFLICT (keys) DO UPDATE SET c = c + excluded.c для каждого счётчика.
+    Строки с одинаковым ключом складываются заранее — одна строка VALUES на ключ.
+    None, если прибавлять нечего. Исполняет вызывающий (sync или async сессия).
+    """
+    merged: dict[tuple, dict] = {}
+    for row in rows:
+        key = tuple(row[k] for k in keys)
+        acc = merged.setdefault(
+            key, {**dict(zip(keys, key)), **{c: 0 for c in counters}}
+        )
+        for c in counters:
+            acc[c] += row.get(c, 0)
+    if not merged:
+        return None
+    ins = dialect_insert(db, model).values(list(merged.values()))
+    return ins.on_conflict_do_update(
+        index_elements=[getattr(model, k) for k in keys],
+        set_={c: getattr(model, c) + getattr(ins.excluded, c) for c in counters},
+    )
+
+
+def bump_many(db: Session, rows: Iterable[dict]) -> None:
+    """
+    Прибавляет дневные счётчики:
+    rows — [{student_id, day, submissions?, graded?, grade_sum?, late?}].
+    Commit делает вызывающий.
+    """
+    stmt = _additive_upsert(
+        db, StudentDailyStats, ("student_id", "day"), COUNTERS, rows
+    )
+    if stmt is not None:
+        db.execute(stmt)
+
+
+def submission_row(
+    student_id: int, grade: Optional[float], day: Optional[date] = None
+) -> dict:
+    graded = grade is not None
+    return {
+        "student_id": student_id,
+        "day": day or today(),
+        "submissions": 1,
+        "graded": int(graded),
+        "grade_sum": float(grade) if graded else 0.0,
+    }
+
+
+def late_row(student_id: int, day: Optional[date] = None) -> dict:
+    return {"student_id": student_id, "day": day or today(), "late": 1}
+
+
+def backfill(db: Session, student_id: Optional[int] = None) -> int:
+    """
+    Пересобирает роллапы из submission/assignment (всё или одного ученика)
+    одной транзакцией.
+    Момента пометки «late» история не хранит — такие задания относятся ко дню due_at
+    (или created_at, если срока нет). Возвращает число строк роллапа.
+    """
+    sub_day = func.date(Submission.completed_at)
+    subs = (
+        select(
+            Assignment.student_id.label("student_id"),
+            sub_day.label("day"),
+            func.count(Submission.id).label("submissions"),
+            func.count(Submission.grade).label("graded"),
+            func.coalesce(func.sum(Submission.grade), 0).label("grade_sum"),
+            literal(0).label("late"),
+        )
+        .join(Assignment, Assignment.id == Submission.assignment_id)
+        .where(Submission.completed_at.is_not(None))
+        .group_by(Assignment.student_id, sub_day)
+    )
+    late_day = func.date(func.coalesce(Assignment.due_at, Assignment.created_at))
+    late = (
+        select(
+            Assignment.student_id.label("student_id"),
+            late_day.label("day"),
+            literal(0).label("submissions"),
+            literal(0).label("graded"),
+            literal(0).label("grade_sum"),
+            func.count(Assignment.id).label("late"),
+        )
+        .where(Assignment.status == "late")
+        .group_by(Assignment.student_id, late_day)
+    )
+    if student_id is not None:
+        subs = subs.where(Assignment.student_id == student_id)
+        late = late.where(Assignment.student_id == student_id)
+
+    both = subs.union_all(late).subquery()
+    merged = select(
+        both.c.student_id,
+        both.c.day,
+        func.sum(both.c.submissions),
+        func.sum(both.c.graded),
+        func.sum(both.c.grade_sum),
+        func.sum(both.c.late),
+    ).group_by(both.c.student_id, both.c.day)
+
+    wipe = delete(StudentDailyStats)
+    count = select(func.count()).select_from(StudentDailyStats)
+    if student_id is not None:
+        wipe = wipe.where(StudentDailyStats.student_id == student_id)
+        count = count.where(StudentDailyStats.student_id == student_id)
+    db.execute(wipe)
+    db.execute(
+        insert(StudentDailyStats).from_select(["student_id", "day", *COUNTERS], merged)
+    )
+    total = db.scalar(count)
+    db.commit()
+    return total
+
+
+def tutor_counters_select():
+    """(tutor_id, students_count, lessons_count) полным COUNT по ученикам и урокам."""
+    return (
+        select(
+            Student.tutor_id,
+            func.count(func.distinct(Student.id)),
+            func.count(Lesson.id),
+        )
+        .outerjoin(Lesson, Lesson.student_id == Student.id)
+        .where(Student.tutor_id.is_not(None))
+        .group_by(Student.tutor_id)
+    )
+
+
+def rebuild_tutor_counters(db: Session) -> int:
+    """Пересчитывает TutorCounters с нуля (если триггеры когда-то отключали)."""
+    db.execute(delete(TutorCounters))
+    db.execute(
+        insert(TutorCounters).from_select(
+            ["tutor_id", *TUTOR_COUNTERS], tutor_counters_select()
+        )
+    )
+    total = db.scalar(select(func.count()).select_from(TutorCounters))
+    db.commit()
+    return total
+
+
+# ===== Счётчики тьютора: триггеры SQLite =====
+
+
+def _tutor_bump_sql(tutor: str, students: int | str, lessons: int | str) -> str:
+    """Прибавка к счётчикам тьютора из выражения tutor (NULL — пропускаем)."""
+    # WHERE обязателен: без него SQLite путает ON CONFLICT с JOIN ... ON
+    return (
+        "INSERT INTO tutor_counters (tutor_id, students_count, lessons_count) "
+        f"SELECT t, {students}, {lessons} FROM (SELECT {tutor} AS t) "
+        "WHERE t IS NOT NULL "
+        "ON CONFLICT (tutor_id) DO UPDATE SET "
+        "students_count = students_count + excluded.students_count, "
+        "lessons_count = lessons_count + excluded.lessons_count"
+    )
+
+
+_LESSON_TUTOR = "(SELECT tutor_id FROM student_profile WHERE id = {r}.student_id)"
+_STUDENT_LESSONS = "(SELECT count(*) FROM lesson WHERE student_id = {r}.id)"
+
+_SQLITE_TRIGGERS = (
+    (
+        "student_profile_ai",
+        "AFTER INSERT ON student_profile",
+        [_tutor_bump_sql("NEW.tutor_id", 1, 0)],
+    ),
+    (
+        "student_profile_ad",
+        "AFTER DELETE ON student_profile",
+        [_tutor_bump_sql("OLD.tutor_id", -1, 0)],
+    ),
+    (
+        # ученик переходит к другому тьютору вместе со своими уроками
+        "student_profile_au",
+        "AFTER UPDATE OF tutor_id ON student_profile",
+        [
+            _tutor_bump_sql("OLD.tutor_id", -1, "-" + _STUDENT_LESSONS.format(r="OLD")),
+            _tutor_bump_sql("NEW.tutor_id", 1, _STUDENT_LESSONS.format(r="NEW")),
+        ],
+    ),
+    (
+        "lesson_ai",
+        "AFTER INSERT ON lesson",
+        [_tutor_bump_sql(_LESSON_TUTOR.format(r="NEW"), 0, 1)],
+    ),
+    (
+        "lesson_ad",
+        "AFTER DELETE ON lesson",
+        [_tutor_bump_sql(_LESSON_TUTOR.format(r="OLD"), 0, -1)],
+    ),
+    (
+        "lesson_au",
+        "AFTER UPDATE OF student_id ON lesson",
+        [
+            _tutor_bump_sql(_LESSON_TUTOR.format(r="OLD"), 0, -1),
+            _tutor_bump_sql(_LESSON_TUTOR.format(r="NEW"), 0, 1),
+        ],
+    ),
+)
+
+
+def install_sqlite(conn: Connection) -> bool:
+    """
+    Создаёт триггеры счётчиков тьютора, если их ещё нет, и пересчитывает счётчики
+    по текущим данным. True — триггеры созданы сейчас.
+    """
+    exists = conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master "
+        "WHERE type = 'trigger' AND name = 'trg_tutor_counters_lesson_ai'"
+    ).first()
+    if exists:
+        return False
+    for name, event, body in _SQLITE_TRIGGERS:
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER trg_tutor_counters_{name} {event} "
+            f"BEGIN {'; '.join(body)}; END"
+        )
+    conn.execute(delete(TutorCounters))
+    conn.execute(
+        insert(TutorCounters).from_select(
+            ["tutor_id", *TUTOR_COUNTERS], tutor_counters_select()
+        )
+    )
+    return True
@@ -1,76 +1,183 @@
 from __future__ import annotations
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Optional
 
+import numpy as np
 from fastapi import APIRouter, Depends, Query
+from pydantic import BaseModel, Field
 from sqlalchemy import select, func
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from deps import get_db
-from models import Assignment, Submission, Student, ErrorHotspot
+import forecast
+from deps import get_async_db
+from hotspots import effective_heat
+from models import Assignment, Student, ErrorHotspot, StudentDailyStats
 
 router = APIRouter()
 
+RADAR_WINDOW_DAYS = 30  # окно, за которое считаем темп сабмитов в радаре
+
+
+# ===== Schemas =====
+class ForecastBatchIn(BaseModel):
+    student_ids: Optional[List[int]] = Field(None, max_length=10000)  # None — все
+
+
 # ===== Helpers =====
-def _calc_tempo(db: Session, student_id: int, days: int = 30) -> dict:
-    since = datetime.utcnow() - timedelta(days=days)
-    subs = db.execute(
-        select(Submission).join(Assignment).where(
-            Assignment.student_id == student_id,
-            Submission.completed_at >= since,
+async def _calc_tempo(db: AsyncSession, student_id: int, days: int = 30) -> dict:
+    # по дневным роллапам: не больше days строк на ученика, сколько бы ни было сабмитов
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    subs, graded, grade_sum = (
+        await db.execute(
+            select(
+                func.coalesce(func.sum(StudentDailyStats.submissions), 0),
+                func.coalesce(func.sum(StudentDailyStats.graded), 0),
+                func.coalesce(func.sum(StudentDailyStats.grade_sum), 0),
+            ).where(
+                StudentDailyStats.student_id == student_id,
+                StudentDailyStats.day >= since,
+            )
         )
-    ).scalars().all()
-    freq = len(subs) / days
+    ).one()
+    freq = subs / days
     avg_time = None  # TODO: если будут данные "time_spent"
-    return {"frequency_per_day": freq, "avg_time": avg_time}
-
-def _forecast_exam(db: Session, student_id: int) -> dict:
-    # простая модель: уровень ~ кол-во сабмитов * 2
-    subs = db.execute(
-        select(func.count(Submission.id))
-        .join(Assignment)
-        .where(Assignment.student_id == student_id)
+    avg_grade = round(grade_sum / graded, 2) if graded else None
+    return {"frequency_per_day": freq, "avg_time": avg_time, "avg_grade": avg_grade}
+
+
+async def _forecast_exam(db: AsyncSession, student_id: int) -> dict:
+    # та же модель, что и в batch (см. forecast.py), на когорте из одного ученика
+    subs = (
+        await db.execute(
+            select(func.coalesce(func.sum(StudentDailyStats.submissions), 0)).where(
+                StudentDailyStats.student_id == student_id
+            )
+        )
     ).scalar_one()
-    predicted_score = min(100, 40 + subs * 2)
-    return {"predicted_score": predicted_score, "subs": subs}
+    ids, scores, model = await forecast.predict(db, [student_id])
+    predicted_score = round(float(scores[0]), 1) if len(ids) else None
+    return {"predicted_score": predicted_score, "subs": subs, "model": model.meta()}
+
+
+def _radar_stmt(days: int = RADAR_WINDOW_DAYS):
+    """
+    Один запрос на весь радар: просрочки, сумма затухшего heat и сабмиты за окно
+    (из дневных роллапов) считаются сгруппированными подзапросами и пристёгиваются
+    к Student через outer join.
+    """
+    now = datetime.utcnow()
+    # окно в днях роллапа, включая сегодня
+    since = now.date() - timedelta(days=days - 1)
+
+    late = (
+        select(Assignment.student_id, func.count(Assignment.id).label("late_count"))
+        .where(Assignment.status == "late")
+        .group_by(Assignment.student_id)
+        .subquery()
+    )
+    heat = (
+        select(ErrorHotspot.student_id, func.sum(effective_heat(now)).label("heat"))
+        .group_by(ErrorHotspot.student_id)
+        .subquery()
+    )
+    subs = (
+        select(
+            StudentDailyStats.student_id,
+            func.sum(StudentDailyStats.submissions).label("subs"),
+        )
+        .where(StudentDailyStats.day >= since)
+        .group_by(StudentDailyStats.student_id)
+        .subquery()
+    )
 
-def _priority_score(db: Session, student: Student) -> float:
+    late_count = func.coalesce(late.c.late_count, 0)
+    hotspots = func.coalesce(heat.c.heat, 0)
+    subs_count = func.coalesce(subs.c.subs, 0)
     # простой эвристический скор: просрочки + hotspots + редкие сабмиты
-    late_count = db.scalar(
-        select(func.count(Assignment.id)).where(
-            Assignment.student_id == student.id, Assignment.status == "late"
+    score = late_count * 2 + hotspots - subs_count * 10.0 / days
+
+    stmt = (
+        select(
+            Student.id,
+            Student.name,
+            Student.level,
+            late_count.label("late_count"),
+            hotspots.label("heat"),
+            subs_count.label("subs"),
+            score.label("score"),
         )
+        .outerjoin(late, late.c.student_id == Student.id)
+        .outerjoin(heat, heat.c.student_id == Student.id)
+        .outerjoin(subs, subs.c.student_id == Student.id)
     )
-    hotspots = db.execute(
-        select(func.sum(ErrorHotspot.heat)).where(ErrorHotspot.student_id == student.id)
-    ).scalar_one() or 0
-    tempo = _calc_tempo(db, student.id)
-    score = late_count * 2 + hotspots - tempo["frequency_per_day"] * 10
-    return score
+    return stmt, score
+
 
 # ===== Endpoints =====
 
+
 @router.get("/tempo")
-def tempo(
+async def tempo(
     student_id: int = Query(...),
     days: int = Query(30),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    return _calc_tempo(db, student_id, days)
+    return await _calc_tempo(db, student_id, days)
+
 
 @router.get("/exam-forecast")
-def exam_forecast(student_id: int = Query(...), db: Session = Depends(get_db)):
-    return _forecast_exam(db, student_id)
+async def exam_forecast(
+    student_id: int = Query(...), db: AsyncSession = Depends(get_async_db)
+):
+    return await _forecast_exam(db, student_id)
+
+
+@router.post("/exam-forecast/batch")
+async def exam_forecast_batch(
+    payload: ForecastBatchIn, db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Прогноз для списка учеников или всей когорты (student_ids не задан)
+    одним запросом и одним матричным умножением.
+    """
+    ids, scores, model = await forecast.predict(db, payload.student_ids)
+    return {
+        "model": model.meta(),
+        "items": [
+            {"student_id": sid, "predicted_score": score}
+            for sid, score in zip(ids.tolist(), np.round(scores, 1).tolist())
+        ],
+    }
+
 
 @router.get("/priority-radar")
-def priority_radar(db: Session = Depends(get_db)):
-    students = db.execute(select(Student)).scalars().all()
-    items = []
-    for s in students:
-        score = _priority_score(db, s)
-        items.append(
-            {"student_id": s.id, "name": s.name, "score": score, "level": s.level}
-        )
-    # сортировка по score
-    items.sort(key=lambda x: x["score"], reverse=True)
+async def priority_radar(
+    db: AsyncSession = Depends(get_async_db),
+    limit: Optional[int] = Query(
+        None, ge=1, le=500, description="Только top-k учеников"
+    ),
+    min_score: Optional[float] = Query(
+        None, description="Отсечь учеников со скором ниже порога"
+    ),
+):
+    stmt, score = _radar_stmt()
+    if min_score is not None:
+        stmt = stmt.where(score >= min_score)
+    # сортировка по score — на стороне БД, чтобы LIMIT отдавал именно top-k
+    stmt = stmt.order_by(score.desc(), Student.id)
+    if limit:
+        stmt = stmt.limit(limit)
+
+    items = [
+        {
+            "student_id": r.id,
+            "name": r.name,
+            "score": float(r.score),
+            "level": r.level,
+            "late_count": r.late_count,
+            "heat": round(float(r.heat), 2),
+            "subs_30d": r.subs,
+        }
+        for r in await db.execute(stmt)
+    ]
     return {"items": items}
@@ -3,13 +3,17 @@ from datetime import datetime, timezone
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from pydantic import BaseModel
-from sqlalchemy import select
+from pydantic import BaseModel, Field
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from deps import get_db, pagination, Page
-from models import Assignment, Submission, Topic, Student
+from deps import get_db, get_async_db, pagination, apaginate, Page
+from models import Assignment, AssignmentTopic, Submission, Topic, Student
+import rollups
 from audit import audit_event
+from cache import conditional, invalidate
+from responses import page_response
 
 router = APIRouter()
 
@@ -38,6 +42,15 @@ class SubmissionIn(BaseModel):
     grade: Optional[float] = None
     feedback: Optional[str] = None
 
+
+class BatchSubmissionItem(SubmissionIn):
+    assignment_id: int
+
+
+class BatchSubmissionIn(BaseModel):
+    items: List[BatchSubmissionItem] = Field(..., min_length=1, max_length=500)
+
+
 # ====== Helpers ======
 def _reward_points(kind: Optional[str]) -> int:
     if kind == "star":
@@ -48,42 +61,70 @@ def _reward_points(kind: Optional[str]) -> int:
         return 10
     return 8  # базовое
 
+
+def _award_values(gained):
+    """
+    SET-выражения начисления очков: 100 очков = +1 уровень, остаток — в progress_points.
+    Считается в самом UPDATE (старые значения колонок), без read-modify-write.
+    """
+    cols = Student.__table__.c
+    total = func.coalesce(cols.progress_points, 0) + gained
+    return {"level": cols.level + total // 100, "progress_points": total % 100}
+
+
 # ====== Endpoints ======
 @router.get("")
-def list_assignments(
-    db: Session = Depends(get_db),
+@conditional("assignments.list", "assignments")
+async def list_assignments(
+    db: AsyncSession = Depends(get_async_db),
     page: Page = Depends(pagination),
     student_id: Optional[int] = Query(None),
     status: Optional[str] = Query(None),
 ):
-    stmt = select(Assignment)
+    stmt = select(
+        Assignment.id,
+        Assignment.student_id,
+        Assignment.lesson_id,
+        Assignment.status,
+        Assignment.title,
+        Assignment.reward_type,
+        Assignment.due_at,
+        Assignment.created_at,  # для курсора, в ответ не идёт
+    )
     if student_id:
         stmt = stmt.where(Assignment.student_id == student_id)
     if status:
         stmt = stmt.where(Assignment.status == status)
-    rows = db.execute(stmt.order_by(Assignment.created_at.desc())).scalars().all()
-
-    # пагинация простым слайсом
-    total = len(rows)
-    start = (page.page - 1) * page.size
-    items = rows[start : start + page.size]
+    rows, total, next_cursor = await apaginate(
+        db, stmt, page, Assignment.created_at, Assignment.id, scalars=False
+    )
 
-    result = []
-    for a in items:
-        topic_ids = [t.id for t in a.topics] if a.topics else []
-        result.append(
-            {
-                "id": a.id,
-                "student_id": a.student_id,
-                "lesson_id": a.lesson_id,
-                "status": a.status,
-                "title": a.title,
-                "reward_type": a.reward_type,
-                "due_at": a.due_at,
-                "topic_ids": topic_ids,
-            }
+    # темы страницы — одним запросом по связочной таблице, без загрузки Topic
+    topic_ids: dict[int, list[int]] = {r.id: [] for r in rows}
+    if rows:
+        links = await db.execute(
+            select(AssignmentTopic.assignment_id, AssignmentTopic.topic_id)
+            .where(AssignmentTopic.assignment_id.in_(topic_ids))
+            .order_by(AssignmentTopic.assignment_id, AssignmentTopic.topic_id)
         )
-    return {"total": total, "items": result}
+        for aid, tid in links:
+            topic_ids[aid].append(tid)
+
+    items = [
+        {
+            "id": r.id,
+            "student_id": r.student_id,
+            "lesson_id": r.lesson_id,
+            "status": r.status,
+            "title": r.title,
+            "reward_type": r.reward_type,
+            "due_at": r.due_at,
+            "topic_ids": topic_ids[r.id],
+        }
+        for r in rows
+    ]
+    return page_response(items, total, next_cursor)
+
 
 @router.post("")
 def create_assignment(payload: AssignmentCreateIn, db: Session = Depends(get_db)):
@@ -109,6 +150,7 @@ def create_assignment(payload: AssignmentCreateIn, db: Session = Depends(get_db)
     db.add(a)
     db.commit()
     db.refresh(a)
+    invalidate("assignments")
 
     audit_event(
         "create_assignment",
@@ -128,55 +170,158 @@ def start_assignment(assignment_id: int, db: Session = Depends(get_db)):
         raise HTTPException(400, "Assignment not in startable state")
     a.status = "in_progress"
     db.commit()
+    invalidate("assignments")
     audit_event("start_assignment", assignment_id=a.id, student_id=a.student_id)
     return {"status": a.status}
 
 @router.post("/{assignment_id}/submit")
 def submit_assignment(assignment_id: int, payload: SubmissionIn, db: Session = Depends(get_db)):
-    a = db.get(Assignment, assignment_id)
+    # завершение задания (одна транзакция: статус, сабмит, очки)
+    a = db.execute(
+        update(Assignment)
+        .where(Assignment.id == assignment_id)
+        .values(status="done")
+        .returning(Assignment.student_id, Assignment.reward_type)
+    ).first()
     if not a:
         raise HTTPException(404, "Assignment not found")
 
-    # создаём сабмит
-    sub = Submission(
-        assignment_id=a.id,
-        completed_at=datetime.utcnow().replace(tzinfo=None),
-        grade=payload.grade,
-        feedback=payload.feedback,
+    db.execute(
+        insert(Submission).values(
+            assignment_id=assignment_id,
+            completed_at=datetime.utcnow().replace(tzinfo=None),
+            grade=payload.grade,
+            feedback=payload.feedback,
+        )
     )
-    db.add(sub)
-
-    # завершение задания
-    a.status = "done"
-    db.commit()
+    rollups.bump_many(db, [rollups.submission_row(a.student_id, payload.grade)])
 
     # начисление очков за выполненное ДЗ
-    student = db.get(Student, a.student_id)
     gained = _reward_points(a.reward_type)
-    student.progress_points = (student.progress_points or 0) + gained
-    # авто-повышение уровня: 100 очков = +1 уровень
-    while student.progress_points >= 100:
-        student.level += 1
-        student.progress_points -= 100
-
+    student = db.execute(
+        update(Student)
+        .where(Student.id == a.student_id)
+        .values(**_award_values(gained))
+        .returning(Student.level, Student.progress_points)
+    ).one()
     db.commit()
+    invalidate("assignments")
 
     audit_event(
         "submit_assignment",
-        assignment_id=a.id,
+        assignment_id=assignment_id,
         student_id=a.student_id,
         gained_points=gained,
         new_level=student.level,
         points_left=student.progress_points,
     )
-    return {"status": a.status, "gained_points": gained, "level": student.level}
+    return {"status": "done", "gained_points": gained, "level": student.level}
+
+
+@router.post("/submit-batch")
+def submit_batch(payload: BatchSubmissionIn, db: Session = Depends(get_db)):
+    """
+    Проверка пачки ДЗ одним запросом и одной транзакцией.
+    Несуществующие assignment_id не ломают пачку — они помечаются в ответе.
+    """
+    items = {it.assignment_id: it for it in payload.items}  # дубли: побеждает последний
+    done = db.execute(
+        update(Assignment)
+        .where(Assignment.id.in_(items))
+        .values(status="done")
+        .returning(Assignment.id, Assignment.student_id, Assignment.reward_type)
+    ).all()
+
+    now = datetime.utcnow().replace(tzinfo=None)
+    gained_by_student: dict[int, int] = {}
+    if done:
+        db.execute(
+            insert(Submission),
+            [
+                {
+                    "assignment_id": a.id,
+                    "completed_at": now,
+                    "grade": items[a.id].grade,
+                    "feedback": items[a.id].feedback,
+                }
+                for a in done
+            ],
+        )
+        for a in done:
+            gained_by_student[a.student_id] = gained_by_student.get(
+                a.student_id, 0
+            ) + _reward_points(a.reward_type)
+        rollups.bump_many(
+            db,
+            (
+                rollups.submission_row(a.student_id, items[a.id].grade, now.date())
+                for a in done
+            ),
+        )
+        # executemany: по UPDATE на ученика, суммарные очки за всю пачку
+        # (через Connection: ORM-режим «bulk update by PK» не допускает своё WHERE)
+        db.connection().execute(
+            update(Student.__table__)
+            .where(Student.__table__.c.id == bindparam("sid"))
+            .values(**_award_values(bindparam("gained"))),
+            [{"sid": sid, "gained": g} for sid, g in gained_by_student.items()],
+        )
+        levels = {
+            row.id: row
+            for row in db.execute(
+                select(Student.id, Student.level, Student.progress_points).where(
+                    Student.id.in_(gained_by_student)
+                )
+            )
+        }
+    db.commit()
+    if done:
+        invalidate("assignments")
+
+    results = []
+    found = {a.id: a for a in done}
+    for aid in items:
+        a = found.get(aid)
+        if a is None:
+            results.append({"assignment_id": aid, "status": "not_found"})
+            continue
+        gained = _reward_points(a.reward_type)
+        student = levels[a.student_id]
+        results.append(
+            {
+                "assignment_id": aid,
+                "status": "done",
+                "gained_points": gained,
+                "level": student.level,
+            }
+        )
+        audit_event(
+            "submit_assignment",
+            assignment_id=aid,
+            student_id=a.student_id,
+            gained_points=gained,
+            new_level=student.level,
+            points_left=student.progress_points,
+            batch=True,
+        )
+    return {"submitted": len(done), "items": results}
+
 
 @router.post("/{assignment_id}/mark_late")
 def mark_late(assignment_id: int, db: Session = Depends(get_db)):
     a = db.get(Assignment, assignment_id)
     if not a:
         raise HTTPException(404, "Assignment not found")
-    a.status = "late"
+    # в роллап — только переход в late, повторная пометка счётчик не увеличивает
+    changed = db.execute(
+        update(Assignment)
+        .where(Assignment.id == assignment_id, Assignment.status != "late")
+        .values(status="late")
+    ).rowcount
+    if changed:
+        rollups.bump_many(db, [rollups.late_row(a.student_id)])
     db.commit()
+    if changed:
+        invalidate("assignments")
     audit_event("mark_assignment_late", assignment_id=a.id, student_id=a.student_id)
-    return {"status": a.status}
+    return {"status": "late"}
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from deps import Page, apaginate, get_async_db, pagination
+from models import AuditEvent
+
+router = APIRouter()
+
+
+@router.get("")
+async def list_audit_events(
+    db: AsyncSession = Depends(get_async_db),
+    page: Page = Depends(pagination),
+    action: Optional[str] = Query(None),
+    student_id: Optional[int] = Query(None),
+    request_id: Optional[str] = Query(None),
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+):
+    stmt = select(AuditEvent)
+    if action:
+        stmt = stmt.where(AuditEvent.action == action)
+    if student_id:
+        stmt = stmt.where(AuditEvent.student_id == student_id)
+    if request_id:
+        stmt = stmt.where(AuditEvent.request_id == request_id)
+    if date_from:
+        stmt = stmt.where(AuditEvent.created_at >= date_from)
+    if date_to:
+        stmt = stmt.where(AuditEvent.created_at <= date_to)
+    items, total, next_cursor = await apaginate(
+        db, stmt, page, AuditEvent.created_at, AuditEvent.id
+    )
+
+    return {
+        "total": total,
+        "items": [
+            {
+                "id": e.id,
+                "created_at": e.created_at,
+                "action": e.action,
+                "request_id": e.request_id,
+                "student_id": e.student_id,
+                "payload": e.payload,
+            }
+            for e in items
+        ],
+        "next_cursor": next_cursor,
+    }
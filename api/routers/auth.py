@@ -8,20 +8,44 @@ from typing import ClassVar
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, field_validator
 from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 if not (__package__ or "").startswith("api."):
     sys.path.append(str(Path(__file__).resolve().parents[1]))
-    from deps import get_db
+    from deps import get_async_db, bearer_token, current_user
     from models import User
-    from security import hash_password, make_token, verify_password
+    from security import (
+        AuthUser,
+        HashingPoolSaturated,
+        decode_token,
+        hash_password_async,
+        make_token,
+        revoke_token,
+        verify_password_async,
+    )
 else:  # pragma: no cover - ветка для запуска как пакет
-    from ..deps import get_db
+    from ..deps import get_async_db, bearer_token, current_user
     from ..models import User
-    from ..security import hash_password, make_token, verify_password
+    from ..security import (
+        AuthUser,
+        HashingPoolSaturated,
+        decode_token,
+        hash_password_async,
+        make_token,
+        revoke_token,
+        verify_password_async,
+    )
 
 router = APIRouter()
 
+
+def _busy() -> HTTPException:
+    # пул Argon2 перегружен (например, все ученики логинятся к началу урока)
+    return HTTPException(
+        503, "Authentication is busy, retry later", headers={"Retry-After": "1"}
+    )
+
+
 class RegisterIn(BaseModel):
     email: str
     password: str
@@ -36,16 +60,21 @@ class RegisterIn(BaseModel):
             raise ValueError("invalid email format")
         return value.lower()
 
+
 @router.post("/register")
-def register(p: RegisterIn, db: Session = Depends(get_db)):
-    if db.scalar(select(User).where(User.email == p.email)):
+async def register(p: RegisterIn, db: AsyncSession = Depends(get_async_db)):
+    if await db.scalar(select(User).where(User.email == p.email)):
         raise HTTPException(400, "Email already exists")
-    u = User(email=p.email, password_hash=hash_password(p.password), role=p.role)
+    try:
+        password_hash = await hash_password_async(p.password)
+    except HashingPoolSaturated:
+        raise _busy()
+    u = User(email=p.email, password_hash=password_hash, role=p.role)
     db.add(u)
-    db.commit()
-    db.refresh(u)
+    await db.commit()
     return {"id": u.id, "email": u.email}
 
+
 class LoginIn(BaseModel):
     email: str
     password: str
@@ -55,9 +84,34 @@ class LoginIn(BaseModel):
     def normalise_email(cls, value: str) -> str:
         return value.lower()
 
+
 @router.post("/login")
-def login(p: LoginIn, db: Session = Depends(get_db)):
-    u = db.scalar(select(User).where(User.email == p.email))
-    if not u or not verify_password(p.password, u.password_hash):
+async def login(p: LoginIn, db: AsyncSession = Depends(get_async_db)):
+    u = await db.scalar(select(User).where(User.email == p.email))
+    if not u:
         raise HTTPException(401, "Invalid credentials")
+    try:
+        ok, new_hash = await verify_password_async(p.password, u.password_hash)
+    except HashingPoolSaturated:
+        raise _busy()
+    if not ok:
+        raise HTTPException(401, "Invalid credentials")
+    if new_hash:
+        # параметры Argon2 поменялись — тихо перехэшируем пароль
+        u.password_hash = new_hash
+        await db.commit()
     return {"token": make_token(u.id, u.role), "role": u.role}
+
+
+@router.get("/me")
+async def me(user: AuthUser = Depends(current_user)):
+    return {"id": user.id, "email": user.email, "role": user.role}
+
+
+@router.post("/logout")
+async def logout(
+    user: AuthUser = Depends(current_user), token: str = Depends(bearer_token)
+):
+    # токен уже проверен current_user — exp нужен только для TTL записи в deny-list
+    await revoke_token(token, exp=float(decode_token(token)["exp"]))
+    return {"ok": True}
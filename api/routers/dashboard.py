@@ -1,45 +1,162 @@
+from datetime import date, datetime, time, timedelta
 from pathlib import Path
+from typing import Literal
+import os
 import sys
 
 from fastapi import APIRouter, Depends, Query
-from sqlalchemy import func, select
-from sqlalchemy.orm import Session
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 if not (__package__ or "").startswith("api."):
     sys.path.append(str(Path(__file__).resolve().parents[1]))
-    from deps import get_db
-    from models import Lesson, Student
+    from cache import cached
+    from deps import get_async_db
+    from models import Assignment, Lesson, Student, Submission, TutorCounters
+    from sqlutils import time_bucket
 else:  # pragma: no cover - ветка для запуска как пакет
-    from ..deps import get_db
-    from ..models import Lesson, Student
+    from ..cache import cached
+    from ..deps import get_async_db
+    from ..models import Assignment, Lesson, Student, Submission, TutorCounters
+    from ..sqlutils import time_bucket
 
 router = APIRouter()
 
+# дашборд опрашивают раз в несколько секунд — короткий TTL,
+# без инвалидации по каждому сабмиту
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "5"))
+# окно по умолчанию, если date_from не задан
+DEFAULT_BUCKETS = {"day": 30, "week": 12}
+
+
+def _range(
+    granularity: str, date_from: date | None, date_to: date | None
+) -> tuple[datetime, datetime]:
+    """[начало date_from, конец date_to) как datetime для timestamp-колонок."""
+    date_to = date_to or datetime.utcnow().date()
+    if date_from is None:
+        # с начала интервала, чтобы первый бакет был полным (неделя — с понедельника)
+        first = (
+            date_to
+            if granularity == "day"
+            else date_to - timedelta(days=date_to.weekday())
+        )
+        step = timedelta(days=1 if granularity == "day" else 7)
+        date_from = first - step * (DEFAULT_BUCKETS[granularity] - 1)
+    return datetime.combine(date_from, time.min), datetime.combine(
+        date_to + timedelta(days=1), time.min
+    )
+
+
+def _series_stmt(
+    granularity: str, ts, start: datetime, end: datetime, tutor_id: int | None, *columns
+):
+    """SELECT bucket, columns... GROUP BY bucket — время группируется на стороне БД."""
+    bucket = time_bucket(granularity, ts).label("bucket")
+    stmt = (
+        select(bucket, *columns)
+        .where(ts >= start, ts < end)
+        .group_by(bucket)
+        .order_by(bucket)
+    )
+    if tutor_id is not None:
+        stmt = stmt.where(Student.tutor_id == tutor_id)
+    return stmt
+
+
 @router.get("/overview")
-def overview(
-    db: Session = Depends(get_db),
-    date_from: str | None = Query(None),
-    date_to: str | None = Query(None),
+@cached("dashboard.overview", ttl=DASHBOARD_CACHE_TTL, tags=lambda p: ["lessons"])
+async def overview(
+    db: AsyncSession = Depends(get_async_db),
+    date_from: date | None = Query(None),
+    date_to: date | None = Query(None),
+    granularity: Literal["day", "week"] = Query("week"),
+    tutor_id: int | None = Query(None, description="Только ученики этого тьютора"),
 ):
-    # Минимальные метрики для дашборда
-    students_count = db.execute(select(func.count(Student.id))).scalar_one()
-    lessons_count = db.execute(select(func.count(Lesson.id))).scalar_one()
+    # шапка — из денормализованных счётчиков (строка на тьютора), без COUNT(*) по урокам
+    counters = select(
+        func.coalesce(func.sum(TutorCounters.students_count), 0),
+        func.coalesce(func.sum(TutorCounters.lessons_count), 0),
+    )
+    if tutor_id is not None:
+        counters = counters.where(TutorCounters.tutor_id == tutor_id)
+    students_count, lessons_count = (await db.execute(counters)).one()
+
+    start, end = _range(granularity, date_from, date_to)
 
-    # Простейшая имитация серии прогресса (оставим статик в MVP)
+    # прогресс: средняя оценка за интервал, в процентах от пятёрки
+    progress = await db.execute(
+        _series_stmt(
+            granularity,
+            Submission.completed_at,
+            start,
+            end,
+            tutor_id,
+            func.avg(Submission.grade).label("avg_grade"),
+            func.count(Submission.id).label("submissions"),
+        )
+        .join(Assignment, Assignment.id == Submission.assignment_id)
+        .join(Student, Student.id == Assignment.student_id)
+    )
     progress_series = [
-        {"date": "2025-09-01", "value": 60},
-        {"date": "2025-09-08", "value": 65},
-        {"date": "2025-09-15", "value": 70},
+        {
+            "date": r.bucket.isoformat(),
+            "value": (
+                round(float(r.avg_grade) * 20, 1) if r.avg_grade is not None else None
+            ),
+            "submissions": r.submissions,
+        }
+        for r in progress
     ]
 
-    engagement_temp = 0.72  # placeholder до этапа аналитики
+    lessons = await db.execute(
+        _series_stmt(
+            granularity,
+            Lesson.date,
+            start,
+            end,
+            tutor_id,
+            func.count(Lesson.id).label("lessons"),
+        ).join(Student, Student.id == Lesson.student_id)
+    )
+    lessons_series = [
+        {"date": r.bucket.isoformat(), "value": r.lessons} for r in lessons
+    ]
+
+    # вовлечённость: доля выполненных среди заданий, выданных в интервале
+    engagement = (
+        await db.execute(
+            _series_stmt(
+                granularity,
+                Assignment.created_at,
+                start,
+                end,
+                tutor_id,
+                func.count(Assignment.id).label("total"),
+                func.sum(case((Assignment.status == "done", 1), else_=0)).label("done"),
+            ).join(Student, Student.id == Assignment.student_id)
+        )
+    ).all()
+    engagement_series = [
+        {"date": r.bucket.isoformat(), "value": round(int(r.done) / r.total, 2)}
+        for r in engagement
+    ]
+    total = sum(r.total for r in engagement)
+    engagement_temp = (
+        round(sum(int(r.done) for r in engagement) / total, 2) if total else None
+    )
 
     alerts: list[dict] = []  # сюда позже попадут просрочки/платежи
 
     return {
         "students_count": students_count,
         "lessons_count": lessons_count,
+        "granularity": granularity,
+        "date_from": start.date().isoformat(),
+        "date_to": (end - timedelta(days=1)).date().isoformat(),
         "progress_series": progress_series,
+        "lessons_series": lessons_series,
+        "engagement_series": engagement_series,
         "engagement_temp": engagement_temp,
         "alerts": alerts,
     }
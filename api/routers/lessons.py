@@ -1,19 +1,29 @@
 from __future__ import annotations
+import codecs
+import csv
+import os
 from datetime import datetime
-from typing import Optional
+from typing import Any, AsyncIterator, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from pydantic import BaseModel
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from deps import get_db, pagination, Page
-from models import Lesson, Student
-from jobs import enqueue_lesson_reminder
+from deps import get_db, get_async_db, pagination, apaginate, Page
+from models import Lesson, OutboxMessage, Student
+from jobs import lesson_reminder_at
+from outbox import outbox_row
 from audit import audit_event
+from cache import ainvalidate, conditional, invalidate
+from responses import FastJSONResponse, page_response, row_dicts
 
 router = APIRouter()
 
+LESSONS_BULK_MAX_ROWS = int(os.getenv("LESSONS_BULK_MAX_ROWS", "20000"))
+LESSONS_BULK_CHUNK = int(os.getenv("LESSONS_BULK_CHUNK", "1000"))
+
 # ==== Schemas ====
 class LessonCreateIn(BaseModel):
     student_id: int
@@ -26,35 +36,47 @@ class LessonOut(BaseModel):
     date: datetime
     topic: str
 
+
+def _student_email(student_id: int) -> str:
+    return f"student+{student_id}@example.com"  # email-заглушка до появления контактов
+
+
+def _reminder_row(lesson_id: int, student_id: int, start_at: datetime) -> dict:
+    """Напоминание «урок завтра» как сообщение outbox (уходит в Redis через relay)."""
+    return outbox_row(
+        "lesson_reminder",
+        f"lesson_reminder:{lesson_id}",
+        {
+            "student_email": _student_email(student_id),
+            "lesson_id": lesson_id,
+            "start_at": start_at.isoformat(),
+        },
+        run_at=lesson_reminder_at(start_at),
+    )
+
+
 # ==== Endpoints ====
 @router.get("")
-def list_lessons(
-    db: Session = Depends(get_db),
+@conditional("lessons.list", "lessons")
+async def list_lessons(
+    db: AsyncSession = Depends(get_async_db),
     page: Page = Depends(pagination),
     student_id: Optional[int] = Query(None),
     date_from: Optional[datetime] = Query(None),
     date_to: Optional[datetime] = Query(None),
 ):
-    stmt = select(Lesson)
+    stmt = select(Lesson.id, Lesson.student_id, Lesson.date, Lesson.topic)
     if student_id:
         stmt = stmt.where(Lesson.student_id == student_id)
     if date_from:
         stmt = stmt.where(Lesson.date >= date_from)
     if date_to:
         stmt = stmt.where(Lesson.date <= date_to)
-    rows = db.execute(stmt.order_by(Lesson.date.asc())).scalars().all()
-
-    total = len(rows)
-    start = (page.page - 1) * page.size
-    items = rows[start : start + page.size]
+    rows, total, next_cursor = await apaginate(
+        db, stmt, page, Lesson.date, Lesson.id, descending=False, scalars=False
+    )
+    return page_response(row_dicts(rows), total, next_cursor)
 
-    return {
-        "total": total,
-        "items": [
-            {"id": l.id, "student_id": l.student_id, "date": l.date, "topic": l.topic}
-            for l in items
-        ],
-    }
 
 @router.post("", response_model=LessonOut)
 def create_lesson(payload: LessonCreateIn, db: Session = Depends(get_db)):
@@ -64,15 +86,152 @@ def create_lesson(payload: LessonCreateIn, db: Session = Depends(get_db)):
 
     l = Lesson(student_id=payload.student_id, date=payload.date, topic=payload.topic)
     db.add(l)
+    db.flush()  # нужен l.id для ключа outbox
+    # напоминание «урок завтра» — в той же транзакции, в Redis его перенесёт relay
+    db.add(OutboxMessage(**_reminder_row(l.id, l.student_id, l.date)))
     db.commit()
-    db.refresh(l)
 
-    # шедулим напоминание «урок завтра» (email-заглушка)
-    enqueue_lesson_reminder(
-        student_email=f"student+{payload.student_id}@example.com",
-        lesson_id=l.id,
-        start_at=l.date,
+    audit_event("create_lesson", lesson_id=l.id, student_id=l.student_id, date=l.date.isoformat())
+    invalidate("lessons")
+    # response_model — для схемы OpenAPI; собранный здесь ответ повторно не валидируем
+    return FastJSONResponse(
+        {"id": l.id, "student_id": l.student_id, "date": l.date, "topic": l.topic}
     )
 
-    audit_event("create_lesson", lesson_id=l.id, student_id=l.student_id, date=l.date.isoformat())
-    return LessonOut(id=l.id, student_id=l.student_id, date=l.date, topic=l.topic)
+
+# ==== Bulk import ====
+async def _csv_rows(request: Request) -> AsyncIterator[dict[str, Any]]:
+    """
+    Читает CSV (заголовок: student_id,date,topic) из тела запроса по мере поступления,
+    не собирая всё тело в память. Кавычки внутри строки поддерживаются, переносы
+    строк внутри поля — нет.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    tail = ""
+    header: Optional[list[str]] = None
+    async for chunk in request.stream():
+        text = tail + decoder.decode(chunk)
+        lines = text.split("\n")
+        tail = lines.pop()
+        for row in csv.reader(lines):
+            if not row:
+                continue
+            if header is None:
+                header = [h.strip() for h in row]
+                continue
+            yield dict(zip(header, row))
+    text = tail + decoder.decode(b"", final=True)
+    for row in csv.reader([text]):
+        if row and header is not None:
+            yield dict(zip(header, row))
+
+
+async def _json_rows(request: Request) -> AsyncIterator[dict[str, Any]]:
+    try:
+        data = await request.json()
+    except ValueError:
+        raise HTTPException(400, "Invalid JSON")
+    if isinstance(data, dict):
+        data = data.get("items")
+    if not isinstance(data, list):
+        raise HTTPException(422, 'Expected a JSON array of lessons or {"items": [...]}')
+    for row in data:
+        yield row if isinstance(row, dict) else {}
+
+
+@router.post("/bulk")
+async def bulk_create_lessons(
+    request: Request, db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Массовое создание уроков: JSON-массив LessonCreateIn
+    или CSV (Content-Type: text/csv).
+    Ученики проверяются одним запросом, вставка — executemany пачками по
+    LESSONS_BULK_CHUNK в одной транзакции вместе с напоминаниями в outbox.
+    Ответ: результат по каждой строке (id или ошибка).
+    """
+    content_type = request.headers.get("content-type", "")
+    rows = (
+        _csv_rows(request)
+        if content_type.startswith("text/csv")
+        else _json_rows(request)
+    )
+
+    results: list[dict[str, Any]] = []
+    valid: list[tuple[int, LessonCreateIn]] = []
+    async for raw in rows:
+        idx = len(results)
+        if idx >= LESSONS_BULK_MAX_ROWS:
+            raise HTTPException(413, f"Too many rows (max {LESSONS_BULK_MAX_ROWS})")
+        try:
+            item = LessonCreateIn.model_validate(raw)
+        except ValidationError as exc:
+            err = exc.errors()[0]
+            loc = ".".join(str(x) for x in err["loc"])
+            results.append(
+                {"row": idx, "status": "error", "error": f"{loc}: {err['msg']}"}
+            )
+            continue
+        results.append({"row": idx, "status": "pending"})
+        valid.append((idx, item))
+
+    # проверка учеников — одним запросом
+    student_ids = {item.student_id for _, item in valid}
+    existing = (
+        set(
+            (
+                await db.execute(select(Student.id).where(Student.id.in_(student_ids)))
+            ).scalars()
+        )
+        if student_ids
+        else set()
+    )
+
+    to_insert: list[tuple[int, LessonCreateIn]] = []
+    for idx, item in valid:
+        if item.student_id in existing:
+            to_insert.append((idx, item))
+        else:
+            results[idx] = {"row": idx, "status": "error", "error": "Student not found"}
+
+    created = 0
+    stmt = insert(Lesson).returning(Lesson.id, sort_by_parameter_order=True)
+    for start in range(0, len(to_insert), LESSONS_BULK_CHUNK):
+        chunk = to_insert[start : start + LESSONS_BULK_CHUNK]
+        ids = (
+            (
+                await db.execute(
+                    stmt,
+                    [
+                        {
+                            "student_id": it.student_id,
+                            "date": it.date,
+                            "topic": it.topic,
+                        }
+                        for _, it in chunk
+                    ],
+                )
+            )
+            .scalars()
+            .all()
+        )
+        reminders = []
+        for (idx, it), lesson_id in zip(chunk, ids):
+            results[idx] = {"row": idx, "status": "created", "id": lesson_id}
+            reminders.append(_reminder_row(lesson_id, it.student_id, it.date))
+        await db.execute(insert(OutboxMessage), reminders)
+        created += len(chunk)
+    await db.commit()
+
+    if created:
+        await ainvalidate("lessons")
+        audit_event(
+            "bulk_create_lessons", created=created, failed=len(results) - created
+        )
+
+    return {
+        "created": created,
+        "failed": len(results) - created,
+        "reminders_scheduled": created,
+        "items": results,
+    }
@@ -3,7 +3,7 @@ from pydantic import BaseModel, HttpUrl
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from deps import get_db, pagination, Page
+from deps import get_db, pagination, paginate, Page
 from models import Mem
 
 router = APIRouter()
@@ -19,16 +19,17 @@ def list_mems(
     page: Page = Depends(pagination),
     student_id: int | None = Query(None),
 ):
-    stmt = select(Mem).order_by(Mem.created_at.desc())
+    stmt = select(Mem)
     if student_id:
         stmt = stmt.where(Mem.student_id == student_id)
-    rows = db.execute(stmt).scalars().all()
-    total = len(rows)
-    start = (page.page - 1) * page.size
-    items = rows[start : start + page.size]
+    items, total, next_cursor = paginate(db, stmt, page, Mem.created_at, Mem.id)
     return {
         "total": total,
-        "items": [{"id": m.id, "url": m.url, "caption": m.caption, "student_id": m.student_id} for m in items],
+        "items": [
+            {"id": m.id, "url": m.url, "caption": m.caption, "student_id": m.student_id}
+            for m in items
+        ],
+        "next_cursor": next_cursor,
     }
 
 @router.post("")
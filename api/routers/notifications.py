@@ -1,6 +1,15 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel, EmailStr
-from jobs import queue_default, enqueue_lesson_reminder, enqueue_weekly_digest, enqueue_invoice_due
+from sqlalchemy.orm import Session
+from deps import get_db
+from digest import run_weekly_digest
+from jobs import (
+    queue_default,
+    enqueue_lesson_reminder,
+    enqueue_weekly_digest,
+    enqueue_invoice_due,
+    job_weekly_digest_batch,
+)
 from datetime import datetime, timedelta
 
 router = APIRouter()
@@ -48,3 +57,17 @@ def schedule_demo(p: TestScheduleIn):
         return {"status": "scheduled", "kind": "invoice", "to": p.to}
     else:
         raise HTTPException(400, "Unknown kind")
+
+
+@router.post("/digest/run")
+def run_digest(dry_run: bool = Query(True), db: Session = Depends(get_db)):
+    """
+    Недельный дайджест по всем ученикам.
+    - dry_run=true (по умолчанию): считает статистику здесь же и возвращает объёмы
+      и тайминги, ничего не отправляя — для оценки нагрузки;
+    - dry_run=false: ставит задачу в очередь (то же делает воскресный cron).
+    """
+    if dry_run:
+        return run_weekly_digest(db, dry_run=True)
+    job = queue_default.enqueue(job_weekly_digest_batch, job_timeout=3600)
+    return {"status": "queued", "job_id": job.id}
@@ -8,10 +8,13 @@ from pydantic import BaseModel
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from deps import get_db, pagination, Page
+from deps import get_db, pagination, paginate, Page
 from models import Student, Invoice, Payment  # добавьте модели в models.py при необходимости
-from jobs import enqueue_invoice_due
+from jobs import invoice_due_at
+from outbox import outbox_add
 from audit import audit_event
+from cache import conditional, invalidate
+from responses import FastJSONResponse, page_response, row_dicts
 
 router = APIRouter()
 
@@ -47,38 +50,61 @@ class PaymentOut(BaseModel):
     paid_at: Optional[datetime]
     created_at: datetime
 
+# ==== Serialization ====
+# Списки выбирают только эти колонки (Core-строки, без ORM); одиночные ответы
+# собираются из тех же колонок. response_model у POST — для схемы OpenAPI:
+# ответ уходит готовым FastJSONResponse, без повторной валидации Pydantic.
+_INVOICE_COLUMNS = (
+    Invoice.id,
+    Invoice.student_id,
+    Invoice.amount,
+    Invoice.status,
+    Invoice.due_date,
+    Invoice.created_at,
+    Invoice.notes,
+)
+_PAYMENT_COLUMNS = (
+    Payment.id,
+    Payment.student_id,
+    Payment.invoice_id,
+    Payment.amount,
+    Payment.status,
+    Payment.method,
+    Payment.paid_at,
+    Payment.created_at,
+)
+
+
+def _as_json(obj, columns) -> FastJSONResponse:
+    # как response_model (Pydantic): Decimal-суммы — строкой, без потери точности;
+    # списки отдают их числом, как раньше делал jsonable_encoder
+    return FastJSONResponse(
+        {c.key: _decimal_str(getattr(obj, c.key)) for c in columns}
+    )
+
+
+def _decimal_str(value):
+    return str(value) if isinstance(value, Decimal) else value
+
+
 # ==== Endpoints: INVOICES ====
 @router.get("/invoices")
+@conditional("finance.invoices", "invoices")
 def list_invoices(
     db: Session = Depends(get_db),
     page: Page = Depends(pagination),
     student_id: Optional[int] = Query(None),
     status: Optional[str] = Query(None),
 ):
-    stmt = select(Invoice)
+    stmt = select(*_INVOICE_COLUMNS)
     if student_id:
         stmt = stmt.where(Invoice.student_id == student_id)
     if status:
         stmt = stmt.where(Invoice.status == status)
-    rows = db.execute(stmt.order_by(Invoice.created_at.desc())).scalars().all()
-    total = len(rows)
-    start = (page.page - 1) * page.size
-    items = rows[start : start + page.size]
-    return {
-        "total": total,
-        "items": [
-            {
-                "id": x.id,
-                "student_id": x.student_id,
-                "amount": x.amount,
-                "status": x.status,
-                "due_date": x.due_date,
-                "created_at": x.created_at,
-                "notes": x.notes,
-            }
-            for x in items
-        ],
-    }
+    rows, total, next_cursor = paginate(
+        db, stmt, page, Invoice.created_at, Invoice.id, scalars=False
+    )
+    return page_response(row_dicts(rows), total, next_cursor)
 
 @router.post("/invoices", response_model=InvoiceOut)
 def create_invoice(payload: InvoiceCreateIn, db: Session = Depends(get_db)):
@@ -93,28 +119,29 @@ def create_invoice(payload: InvoiceCreateIn, db: Session = Depends(get_db)):
         created_at=datetime.utcnow(),
     )
     db.add(inv)
-    db.commit()
-    db.refresh(inv)
+    db.flush()  # нужен inv.id для ключа outbox
 
-    # Планируем напоминание за 3 дня до due_date (если есть)
+    # Планируем напоминание за 3 дня до due_date (если есть) —
+    # через outbox, в той же транзакции
     if inv.due_date:
-        enqueue_invoice_due(
-            payer_email=f"parent+{inv.student_id}@example.com",  # TODO: реальный email родителя
-            invoice_id=inv.id,
-            amount=float(inv.amount),
-            due_date=datetime.combine(inv.due_date, datetime.min.time()),
+        outbox_add(
+            db,
+            "invoice_due",
+            f"invoice_due:{inv.id}",
+            {
+                # TODO: реальный email родителя
+                "payer_email": f"parent+{inv.student_id}@example.com",
+                "invoice_id": inv.id,
+                "amount": float(inv.amount),
+                "due_date": inv.due_date.isoformat(),
+            },
+            run_at=invoice_due_at(datetime.combine(inv.due_date, datetime.min.time())),
         )
+    db.commit()
+    invalidate("invoices")
 
     audit_event("create_invoice", invoice_id=inv.id, student_id=inv.student_id, amount=float(inv.amount))
-    return InvoiceOut(
-        id=inv.id,
-        student_id=inv.student_id,
-        amount=inv.amount,
-        status=inv.status,
-        due_date=inv.due_date,
-        created_at=inv.created_at,
-        notes=inv.notes,
-    )
+    return _as_json(inv, _INVOICE_COLUMNS)
 
 @router.post("/invoices/{invoice_id}/mark_paid", response_model=InvoiceOut)
 def mark_invoice_paid(invoice_id: int, db: Session = Depends(get_db)):
@@ -123,16 +150,9 @@ def mark_invoice_paid(invoice_id: int, db: Session = Depends(get_db)):
         raise HTTPException(404, "Invoice not found")
     inv.status = "paid"
     db.commit()
+    invalidate("invoices")
     audit_event("mark_invoice_paid", invoice_id=inv.id, student_id=inv.student_id)
-    return InvoiceOut(
-        id=inv.id,
-        student_id=inv.student_id,
-        amount=inv.amount,
-        status=inv.status,
-        due_date=inv.due_date,
-        created_at=inv.created_at,
-        notes=inv.notes,
-    )
+    return _as_json(inv, _INVOICE_COLUMNS)
 
 # ==== Endpoints: PAYMENTS ====
 @router.get("/payments")
@@ -142,31 +162,15 @@ def list_payments(
     student_id: Optional[int] = Query(None),
     status: Optional[str] = Query(None),
 ):
-    stmt = select(Payment)
+    stmt = select(*_PAYMENT_COLUMNS)
     if student_id:
         stmt = stmt.where(Payment.student_id == student_id)
     if status:
         stmt = stmt.where(Payment.status == status)
-    rows = db.execute(stmt.order_by(Payment.created_at.desc())).scalars().all()
-    total = len(rows)
-    start = (page.page - 1) * page.size
-    items = rows[start : start + page.size]
-    return {
-        "total": total,
-        "items": [
-            {
-                "id": x.id,
-                "student_id": x.student_id,
-                "invoice_id": x.invoice_id,
-                "amount": x.amount,
-                "status": x.status,
-                "method": x.method,
-                "paid_at": x.paid_at,
-                "created_at": x.created_at,
-            }
-            for x in items
-        ],
-    }
+    rows, total, next_cursor = paginate(
+        db, stmt, page, Payment.created_at, Payment.id, scalars=False
+    )
+    return page_response(row_dicts(rows), total, next_cursor)
 
 @router.post("/payments", response_model=PaymentOut)
 def create_payment(payload: PaymentCreateIn, db: Session = Depends(get_db)):
@@ -185,12 +189,13 @@ def create_payment(payload: PaymentCreateIn, db: Session = Depends(get_db)):
     db.add(p)
 
     # Если указан инвойс — отметим его как оплаченный
-    if payload.invoice_id:
-        inv = db.get(Invoice, payload.invoice_id)
-        if inv:
-            inv.status = "paid"
+    inv = db.get(Invoice, payload.invoice_id) if payload.invoice_id else None
+    if inv:
+        inv.status = "paid"
 
     db.commit()
+    if inv:
+        invalidate("invoices")
     db.refresh(p)
     audit_event(
         "create_payment",
@@ -200,13 +205,4 @@ def create_payment(payload: PaymentCreateIn, db: Session = Depends(get_db)):
         amount=float(p.amount),
         method=p.method,
     )
-    return PaymentOut(
-        id=p.id,
-        student_id=p.student_id,
-        invoice_id=p.invoice_id,
-        amount=p.amount,
-        status=p.status,
-        method=p.method,
-        paid_at=p.paid_at,
-        created_at=p.created_at,
-    )
+    return _as_json(p, _PAYMENT_COLUMNS)
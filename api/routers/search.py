@@ -0,0 +1,28 @@
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import search as search_index
+from deps import get_async_db
+
+router = APIRouter()
+
+
+@router.get("")
+async def search(
+    q: str = Query(
+        ..., min_length=2, description="Слова ищутся по префиксу: «алг геом»"
+    ),
+    types: Optional[
+        List[Literal["student", "assignment", "submission", "bio"]]
+    ] = Query(None, description="Только эти типы (параметр можно повторять)"),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Поиск сразу по ученикам, заданиям, отзывам к сабмитам и био (см. search.py).
+    Результаты ранжированы по релевантности, в highlight совпадения обёрнуты в <mark>.
+    """
+    items = await search_index.search(db, q, limit=limit, kinds=types)
+    return {"q": q, "items": items}
@@ -5,25 +5,10 @@ from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from deps import get_db
-from models import Base, Student, AvatarTheme
-from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import Integer, Text, Date, DateTime, ForeignKey
+from models import Student, StudentBio, AvatarTheme
 
 router = APIRouter()
 
-# --- Локальная ORM-модель для таблицы student_bio (создана миграцией 0003) ---
-class StudentBio(Base):
-    __tablename__ = "student_bio"
-    student_id: Mapped[int] = mapped_column(
-        Integer, ForeignKey("student_profile.id", ondelete="CASCADE"), primary_key=True
-    )
-    started_at: Mapped[date | None] = mapped_column(Date, default=None)
-    goals: Mapped[str | None] = mapped_column(Text, default=None)
-    strengths: Mapped[str | None] = mapped_column(Text, default=None)
-    weaknesses: Mapped[str | None] = mapped_column(Text, default=None)
-    notes: Mapped[str | None] = mapped_column(Text, default=None)
-    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
-
 # --- Schemas ---
 class StudentBioIn(BaseModel):
     started_at: date | None = None
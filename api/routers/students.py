@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, Response, HTTPException
 from pydantic import BaseModel
 from sqlalchemy import select
 from sqlalchemy.orm import Session
-from deps import get_db, pagination, Page
+from deps import get_db, pagination, paginate, Page
 from models import Student
 from audit import audit_event
 
@@ -23,14 +23,14 @@ def list_students(
     stmt = select(Student)
     if q:
         stmt = stmt.where(Student.name.ilike(f"%{q}%"))
-    all_students = db.execute(stmt).scalars().all()
-    response.headers["X-Total-Count"] = str(len(all_students))
-    start = (page.page - 1) * page.size
-    items = [
-        {"id": s.id, "name": s.name, "level": s.level}
-        for s in all_students[start : start + page.size]
-    ]
-    return items
+    students, total, next_cursor = paginate(
+        db, stmt, page, Student.id, Student.id, descending=False
+    )
+    if total is not None:
+        response.headers["X-Total-Count"] = str(total)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [{"id": s.id, "name": s.name, "level": s.level} for s in students]
 
 @router.post("")
 def create_student(payload: StudentCreateIn, db: Session = Depends(get_db)):
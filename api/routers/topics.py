@@ -1,10 +1,16 @@
+from datetime import datetime
+from typing import List
+
 from fastapi import APIRouter, Depends, HTTPException, Query
-from pydantic import BaseModel
-from sqlalchemy import select
+from pydantic import BaseModel, Field
+from sqlalchemy import bindparam, select, update
 from sqlalchemy.orm import Session
 
+from cache import cached, conditional, invalidate
 from deps import get_db
+from hotspots import effective_heat
 from models import Topic, ErrorHotspot
+from sqlutils import dialect_insert, greatest
 
 router = APIRouter()
 
@@ -20,8 +26,19 @@ class HeatIn(BaseModel):
     topic_id: int
     delta: int  # насколько увеличить "heat"
 
+
+class HeatBatchItem(HeatIn):
+    student_id: int
+
+
+class HeatBatchIn(BaseModel):
+    items: List[HeatBatchItem] = Field(..., min_length=1, max_length=1000)
+
+
 # ===== Endpoints =====
 @router.get("")
+@conditional("topics.list", "topics")
+@cached("topics.list", ttl=300, tags=lambda p: ["topics"])
 def list_topics(db: Session = Depends(get_db)):
     rows = db.execute(select(Topic).order_by(Topic.name)).scalars().all()
     return [{"id": t.id, "name": t.name} for t in rows]
@@ -32,29 +49,108 @@ def create_topic(payload: TopicIn, db: Session = Depends(get_db)):
     db.add(t)
     db.commit()
     db.refresh(t)
+    invalidate("topics")
     return {"id": t.id, "name": t.name}
 
+
 @router.get("/heatmap")
+@cached("topics.heatmap", ttl=60, tags=lambda p: [f"heatmap:{p['student_id']}"])
 def student_heatmap(student_id: int = Query(...), db: Session = Depends(get_db)):
+    # heat — затухший к текущему моменту (см. hotspots.py);
+    # за ttl кэша он почти не меняется
     rows = db.execute(
-        select(ErrorHotspot).where(ErrorHotspot.student_id == student_id)
-    ).scalars().all()
+        select(
+            ErrorHotspot.topic_id,
+            effective_heat(datetime.utcnow()).label("heat"),
+            ErrorHotspot.updated_at,
+        ).where(ErrorHotspot.student_id == student_id)
+    ).all()
     return [
-        {"topic_id": h.topic_id, "heat": h.heat, "updated_at": h.updated_at.isoformat()}
+        {
+            "topic_id": h.topic_id,
+            "heat": round(h.heat, 2),
+            "updated_at": h.updated_at.isoformat(),
+        }
         for h in rows
     ]
 
+# ON CONFLICT по uq_hotspot_student_topic: без гонки «select, потом insert»
+# и за один round trip.
+# Существующая строка сначала затухает к now, потом к ней прибавляется дельта.
+_HOTSPOT_KEY = [ErrorHotspot.student_id, ErrorHotspot.topic_id]
+
 @router.post("/heatmap")
 def adjust_heat(student_id: int, payload: HeatIn, db: Session = Depends(get_db)):
-    h = db.scalar(
-        select(ErrorHotspot).where(
-            ErrorHotspot.student_id == student_id, ErrorHotspot.topic_id == payload.topic_id
-        )
+    now = datetime.utcnow()
+    ins = dialect_insert(db, ErrorHotspot).values(
+        student_id=student_id,
+        topic_id=payload.topic_id,
+        heat=max(0, payload.delta),
+        updated_at=now,
+    )
+    heat = db.scalar(
+        ins.on_conflict_do_update(
+            index_elements=_HOTSPOT_KEY,
+            set_={
+                "heat": greatest(0, effective_heat(now) + payload.delta),
+                "updated_at": now,
+            },
+        ).returning(ErrorHotspot.heat)
     )
-    if not h:
-        h = ErrorHotspot(student_id=student_id, topic_id=payload.topic_id, heat=0)
-        db.add(h)
-    h.heat = max(0, (h.heat or 0) + payload.delta)
     db.commit()
-    db.refresh(h)
-    return {"topic_id": h.topic_id, "heat": h.heat}
+    invalidate(f"heatmap:{student_id}")
+    return {"topic_id": payload.topic_id, "heat": round(heat, 2)}
+
+
+@router.post("/heatmap/batch")
+def adjust_heat_batch(payload: HeatBatchIn, db: Session = Depends(get_db)):
+    """
+    Пачка дельт (например, все ошибки одной проверенной контрольной) одной транзакцией.
+    Дубли (student_id, topic_id) суммируются. Положительные дельты — один
+    INSERT ... VALUES (...), (...) ON CONFLICT DO UPDATE
+    SET heat = <затухший heat> + excluded.heat;
+    отрицательные — один executemany UPDATE: новую строку с heat = 0 заводить незачем.
+    """
+    deltas: dict[tuple[int, int], int] = {}
+    for it in payload.items:
+        key = (it.student_id, it.topic_id)
+        deltas[key] = deltas.get(key, 0) + it.delta
+
+    now = datetime.utcnow()
+    up = [
+        {"student_id": s, "topic_id": t, "heat": d, "updated_at": now}
+        for (s, t), d in deltas.items()
+        if d > 0
+    ]
+    down = [{"sid": s, "tid": t, "delta": d} for (s, t), d in deltas.items() if d < 0]
+    if up:
+        ins = dialect_insert(db, ErrorHotspot).values(up)
+        db.execute(
+            ins.on_conflict_do_update(
+                index_elements=_HOTSPOT_KEY,
+                set_={
+                    "heat": effective_heat(now) + ins.excluded.heat,
+                    "updated_at": now,
+                },
+            )
+        )
+    if down:
+        t = ErrorHotspot.__table__
+        # через Connection: ORM-режим «bulk update by PK» не допускает своё WHERE
+        db.connection().execute(
+            update(t)
+            .where(t.c.student_id == bindparam("sid"), t.c.topic_id == bindparam("tid"))
+            .values(
+                heat=greatest(
+                    0,
+                    effective_heat(now, t.c.heat, t.c.updated_at) + bindparam("delta"),
+                ),
+                updated_at=now,
+            ),
+            down,
+        )
+    db.commit()
+
+    students = sorted({s for s, _ in deltas})
+    invalidate(*(f"heatmap:{sid}" for sid in students))
+    return {"pairs": len(deltas), "students": students}
@@ -1,9 +1,10 @@
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
 
+import leaderboard as lb
 from deps import get_db
 from models import Tournament, TournamentParticipant, Student
 
@@ -62,24 +63,55 @@ def join_tournament(tournament_id: int, payload: JoinIn, db: Session = Depends(g
     tp = TournamentParticipant(tournament_id=t.id, student_id=student.id, points=0)
     db.add(tp)
     db.commit()
+    lb.set_points(t.id, student.id, 0)
     return {"status": "joined"}
 
 @router.post("/{tournament_id}/score")
 def add_score(tournament_id: int, payload: ScoreIn, db: Session = Depends(get_db)):
-    tp = db.get(
-        TournamentParticipant, {"tournament_id": tournament_id, "student_id": payload.student_id}
+    # инкремент на стороне БД: параллельные начисления не теряются
+    points = db.scalar(
+        update(TournamentParticipant)
+        .where(
+            TournamentParticipant.tournament_id == tournament_id,
+            TournamentParticipant.student_id == payload.student_id,
+        )
+        .values(points=TournamentParticipant.points + payload.points)
+        .returning(TournamentParticipant.points)
     )
-    if not tp:
+    if points is None:
         raise HTTPException(404, "Not a participant")
-    tp.points += payload.points
     db.commit()
-    return {"points": tp.points}
+    lb.set_points(tournament_id, payload.student_id, points)
+    return {"points": points}
+
 
 @router.get("/{tournament_id}/leaderboard")
-def leaderboard(tournament_id: int, db: Session = Depends(get_db)):
-    rows = db.execute(
-        select(TournamentParticipant).where(TournamentParticipant.tournament_id == tournament_id)
-    ).scalars().all()
-    result = [{"student_id": tp.student_id, "points": tp.points} for tp in rows]
-    result.sort(key=lambda x: x["points"], reverse=True)
-    return {"leaderboard": result}
+def leaderboard(
+    tournament_id: int,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    return {"leaderboard": lb.top(db, tournament_id, limit)}
+
+
+@router.get("/{tournament_id}/leaderboard/{student_id}")
+def leaderboard_rank(
+    tournament_id: int, student_id: int, db: Session = Depends(get_db)
+):
+    row = lb.rank(db, tournament_id, student_id)
+    if row is None:
+        raise HTTPException(404, "Not a participant")
+    return row
+
+
+@router.get("/{tournament_id}/leaderboard/{student_id}/around")
+def leaderboard_around(
+    tournament_id: int,
+    student_id: int,
+    radius: int = Query(5, ge=1, le=50),
+    db: Session = Depends(get_db),
+):
+    items = lb.around(db, tournament_id, student_id, radius)
+    if items is None:
+        raise HTTPException(404, "Not a participant")
+    return {"leaderboard": items}
@@ -0,0 +1,24 @@
+import argparse
+
+from deps import SessionLocal
+from rollups import backfill, rebuild_tutor_counters
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Пересобрать дневные роллапы аналитики и счётчики тьюторов из истории"
+        )
+    )
+    parser.add_argument(
+        "--student-id", type=int, default=None, help="только один ученик"
+    )
+    args = parser.parse_args()
+    with SessionLocal() as db:
+        rows = backfill(db, student_id=args.student_id)
+        tutors = rebuild_tutor_counters(db) if args.student_id is None else 0
+    print(f"Rollups rebuilt: {rows} rows, tutor counters: {tutors} tutors")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,124 @@
+"""
+Бенчмарк сериализации списков: стоимость строки для страницы из --rows счетов.
+
+Сравниваются пути (запрос + сборка + JSON):
+- orm_encoder: select(Invoice) -> ORM-объекты -> dict -> jsonable_encoder -> json
+  (как было);
+- orm_model:   то же + валидация InvoiceOut на каждую строку (как у response_model);
+- core_fast:   select(колонки) -> Core-строки -> responses.dumps (orjson).
+
+Данные — во временной in-memory SQLite (внешние ключи в ней не проверяются,
+ученики не нужны), рабочая БД не трогается.
+"""
+
+import argparse
+import json
+import statistics
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from models import Base, Invoice
+from responses import dumps, row_dicts
+from routers.payments import _INVOICE_COLUMNS, InvoiceOut
+
+
+def _stdlib_json(content) -> bytes:
+    # так JSONResponse FastAPI рендерит результат jsonable_encoder
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode()
+
+
+def _invoice_dict(x: Invoice) -> dict:
+    return {
+        "id": x.id,
+        "student_id": x.student_id,
+        "amount": x.amount,
+        "status": x.status,
+        "due_date": x.due_date,
+        "created_at": x.created_at,
+        "notes": x.notes,
+    }
+
+
+def orm_encoder(db: Session, n: int) -> bytes:
+    items = db.execute(select(Invoice).order_by(Invoice.id).limit(n)).scalars().all()
+    return _stdlib_json(
+        jsonable_encoder({"total": n, "items": [_invoice_dict(x) for x in items]})
+    )
+
+
+def orm_model(db: Session, n: int) -> bytes:
+    items = db.execute(select(Invoice).order_by(Invoice.id).limit(n)).scalars().all()
+    models = [InvoiceOut(**_invoice_dict(x)) for x in items]
+    return _stdlib_json(jsonable_encoder({"total": n, "items": models}))
+
+
+def core_fast(db: Session, n: int) -> bytes:
+    rows = db.execute(select(*_INVOICE_COLUMNS).order_by(Invoice.id).limit(n)).all()
+    return dumps({"total": n, "items": row_dicts(rows)})
+
+
+PATHS = {"orm_encoder": orm_encoder, "orm_model": orm_model, "core_fast": core_fast}
+
+
+def seed(db: Session, n: int) -> None:
+    now = datetime.utcnow()
+    db.execute(
+        insert(Invoice),
+        [
+            {
+                "student_id": 1,
+                "amount": Decimal(1000 + i) / 100,
+                "status": "issued" if i % 3 else "paid",
+                "due_date": date.today() + timedelta(days=i % 30),
+                "created_at": now - timedelta(minutes=i),
+                "notes": f"Счёт №{i}" if i % 2 else None,
+            }
+            for i in range(n)
+        ],
+    )
+    db.commit()
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Стоимость сериализации строки списка: "
+            "ORM + jsonable_encoder против Core + orjson"
+        )
+    )
+    parser.add_argument("--rows", type=int, default=1000, help="строк на странице")
+    parser.add_argument("--repeat", type=int, default=50, help="повторов на путь")
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        seed(db, args.rows)
+        bodies = {}
+        print(f"{'path':<12} {'ms/page':>9} {'us/row':>8} {'bytes':>8}")
+        for name, fn in PATHS.items():
+            fn(db, args.rows)  # прогрев: кэш компиляции SQL, импорты
+            timings = []
+            for _ in range(args.repeat):
+                # без identity map: каждая итерация гидрирует объекты заново
+                db.expunge_all()
+                t0 = time.perf_counter()
+                bodies[name] = fn(db, args.rows)
+                timings.append(time.perf_counter() - t0)
+            ms = statistics.median(timings) * 1000
+            per_row = ms * 1000 / args.rows
+            print(f"{name:<12} {ms:>9.2f} {per_row:>8.1f} {len(bodies[name]):>8}")
+
+    # быстрый путь отдаёт те же данные, что и старый
+    assert json.loads(bodies["core_fast"]) == json.loads(bodies["orm_encoder"])
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,273 @@
+"""
+Полнотекстовый поиск по ученикам, заданиям, отзывам к сабмитам и био.
+
+Индекс — отдельная таблица документов (kind, ref_id, student_id, body), которую
+синхронизируют триггеры БД на student_profile / assignment / submission / student_bio,
+поэтому её не забудет обновить ни один пишущий код (эндпоинты, импорты, сиды).
+
+- Postgres: таблица search_document с tsvector (GIN) и pg_trgm (GIN) по body;
+  создаётся миграцией 0011. Совпадение — по префиксам слов или по похожести запроса
+  на слова документа (word_similarity, опечатки). Подсветку строит highlight():
+  ts_headline по tsquery не отметил бы слова, совпавшие только по триграммам.
+- SQLite: виртуальная таблица FTS5 search_fts; создаётся install_sqlite() при
+  старте (deps.py), потому что dev-база собирается через create_all, а не Alembic.
+  rowid документа = ref_id * 4 + kind — удаление/замена в триггерах идёт по rowid.
+"""
+
+import html
+import re
+from typing import Any, Optional, Sequence
+
+from sqlalchemy import (
+    Column,
+    Integer,
+    MetaData,
+    SmallInteger,
+    Table,
+    Text,
+    func,
+    literal,
+    or_,
+    select,
+    text,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+KINDS = ("student", "assignment", "submission", "bio")  # индекс = код kind в индексе
+
+# highlight — HTML: текст документа экранируется, разметка — только эти теги
+HIGHLIGHT_START, HIGHLIGHT_STOP = "<mark>", "</mark>"
+# snippet() FTS5 ставит маркеры до экранирования — берём символы, которых
+# нет в HTML-разметке, и после html.escape заменяем их на теги
+_SQLITE_START, _SQLITE_STOP = "\x02", "\x03"
+SNIPPET_WORDS = 16
+# порог похожести слова на слово запроса для подсветки —
+# как pg_trgm.word_similarity_threshold
+WORD_SIMILARITY = 0.6
+
+# Postgres: таблицу создаёт миграция, здесь — только описание для запросов
+search_document = Table(
+    "search_document",
+    MetaData(),
+    Column("kind", SmallInteger, primary_key=True),
+    Column("ref_id", Integer, primary_key=True),
+    Column("student_id", Integer),
+    Column("body", Text),
+    Column("tsv", TSVECTOR),
+)
+
+# ===== SQLite: FTS5 + триггеры =====
+
+# (kind, таблица, ref_id, student_id, текст документа,
+#  колонки, при изменении которых документ пересобирается)
+_SQLITE_SOURCES = (
+    (0, "student_profile", "{r}.id", "{r}.id", "{r}.name", ("name",)),
+    (1, "assignment", "{r}.id", "{r}.student_id", "{r}.title", ("title", "student_id")),
+    (
+        2,
+        "submission",
+        "{r}.id",
+        "(SELECT student_id FROM assignment WHERE id = {r}.assignment_id)",
+        "{r}.feedback",
+        ("feedback",),
+    ),
+    (
+        3,
+        "student_bio",
+        "{r}.student_id",
+        "{r}.student_id",
+        "trim(coalesce({r}.goals || ' ', '') || coalesce({r}.strengths || ' ', '') || "
+        "coalesce({r}.weaknesses || ' ', '') || coalesce({r}.notes, ''))",
+        ("goals", "strengths", "weaknesses", "notes"),
+    ),
+)
+
+
+def _insert_doc(
+    kind: int, ref: str, student: str, body: str, r: str, source: str = ""
+) -> str:
+    """
+    INSERT документа из строки r (NEW в триггере или имя таблицы при наполнении);
+    пустой текст не индексируем.
+    """
+    ref, student, body = (x.format(r=r) for x in (ref, student, body))
+    return (
+        f"INSERT INTO search_fts (rowid, body, kind, ref_id, student_id) "
+        f"SELECT {ref} * 4 + {kind}, {body}, {kind}, {ref}, {student} {source}"
+        f"WHERE coalesce({body}, '') <> ''"
+    )
+
+
+def _sqlite_statements() -> list[str]:
+    stmts = [
+        "CREATE VIRTUAL TABLE search_fts USING fts5("
+        "body, kind UNINDEXED, ref_id UNINDEXED, student_id UNINDEXED, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    ]
+    for kind, table, ref, student, body, cols in _SQLITE_SOURCES:
+        insert_new = _insert_doc(kind, ref, student, body, "NEW")
+        delete_old = (
+            f"DELETE FROM search_fts WHERE rowid = {ref.format(r='OLD')} * 4 + {kind}"
+        )
+        stmts += [
+            f"CREATE TRIGGER trg_search_{table}_ai AFTER INSERT ON {table} "
+            f"BEGIN {insert_new}; END",
+            f"CREATE TRIGGER trg_search_{table}_au "
+            f"AFTER UPDATE OF {', '.join(cols)} ON {table} "
+            f"BEGIN {delete_old}; {insert_new}; END",
+            f"CREATE TRIGGER trg_search_{table}_ad AFTER DELETE ON {table} "
+            f"BEGIN {delete_old}; END",
+            # начальное наполнение из уже существующих строк
+            _insert_doc(kind, ref, student, body, table, f"FROM {table} "),
+        ]
+    return stmts
+
+
+def install_sqlite(conn: Connection) -> bool:
+    """Создаёт FTS-индекс и триггеры, если их ещё нет. True — индекс создан сейчас."""
+    exists = conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_fts'"
+    ).first()
+    if exists:
+        return False
+    for stmt in _sqlite_statements():
+        conn.exec_driver_sql(stmt)
+    return True
+
+
+# ===== Запрос =====
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokens(q: str) -> list[str]:
+    return [t.lower() for t in _TOKEN.findall(q)][:8]
+
+
+def _kind_codes(kinds: Optional[Sequence[str]]) -> Optional[list[int]]:
+    return [KINDS.index(k) for k in kinds] if kinds else None
+
+
+def _postgres_stmt(q: str, words: list[str], limit: int, kinds: Optional[list[int]]):
+    d = search_document.c
+    # каждое слово — префикс: "алг геом" ~ алг:* & геом:*
+    tsq = func.to_tsquery("simple", " & ".join(f"{w}:*" for w in words))
+    # похожесть запроса на лучший фрагмент документа, а не на весь текст:
+    # для длинных отзывов и био similarity(body, q) не дотягивал бы до порога
+    similarity = func.word_similarity(q, d.body)
+    rank = func.ts_rank(d.tsv, tsq) + similarity
+    stmt = (
+        select(d.kind, d.ref_id, d.student_id, d.body, rank.label("score"))
+        # оба условия обслуживаются GIN-индексами (BitmapOr)
+        .where(or_(d.tsv.op("@@")(tsq), literal(q).op("<%")(d.body)))
+        .order_by(rank.desc())
+        .limit(limit)
+    )
+    if kinds is not None:
+        stmt = stmt.where(d.kind.in_(kinds))
+    return stmt
+
+
+def _trigrams(word: str) -> set[str]:
+    # как в pg_trgm: слово дополняется двумя пробелами слева и одним справа
+    padded = f"  {word} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def _similarity(a: str, b: str) -> float:
+    ta, tb = _trigrams(a), _trigrams(b)
+    return len(ta & tb) / len(ta | tb)
+
+
+def highlight(body: str, words: list[str]) -> str:
+    """
+    Фрагмент body до SNIPPET_WORDS слов с отмеченными словами запроса: по префиксу
+    или по триграммной похожести. Ничего не отмечено — отмечаем самое похожее слово.
+    """
+    parts = _TOKEN.split(body)  # слова документа — между кусками-разделителями
+    tokens = _TOKEN.findall(body)
+    if not tokens:
+        return html.escape(body)
+    scores = [
+        max(
+            1.0 if t.lower().startswith(w) else _similarity(t.lower(), w) for w in words
+        )
+        for t in tokens
+    ]
+    marked = {i for i, sc in enumerate(scores) if sc >= WORD_SIMILARITY}
+    if not marked:
+        marked = {max(range(len(tokens)), key=scores.__getitem__)}
+    first = min(marked)
+    start = max(0, min(first - SNIPPET_WORDS // 4, len(tokens) - SNIPPET_WORDS))
+    end = min(len(tokens), start + SNIPPET_WORDS)
+    out = ["…"] if start > 0 else [html.escape(parts[0])]
+    for i in range(start, end):
+        if i > start:
+            out.append(html.escape(parts[i]))
+        word = html.escape(tokens[i])
+        out.append(f"{HIGHLIGHT_START}{word}{HIGHLIGHT_STOP}" if i in marked else word)
+    out.append("…" if end < len(tokens) else html.escape(parts[end]))
+    return "".join(out).strip()
+
+
+def _sqlite_highlight(snippet: str) -> str:
+    """Результат snippet() -> HTML: экранируем текст, маркеры меняем на теги."""
+    # \x02/\x03 в самом тексте дадут лишний <mark>, но не произвольную разметку
+    escaped = html.escape(snippet or "")
+    return escaped.replace(_SQLITE_START, HIGHLIGHT_START).replace(
+        _SQLITE_STOP, HIGHLIGHT_STOP
+    )
+
+
+def _sqlite_stmt(words: list[str], limit: int, kinds: Optional[list[int]]):
+    match = " ".join(f'"{w}"*' for w in words)
+    kind_filter = (
+        f"AND kind IN ({', '.join(str(k) for k in kinds)})" if kinds is not None else ""
+    )
+    # rank — встроенный bm25 FTS5 (меньше — лучше);
+    # наружу отдаём «больше — лучше», как в Postgres.
+    # snippet() считается только для строк после LIMIT
+    return text(f"""
+        SELECT kind, ref_id, student_id,
+               snippet(search_fts, 0, :hl_start, :hl_stop, '…', :words) AS highlight,
+               -rank AS score
+        FROM search_fts
+        WHERE search_fts MATCH :match {kind_filter}
+        ORDER BY rank
+        LIMIT :limit
+        """).bindparams(
+        match=match,
+        limit=limit,
+        hl_start=_SQLITE_START,
+        hl_stop=_SQLITE_STOP,
+        words=SNIPPET_WORDS,
+    )
+
+
+async def search(
+    db: AsyncSession, q: str, limit: int = 20, kinds: Optional[Sequence[str]] = None
+) -> list[dict[str, Any]]:
+    """Документы всех типов по рангу: [{type, id, student_id, highlight, score}]."""
+    words = tokens(q)
+    if not words:
+        return []
+    codes = _kind_codes(kinds)
+    postgres = db.get_bind().dialect.name == "postgresql"
+    if postgres:
+        stmt = _postgres_stmt(q, words, limit, codes)
+    else:
+        stmt = _sqlite_stmt(words, limit, codes)
+    return [
+        {
+            "type": KINDS[r.kind],
+            "id": r.ref_id,
+            "student_id": r.student_id,
+            "highlight": (
+                highlight(r.body, words) if postgres else _sqlite_highlight(r.highlight)
+            ),
+            "score": round(float(r.score), 4),
+        }
+        for r in await db.execute(stmt)
+    ]
@@ -1,17 +1,112 @@
 from passlib.context import CryptContext
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-import jwt, os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from time import perf_counter
+from typing import Optional
+import asyncio, atexit, hashlib, jwt, logging, os, time
 
-pwd = CryptContext(schemes=["argon2"], deprecated="auto")
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+
+from metrics import (
+    PASSWORD_HASH_INFLIGHT,
+    PASSWORD_HASH_LATENCY,
+    PASSWORD_HASH_REJECTED,
+)
+
+# Стоимость Argon2 настраивается окружением; хэши со старыми параметрами
+# прозрачно пересчитываются при успешном логине (см. verify_password_async).
+ARGON2_TIME_COST = int(os.environ.get("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.environ.get("ARGON2_MEMORY_COST", "65536"))  # KiB
+ARGON2_PARALLELISM = int(os.environ.get("ARGON2_PARALLELISM", "4"))
+
+# Пул процессов для хэширования: отдельный от тредпула Starlette и без GIL
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", "2"))
+# Сколько операций (в работе + в очереди) допускаем, прежде чем отвечать 503
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", "32"))
+
+pwd = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__time_cost=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM,
+)
 SECRET = os.environ.get("SECRET_KEY", "devsecret")
 ALGO = "HS256"
 
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+# Кэш проверенных токенов: размер LRU и верхняя граница жизни записи
+# (смена роли/удаление пользователя доходят до кэша не позже чем через max_ttl)
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_MAX_TTL = float(os.environ.get("TOKEN_CACHE_MAX_TTL", "300"))
+TOKEN_REDIS_TIMEOUT = float(os.environ.get("TOKEN_REDIS_TIMEOUT", "0.05"))
+
+log = logging.getLogger("api.security")
+
+
+class HashingPoolSaturated(RuntimeError):
+    """Очередь пула хэширования заполнена — вызывающий код должен ответить 503."""
+
+
 def hash_password(password: str) -> str:
     return pwd.hash(password)
 
 def verify_password(password: str, hashed: str) -> bool:
     return pwd.verify(password, hashed)
 
+
+def verify_and_update(password: str, hashed: str) -> tuple[bool, Optional[str]]:
+    """(ok, new_hash): new_hash не None, если хэш собран со старыми параметрами."""
+    return pwd.verify_and_update(password, hashed)
+
+
+# ===== Пул процессов =====
+_pool: Optional[ProcessPoolExecutor] = None
+_pending = 0  # трогается только из event loop, блокировка не нужна
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, а не fork: в API-процессе уже крутятся потоки (логи, аудит)
+        _pool = ProcessPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS, mp_context=get_context("spawn")
+        )
+        atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+    return _pool
+
+
+async def _run_in_pool(op: str, fn, *args):
+    global _pending
+    if _pending >= PASSWORD_HASH_MAX_PENDING:
+        PASSWORD_HASH_REJECTED.labels(op=op).inc()
+        raise HashingPoolSaturated(op)
+
+    _pending += 1
+    PASSWORD_HASH_INFLIGHT.inc()
+    start = perf_counter()
+    try:
+        return await asyncio.wrap_future(_get_pool().submit(fn, *args))
+    finally:
+        _pending -= 1
+        PASSWORD_HASH_INFLIGHT.dec()
+        PASSWORD_HASH_LATENCY.labels(op=op).observe(perf_counter() - start)
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_in_pool("hash", hash_password, password)
+
+
+async def verify_password_async(
+    password: str, hashed: str
+) -> tuple[bool, Optional[str]]:
+    return await _run_in_pool("verify", verify_and_update, password, hashed)
+
+
 def make_token(sub: int, role: str, hours: int = 8) -> str:
     payload = {
         "sub": sub,
@@ -19,3 +114,138 @@ def make_token(sub: int, role: str, hours: int = 8) -> str:
         "exp": datetime.utcnow() + timedelta(hours=hours),
     }
     return jwt.encode(payload, SECRET, algorithm=ALGO)
+
+
+def decode_token(token: str) -> dict:
+    """Проверяет подпись и exp; бросает jwt.InvalidTokenError."""
+    return jwt.decode(
+        token, SECRET, algorithms=[ALGO], options={"require": ["exp", "sub"]}
+    )
+
+
+# ===== Кэш проверенных токенов и отзыв =====
+DENY_KEY = "auth:deny:{}"  # SET на время жизни токена
+REVOKE_CHANNEL = "auth:revoked"  # pub/sub: "t:<hash>" — отозванный токен
+
+_r = aioredis.from_url(
+    REDIS_URL,
+    socket_timeout=TOKEN_REDIS_TIMEOUT,
+    socket_connect_timeout=TOKEN_REDIS_TIMEOUT,
+)
+
+
+@dataclass(frozen=True, slots=True)
+class AuthUser:
+    id: int
+    email: str
+    role: str
+
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenCache:
+    """
+    LRU «hash(токен) -> AuthUser» с TTL до exp токена (но не дольше max_ttl).
+    Живёт в памяти процесса; отзыв между воркерами — через pub/sub
+    (см. listen_revocations).
+    """
+
+    def __init__(
+        self, size: int = TOKEN_CACHE_SIZE, max_ttl: float = TOKEN_CACHE_MAX_TTL
+    ) -> None:
+        self.size = size
+        self.max_ttl = max_ttl
+        self._items: "OrderedDict[str, tuple[float, AuthUser]]" = OrderedDict()
+
+    def get(self, key: str, now: Optional[float] = None) -> Optional[AuthUser]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        expires_at, user = item
+        if (now or time.time()) >= expires_at:
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return user
+
+    def put(
+        self, key: str, user: AuthUser, exp: float, now: Optional[float] = None
+    ) -> None:
+        self._items[key] = (min(exp, (now or time.time()) + self.max_ttl), user)
+        self._items.move_to_end(key)
+        if len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+    def drop(self, key: str) -> None:
+        self._items.pop(key, None)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+
+token_cache = TokenCache()
+_listener: Optional[asyncio.Task] = None
+
+
+def _apply_revocation(message: str) -> None:
+    kind, _, value = message.partition(":")
+    if kind == "t":
+        token_cache.drop(value)
+
+
+async def listen_revocations() -> None:
+    """Подписка на REVOKE_CHANNEL; при обрыве переподключается."""
+    while True:
+        try:
+            pubsub = _r.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(REVOKE_CHANNEL)
+            try:
+                while True:
+                    msg = await pubsub.get_message(timeout=1.0)
+                    if msg and msg.get("type") == "message":
+                        data = msg["data"]
+                        _apply_revocation(
+                            data.decode() if isinstance(data, bytes) else str(data)
+                        )
+            finally:
+                await pubsub.aclose()
+        except asyncio.CancelledError:
+            raise
+        except (RedisError, OSError, asyncio.TimeoutError) as exc:
+            # пока подписки нет — кэш всё равно живёт не дольше max_ttl
+            token_cache.clear()
+            log.warning("auth_revocation_listener_failed", extra={"error": str(exc)})
+            await asyncio.sleep(1.0)
+
+
+def ensure_revocation_listener() -> None:
+    global _listener
+    if _listener is None or _listener.done():
+        _listener = asyncio.get_running_loop().create_task(listen_revocations())
+
+
+async def is_revoked(key: str) -> bool:
+    try:
+        return bool(await _r.exists(DENY_KEY.format(key)))
+    except (RedisError, OSError, asyncio.TimeoutError) as exc:
+        # Redis недоступен — подпись и exp уже проверены, пропускаем (fail-open)
+        log.warning("auth_deny_list_unavailable", extra={"error": str(exc)})
+        return False
+
+
+async def revoke_token(token: str, exp: float) -> None:
+    """Заносит токен в deny-list до его exp и рассылает инвалидацию всем воркерам."""
+    key = token_hash(token)
+    token_cache.drop(key)
+    ttl = max(1, int(exp - time.time()))
+    try:
+        async with _r.pipeline(transaction=False) as pipe:
+            pipe.set(DENY_KEY.format(key), 1, ex=ttl)
+            pipe.publish(REVOKE_CHANNEL, f"t:{key}")
+            await pipe.execute()
+    except (RedisError, OSError, asyncio.TimeoutError) as exc:
+        # без Redis отзыв только локальный:
+        # другие воркеры держат токен не дольше max_ttl
+        log.warning("auth_revoke_unavailable", extra={"error": str(exc)})
@@ -0,0 +1,124 @@
+"""
+Мелочи SQL, которые пишутся по-разному в Postgres и SQLite (dev/тесты).
+"""
+
+from typing import Any
+
+from sqlalchemy import Date, Float
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.elements import BindParameter
+from sqlalchemy.sql.functions import FunctionElement, GenericFunction
+from sqlalchemy.sql.visitors import InternalTraversal
+
+
+class greatest(GenericFunction):
+    """GREATEST(a, b, ...); в SQLite — скалярный max(a, b, ...)."""
+
+    name = "greatest"
+    inherit_cache = True
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # тип результата — тип первого аргумента, который не литерал (heat и т.п.):
+        # в greatest(0, heat + x) это Float, а не Integer от 0
+        clauses = self.clause_expr.element.clauses
+        typed = [c for c in clauses if not c.type._isnull]
+        exprs = [c for c in typed if not isinstance(c, BindParameter)]
+        if exprs or typed:
+            self.type = (exprs or typed)[0].type
+
+
+@compiles(greatest, "sqlite")
+def _greatest_sqlite(element, compiler, **kw):
+    return "max(%s)" % compiler.process(element.clause_expr.element, **kw)
+
+
+def dialect_insert(db, table):
+    """
+    INSERT диалекта текущего подключения — с .on_conflict_do_update() и .excluded.
+    db — Session или AsyncSession.
+    """
+    name = db.get_bind().dialect.name
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:  # pragma: no cover - других БД в проекте нет
+        raise NotImplementedError(f"ON CONFLICT is not supported for dialect {name!r}")
+    return insert(table)
+
+
+class age_days(FunctionElement):
+    """Возраст метки времени ts на момент now в сутках (дробных): age_days(ts, now)."""
+
+    type = Float()
+    inherit_cache = True
+
+
+@compiles(age_days)
+def _age_days_default(element, compiler, **kw):
+    ts, now = (compiler.process(c, **kw) for c in element.clauses)
+    return "(EXTRACT(EPOCH FROM (%s - %s)) / 86400.0)" % (now, ts)
+
+
+@compiles(age_days, "sqlite")
+def _age_days_sqlite(element, compiler, **kw):
+    ts, now = (compiler.process(c, **kw) for c in element.clauses)
+    return "(julianday(%s) - julianday(%s))" % (now, ts)
+
+
+class time_bucket(FunctionElement):
+    """
+    Начало интервала (дата), в который попадает ts: time_bucket("day"|"week", ts).
+    Неделя — с понедельника, как date_trunc('week') в Postgres.
+    """
+
+    type = Date()
+    inherit_cache = True
+    # granularity входит в ключ кэша компиляции: день и неделя — разный SQL
+    _traverse_internals = FunctionElement._traverse_internals + [
+        ("granularity", InternalTraversal.dp_string)
+    ]
+
+    def __init__(self, granularity: str, ts: Any) -> None:
+        if granularity not in ("day", "week"):
+            raise ValueError(f"Unsupported granularity {granularity!r}")
+        self.granularity = granularity
+        super().__init__(ts)
+
+
+@compiles(time_bucket)
+def _time_bucket_default(element, compiler, **kw):
+    return "CAST(date_trunc('%s', %s) AS DATE)" % (
+        element.granularity,
+        compiler.process(element.clauses, **kw),
+    )
+
+
+@compiles(time_bucket, "sqlite")
+def _time_bucket_sqlite(element, compiler, **kw):
+    ts = compiler.process(element.clauses, **kw)
+    if element.granularity == "day":
+        return "date(%s)" % ts
+    # 'weekday 0' — ближайшее воскресенье не раньше ts, минус 6 дней — понедельник
+    return "date(%s, 'weekday 0', '-6 days')" % ts
+
+
+def _power(base, exp):
+    if base is None or exp is None:
+        return None
+    try:
+        return float(base) ** float(exp)
+    except (OverflowError, ZeroDivisionError):
+        return None
+
+
+# Функции, которых нет в SQLite без SQLITE_ENABLE_MATH_FUNCTIONS,
+# регистрируются на connect
+SQLITE_FUNCTIONS = {"power": (2, _power)}
+
+
+def register_sqlite_functions(dbapi_conn, _record=None) -> None:
+    """Обработчик события "connect" для sync- и async-движков SQLite (см. deps.py)."""
+    for name, (nargs, fn) in SQLITE_FUNCTIONS.items():
+        dbapi_conn.create_function(name, nargs, fn, deterministic=True)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# тесты без HTTP импортируют модули приложения напрямую
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
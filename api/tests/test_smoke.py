@@ -1,8 +1,14 @@
+import logging
 import os
+import threading
 import time
+from datetime import date, timedelta
+
 import requests
 
 BASE = os.getenv("BASE", "http://localhost:8000")
+# Метрики rq-воркеров отдаёт отдельный exporter (multiprocess-режим)
+WORKER_METRICS = os.getenv("WORKER_METRICS", "http://localhost:9101/metrics")
 
 def test_health():
     r = requests.get(f"{BASE}/health")
@@ -26,6 +32,27 @@ def test_auth_and_students():
     r = requests.get(f"{BASE}/students", headers={"Authorization": f"Bearer {token}"})
     assert r.status_code == 200
 
+
+def test_me_and_logout():
+    requests.post(
+        f"{BASE}/auth/register",
+        json={"email": "logout@example.com", "password": "secret", "role": "tutor"},
+    )
+    r = requests.post(
+        f"{BASE}/auth/login", json={"email": "logout@example.com", "password": "secret"}
+    )
+    headers = {"Authorization": f"Bearer {r.json()['token']}"}
+
+    r = requests.get(f"{BASE}/auth/me", headers=headers)
+    assert r.status_code == 200
+    assert r.json()["email"] == "logout@example.com"
+
+    assert requests.post(f"{BASE}/auth/logout", headers=headers).status_code == 200
+    # отозванный токен больше не принимается (в том числе из кэша)
+    assert requests.get(f"{BASE}/auth/me", headers=headers).status_code == 401
+    assert requests.get(f"{BASE}/auth/me").status_code == 401
+
+
 def test_metrics_and_notifications():
     # Доступность /metrics
     r = requests.get(f"{BASE}/metrics")
@@ -46,4 +73,73 @@ def test_metrics_and_notifications():
     # Повторная проверка метрик — должен расти счётчик запросов
     r2 = requests.get(f"{BASE}/metrics")
     assert r2.status_code == 200
-    assert "mail_sent_total" in r2.text  # метрика из jobs.send_email
+    assert "jobs_sent_total" in r2.text  # постановка задачи считается в API
+
+    # mail_sent_total инкрементится в процессе rq-воркера — смотрим его exporter
+    r3 = requests.get(WORKER_METRICS)
+    assert r3.status_code == 200
+    assert "mail_sent_total" in r3.text  # метрика из jobs.send_email
+
+
+def test_weekly_digest_dry_run():
+    r = requests.post(f"{BASE}/notifications/digest/run", params={"dry_run": "true"})
+    assert r.status_code == 200
+    report = r.json()
+    assert report["dry_run"] is True
+    assert report["emails"] == report["students"]
+    assert "total_seconds" in report
+
+
+def test_dashboard_overview_series():
+    r = requests.get(f"{BASE}/dashboard/overview", params={"granularity": "day"})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["granularity"] == "day"
+    assert isinstance(body["students_count"], int)
+    dates = [p["date"] for p in body["lessons_series"]]
+    assert dates == sorted(dates)
+    assert (
+        requests.get(
+            f"{BASE}/dashboard/overview", params={"granularity": "month"}
+        ).status_code
+        == 422
+    )
+
+
+def test_dashboard_headline_counts_match_data():
+    # свой набор параметров — не попадаем в ответ, закэшированный другим тестом
+    params = {
+        "granularity": "week",
+        "date_from": (date.today() - timedelta(days=13)).isoformat(),
+    }
+    body = requests.get(f"{BASE}/dashboard/overview", params=params).json()
+    students_total = int(
+        requests.get(f"{BASE}/students", params={"size": 1}).headers["X-Total-Count"]
+    )
+    lessons_total = requests.get(f"{BASE}/lessons", params={"size": 1}).json()["total"]
+    assert body["students_count"] == students_total
+    assert body["lessons_count"] == lessons_total
+
+
+def test_request_id_filter_keeps_explicit_value():
+    from logging_config import RequestIdFilter
+
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    handler.addFilter(RequestIdFilter())
+    logger = logging.getLogger("test.request_id")
+    logger.addHandler(handler)
+    try:
+        # как поток аудита: контекста запроса нет, id передан явно
+        worker = threading.Thread(
+            target=logger.warning,
+            args=("audit",),
+            kwargs={"extra": {"request_id": "r-1"}},
+        )
+        worker.start()
+        worker.join()
+        logger.warning("no_request")
+    finally:
+        logger.removeHandler(handler)
+    assert [r.request_id for r in records] == ["r-1", None]
@@ -1,4 +1,7 @@
+import base64
+import json
 import os
+import time
 import requests
 from datetime import datetime, timedelta
 
@@ -32,6 +35,78 @@ def test_assignments_crud():
     assert r.status_code == 200
     assert "items" in r.json()
 
+
+def test_submit_batch():
+    ids = [
+        requests.post(
+            f"{BASE}/assignments", json={"student_id": 1, "reward_type": "star"}
+        ).json()["id"]
+        for _ in range(2)
+    ]
+    r = requests.post(
+        f"{BASE}/assignments/submit-batch",
+        json={
+            "items": [{"assignment_id": i, "grade": 5} for i in ids]
+            + [{"assignment_id": 10**9}]
+        },
+    )
+    assert r.status_code == 200
+    body = r.json()
+    assert body["submitted"] == 2
+    assert [x["status"] for x in body["items"]] == ["done", "done", "not_found"]
+    assert all(x["gained_points"] == 20 for x in body["items"][:2])
+
+
+def test_lessons_bulk_csv():
+    start = datetime.utcnow() + timedelta(days=3)
+    body = (
+        "student_id,date,topic\n"
+        + "".join(
+            f"1,{(start + timedelta(hours=i)).isoformat()},bulk {i}\n"
+            for i in range(50)
+        )
+        + "999999,2030-01-01T10:00:00,missing\n"
+    )
+    r = requests.post(
+        f"{BASE}/lessons/bulk", data=body.encode(), headers={"Content-Type": "text/csv"}
+    )
+    assert r.status_code == 200
+    res = r.json()
+    assert res["created"] == 50
+    assert res["failed"] == 1
+    assert res["items"][-1]["error"] == "Student not found"
+    assert all(isinstance(x["id"], int) for x in res["items"][:50])
+
+
+def test_heat_batch():
+    tid = requests.post(
+        f"{BASE}/topics", json={"name": f"heat-batch-{time.time()}"}
+    ).json()["id"]
+    r = requests.post(
+        f"{BASE}/topics/heatmap/batch",
+        json={
+            "items": [
+                {"student_id": 1, "topic_id": tid, "delta": 2},
+                {"student_id": 1, "topic_id": tid, "delta": 3},
+                {"student_id": 2, "topic_id": tid, "delta": -4},
+            ]
+        },
+    )
+    assert r.status_code == 200
+    assert r.json()["students"] == [1, 2]
+    heat = {
+        h["topic_id"]: h["heat"]
+        for h in requests.get(f"{BASE}/topics/heatmap", params={"student_id": 1}).json()
+    }
+    assert heat[tid] == 5
+    r = requests.post(
+        f"{BASE}/topics/heatmap",
+        params={"student_id": 1},
+        json={"topic_id": tid, "delta": -10},
+    )
+    assert r.json()["heat"] == 0
+
+
 def test_analytics_and_radar():
     r = requests.get(f"{BASE}/analytics/exam-forecast", params={"student_id": 1})
     assert r.status_code == 200
@@ -41,6 +116,45 @@ def test_analytics_and_radar():
     assert r.status_code == 200
     assert "items" in r.json()
 
+
+def test_tempo_and_forecast_follow_submissions():
+    before = requests.get(
+        f"{BASE}/analytics/exam-forecast", params={"student_id": 1}
+    ).json()["subs"]
+    aid = requests.post(f"{BASE}/assignments", json={"student_id": 1}).json()["id"]
+    requests.post(f"{BASE}/assignments/{aid}/submit", json={"grade": 4})
+    r = requests.get(f"{BASE}/analytics/exam-forecast", params={"student_id": 1})
+    assert r.json()["subs"] == before + 1
+    tempo = requests.get(
+        f"{BASE}/analytics/tempo", params={"student_id": 1, "days": 7}
+    ).json()
+    assert tempo["frequency_per_day"] > 0
+    assert tempo["avg_grade"] is not None
+
+
+def test_exam_forecast_batch():
+    r = requests.post(
+        f"{BASE}/analytics/exam-forecast/batch", json={"student_ids": [1, 2, 10**9]}
+    )
+    assert r.status_code == 200
+    items = r.json()["items"]
+    assert [x["student_id"] for x in items] == [1, 2]
+    assert all(0 <= x["predicted_score"] <= 100 for x in items)
+    single = requests.get(
+        f"{BASE}/analytics/exam-forecast", params={"student_id": 1}
+    ).json()
+    assert single["predicted_score"] == items[0]["predicted_score"]
+
+
+def test_priority_radar_top_k():
+    r = requests.get(f"{BASE}/analytics/priority-radar", params={"limit": 2})
+    assert r.status_code == 200
+    items = r.json()["items"]
+    assert len(items) <= 2
+    scores = [x["score"] for x in items]
+    assert scores == sorted(scores, reverse=True)
+
+
 def test_mems_and_tournaments():
     # мем
     r = requests.post(f"{BASE}/mems", json={"url": "https://i.imgflip.com/1bij.jpg", "caption": "go!", "student_id": 1})
@@ -66,3 +180,115 @@ def test_mems_and_tournaments():
     r = requests.get(f"{BASE}/tournaments/{tid}/leaderboard")
     assert r.status_code == 200
     assert "leaderboard" in r.json()
+    assert r.json()["leaderboard"][0] == {"student_id": 1, "points": 3, "rank": 1}
+
+    r = requests.get(f"{BASE}/tournaments/{tid}/leaderboard/1")
+    assert r.status_code == 200
+    assert r.json()["rank"] == 1
+
+    r = requests.get(
+        f"{BASE}/tournaments/{tid}/leaderboard/1/around", params={"radius": 2}
+    )
+    assert r.status_code == 200
+    assert [x["student_id"] for x in r.json()["leaderboard"]] == [1]
+
+
+def test_keyset_pagination():
+    requests.post(
+        f"{BASE}/mems", json={"url": "https://i.imgflip.com/1bij.jpg", "student_id": 1}
+    )
+    requests.post(
+        f"{BASE}/mems", json={"url": "https://i.imgflip.com/1bij.jpg", "student_id": 1}
+    )
+
+    r = requests.get(f"{BASE}/mems", params={"size": 1})
+    assert r.status_code == 200
+    first = r.json()
+    assert first["next_cursor"]
+
+    r = requests.get(
+        f"{BASE}/mems",
+        params={"size": 1, "cursor": first["next_cursor"], "with_total": False},
+    )
+    assert r.status_code == 200
+    second = r.json()
+    assert second["total"] is None
+    assert second["items"][0]["id"] < first["items"][0]["id"]
+
+
+def test_cursor_with_unexpected_value_is_rejected():
+    for value in ([{"a": 1}, 2], [[1], 2], [True, 2], ["2030-01-01", "x"], [{"dt": 1}, 2]):
+        raw = json.dumps(value).encode()
+        cursor = base64.urlsafe_b64encode(raw).decode().rstrip("=")
+        r = requests.get(f"{BASE}/lessons", params={"cursor": cursor})
+        assert r.status_code == 400, (value, r.status_code)
+
+
+def test_audit_events_are_stored():
+    r = requests.post(f"{BASE}/assignments", json={"student_id": 1, "title": "Аудит"})
+    assert r.status_code == 200
+    aid = r.json()["id"]
+
+    # события пишутся фоновым потоком пачками — даём ему сбросить буфер
+    time.sleep(2)
+
+    r = requests.get(
+        f"{BASE}/audit", params={"action": "create_assignment", "student_id": 1}
+    )
+    assert r.status_code == 200
+    assert any(e["payload"].get("assignment_id") == aid for e in r.json()["items"])
+
+
+def test_search_mixed_entities():
+    tag = f"zeta{int(time.time())}"
+    aid = requests.post(
+        f"{BASE}/assignments", json={"student_id": 1, "title": f"Тема {tag} дроби"}
+    ).json()["id"]
+    requests.put(f"{BASE}/students/1/bio", json={"notes": f"повторить {tag}"})
+    r = requests.get(f"{BASE}/search", params={"q": tag[:-2]})
+    assert r.status_code == 200
+    items = r.json()["items"]
+    assert {(x["type"], x["id"]) for x in items} >= {("assignment", aid), ("bio", 1)}
+    assert all("<mark>" in x["highlight"] for x in items)
+    only_bio = requests.get(f"{BASE}/search", params={"q": tag, "types": "bio"}).json()[
+        "items"
+    ]
+    assert [x["type"] for x in only_bio] == ["bio"]
+
+
+def test_search_highlight_escapes_html():
+    tag = f"xss{int(time.time())}"
+    aid = requests.post(
+        f"{BASE}/assignments",
+        json={"student_id": 1, "title": f"<b onmouseover=x>{tag}</b> & co"},
+    ).json()["id"]
+    items = requests.get(f"{BASE}/search", params={"q": tag}).json()["items"]
+    hl = {(x["type"], x["id"]): x["highlight"] for x in items}[("assignment", aid)]
+    assert "<b" not in hl
+    assert f"&lt;b onmouseover=x&gt;<mark>{tag}</mark>&lt;/b&gt; &amp; co" in hl
+
+
+def test_conditional_get_lists():
+    r = requests.get(f"{BASE}/assignments", params={"student_id": 1})
+    etag = r.headers["ETag"]
+    r = requests.get(
+        f"{BASE}/assignments", params={"student_id": 1}, headers={"If-None-Match": etag}
+    )
+    assert r.status_code == 304
+    assert r.headers["ETag"] == etag and not r.content
+
+    # запись в коллекцию меняет версию — старый ETag больше не совпадает
+    requests.post(f"{BASE}/assignments", json={"student_id": 1, "title": "ETag"})
+    r = requests.get(
+        f"{BASE}/assignments", params={"student_id": 1}, headers={"If-None-Match": etag}
+    )
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+
+
+def test_invoice_amount_keeps_decimal_string():
+    r = requests.post(
+        f"{BASE}/finance/invoices", json={"student_id": 1, "amount": "100.10"}
+    )
+    assert r.status_code == 200
+    assert r.json()["amount"] == "100.10"